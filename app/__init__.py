@@ -20,19 +20,28 @@
 # Optional MYSQL and 'flask_mysql' module for click counter
 #####
 
+import hashlib
 import inspect
 import io
 import os
 import json
 import pathlib
 import traceback
+import zipfile
 from datetime import datetime
 
 import flask
+from base_patcher import BasePatcher
+from cache import PlanCache, ResultCache, SingleFlight
+from engines import AssembleCacheInfo
+from journal import PatchBuffer, PatchJournal
 from mi_patcher import MiPatcher
 from nb_patcher import NbPatcher
+from scanner import OffsetIndex
+from stock import STOCK_TABLE
+from tea import Tea
 from util import SignatureException
-from zippy import Zippy
+from zippy import DEFLATE_LEVEL, ZIP_MEMBERS, ZIP_POLICY, Zippy, ZipStream
 
 pwd = pathlib.Path(__file__).parent.parent.resolve()
 
@@ -49,6 +58,33 @@ try:
 except Exception as ex:
     print(ex.msg)
 
+# outputs depend on every source on the patch path (these routes included) and the stock offset table,
+# cached results are invalidated when any of them changes
+PATCHER_VERSION = hashlib.sha256(b''.join(
+    path.read_bytes()
+    for path in [*sorted(pwd.glob('*.py')), *sorted((pwd / 'app').glob('*.py')), pathlib.Path(STOCK_TABLE)]
+)).hexdigest()
+
+# optional persistent signature offsets of already seen firmware images
+if (index_dir := os.environ.get('NGFW_OFFSET_INDEX')):
+    BasePatcher.index = OffsetIndex(index_dir, max_size=int(os.environ.get('NGFW_OFFSET_INDEX_SIZE', 16 << 20)))
+
+# optional cache of finished output files, keyed by input, parameters, output format and key
+result_cache = None
+if (result_dir := os.environ.get('NGFW_RESULT_CACHE')):
+    result_cache = ResultCache(result_dir, max_size=int(os.environ.get('NGFW_RESULT_CACHE_SIZE', 256 << 20)),
+                               version=PATCHER_VERSION)
+
+# concurrent identical requests are built once, the others wait for the result cache;
+# with a lock directory also across worker processes
+single_flight = SingleFlight(os.environ.get('NGFW_SINGLE_FLIGHT_LOCKS',
+                                            result_dir.rstrip('/') + '.locks' if result_dir else None))
+
+# patch plans of recently patched images, re-submits with other values skip all signature searches
+plan_cache = None
+if (plan_cache_size := int(os.environ.get('NGFW_PLAN_CACHE', 16))) > 0:
+    plan_cache = PlanCache(plan_cache_size)
+
 git_info = {
     'sha': '',
     'date': '',
@@ -147,6 +183,21 @@ def home():
     return flask.render_template('home.html', counts=counts, gitinfo=git_info)
 
 
+@app.route('/stats')
+def stats():
+    return flask.jsonify({
+        'offset_index': BasePatcher.index.stats() if BasePatcher.index is not None else None,
+        'asm_cache': AssembleCacheInfo(),
+        'result_cache': result_cache.stats() if result_cache is not None else None,
+        'single_flight': single_flight.stats(),
+        'plan_cache': plan_cache.stats() if plan_cache is not None else None,
+        'tea': {
+            'backend': Tea.name,
+            'key_cache': Tea.keys.stats() if hasattr(Tea, 'keys') else None,
+        },
+    })
+
+
 @app.route('/privacy')
 def privacy():
     return flask.render_template('privacy.html')
@@ -157,59 +208,85 @@ def disclaimer():
     return flask.render_template('disclaimer.html')
 
 
-def patch(data):
-    res = []
-
-    is_nb = False
-    device = flask.request.form.get('device')
+def make_patcher(data, device):
     if device in ["1s", "pro2", "lite", "mi3", "4pro"]:
-        patcher = MiPatcher(data, device)
+        return MiPatcher(data, device)
     elif device in [
         "f2pro", "f2plus", "f2", "g2", "4plus", "4max",
         "zt3pro_vcu", "g3_vcu", "g3_mcu", "f3pro_vcu", "gt3_vcu"
     ]:
-        patcher = NbPatcher(data, device)
-        is_nb = True
+        return NbPatcher(data, device)
+    raise ValueError(f'Unknown device: {device}')
+
+
+def failed_patch():
+    '''
+    Name of the patch method the exception being handled came from: the outermost
+    patcher frame which isn't part of the patcher's own infrastructure (find_pattern, apply, ...).
+    '''
+    trace = inspect.trace()
+    infrastructure = {name for name, attr in vars(BasePatcher).items() if not hasattr(attr, 'label')}
+    for frame in trace:
+        if (isinstance(frame.frame.f_locals.get('self'), BasePatcher) and
+                frame.function not in infrastructure and not frame.function.startswith('_')):
+            return frame.function
+    return trace[-2].function
+
+
+def patch(data, form=None, patcher=None):
+    '''
+    Apply the patches selected in form (default: the request form),
+    optionally on an existing patcher instead of a new one for data.
+    '''
+    if form is None:
+        form = flask.request.form
+
+    res = []
+
+    device = form.get('device')
+    if patcher is None:
+        patcher = make_patcher(data, device)
+    is_nb = isinstance(patcher, NbPatcher)
 
     if (
-        (version := flask.request.form.get('version_spoof', None)) is not None and
+        (version := form.get('version_spoof', None)) is not None and
         (version := version.strip())
     ):
         res.append(('Version Spoof', patcher.version_spoof(version)))
 
-    if (speed_table_data := flask.request.form.get('speed_table_data')) is not None:
+    if (speed_table_data := form.get('speed_table_data')) is not None:
         res.append(('Speed Table', patcher.embed_speed_table(json.loads(speed_table_data))))
 
     if (
-        (embed_rand_code := flask.request.form.get('embed_rand_code')) is not None and
+        (embed_rand_code := form.get('embed_rand_code')) is not None and
         (embed_rand_code := embed_rand_code.strip())
     ):
         res.append(('Embed Rand Code', patcher.embed_rand_code(embed_rand_code)))
 
     if (
-        (embed_enc_key := flask.request.form.get('embed_enc_key')) is not None and
+        (embed_enc_key := form.get('embed_enc_key')) is not None and
         (embed_enc_key := embed_enc_key.strip())
     ):
         res.append(('Embed Enc Key', patcher.embed_enc_key(embed_enc_key)))
 
-    if (flask.request.form.get('disable_custom_enc_key')) is not None:
+    if (form.get('disable_custom_enc_key')) is not None:
         res.append(("Disable Custom Enc Key", patcher.disable_custom_enc_key()))
 
-    us_region_spoof = flask.request.form.get('us_region_spoof', None)
+    us_region_spoof = form.get('us_region_spoof', None)
     if us_region_spoof is not None:
         res.append(("US Region Spoof", patcher.us_region_spoof()))
 
-    allow_sn_change = flask.request.form.get('allow_sn_change', None)
+    allow_sn_change = form.get('allow_sn_change', None)
     if allow_sn_change is not None:
         res.append(("Allow SN Change", patcher.allow_sn_change()))
 
-    dpc = flask.request.form.get('dpc', None)
+    dpc = form.get('dpc', None)
     if dpc is not None:
         res.append(("DPC", patcher.dpc()))
 
-    sl_sport = flask.request.form.get('sl_sport', None)
-    sl_drive = flask.request.form.get('sl_drive', None)
-    sl_ped = flask.request.form.get('sl_ped', None)
+    sl_sport = form.get('sl_sport', None)
+    sl_drive = form.get('sl_drive', None)
+    sl_ped = form.get('sl_ped', None)
     if is_nb:
         if sl_sport is not None and sl_drive is not None and sl_ped is not None:
             sl_sport = int(sl_sport)
@@ -238,27 +315,27 @@ def patch(data):
             assert sl_ped >= 0 and sl_ped <= 65, sl_ped
             res.append((f"Speed-Limit Pedestrian: {sl_ped}km/h", patcher.speed_limit_ped(sl_ped)))
 
-    amps_sport = flask.request.form.get('amps_sport', None)
+    amps_sport = form.get('amps_sport', None)
     if amps_sport is not None:
         amps_sport = int(amps_sport)
         assert amps_sport >= 5000 and amps_sport <= 45000, amps_sport
         res.append((f"Current Sport: {amps_sport}mA", patcher.ampere_sport(amps_sport)))
 
-    amps_drive = flask.request.form.get('amps_drive', None)
+    amps_drive = form.get('amps_drive', None)
     if amps_drive is not None:
         amps_drive = int(amps_drive)
         assert amps_drive >= 5000 and amps_drive <= 45000, amps_drive
         res.append((f"Current Drive: {amps_drive}mA", patcher.ampere_drive(amps_drive)))
 
-    amps_ped = flask.request.form.get('amps_ped', None)
+    amps_ped = form.get('amps_ped', None)
     if amps_ped is not None:
         amps_ped = int(amps_ped)
         assert amps_ped >= 5000 and amps_ped <= 45000, amps_ped
         res.append((f"Current Pedestrian/Eco: {amps_ped}mA", patcher.ampere_ped(amps_ped)))
 
-    amps_sport_max = flask.request.form.get('amps_sport_max', None)
-    amps_drive_max = flask.request.form.get('amps_drive_max', None)
-    amps_ped_max = flask.request.form.get('amps_ped_max', None)
+    amps_sport_max = form.get('amps_sport_max', None)
+    amps_drive_max = form.get('amps_drive_max', None)
+    amps_ped_max = form.get('amps_ped_max', None)
     if amps_ped_max is not None:
         amps_ped_max = int(amps_ped_max)
         assert amps_ped_max >= 5000 and amps_ped_max <= 90000, amps_ped_max
@@ -287,38 +364,38 @@ def patch(data):
             assert amps_sport_max >= 5000 and amps_sport_max <= 90000, amps_sport_max
             res.append((f"Max-Current Sport (Acc=2): {amps_sport_max}mA", patcher.ampere_max_sport(amps_sport_max)))
 
-    amps_brake_max = flask.request.form.get('amps_brake_max', None)
+    amps_brake_max = form.get('amps_brake_max', None)
     if amps_brake_max is not None:
         amps_brake_max = int(amps_brake_max)
         assert amps_brake_max >= 5000 and amps_brake_max <= 65000, amps_brake_max
         res.append((f"Max-Current Brake: {amps_brake_max}mA",
                     patcher.ampere_brake(max_=amps_brake_max)))
 
-    amps_brake_min = flask.request.form.get('amps_brake_min', None)
+    amps_brake_min = form.get('amps_brake_min', None)
     if amps_brake_min is not None:
         amps_brake_min = int(amps_brake_min)
         assert amps_brake_min >= 0 and amps_brake_min <= 65000, amps_brake_min
         res.append((f"Min-Current Brake: {amps_brake_min}mA",
                     patcher.ampere_brake(min_=amps_brake_min)))
 
-    crc = flask.request.form.get('crc', None)
+    crc = form.get('crc', None)
     if crc is not None:
         crc = int(crc)
         assert crc >= 100 and crc <= 2000
         res.append((f"CRC: {crc}", patcher.current_raising_coeff(crc)))
 
-    motor_start_speed = flask.request.form.get('motor_start_speed', None)
+    motor_start_speed = form.get('motor_start_speed', None)
     if motor_start_speed is not None:
         motor_start_speed = float(motor_start_speed)
         assert motor_start_speed >= 0 and motor_start_speed <= 100
         res.append((f"Motor Start Speed: {motor_start_speed}km/h",
                     patcher.motor_start_speed(motor_start_speed)))
 
-    kml = flask.request.form.get('kml', None)
+    kml = form.get('kml', None)
     if kml:
-        l0 = flask.request.form.get('kml_l0', None)
-        l1 = flask.request.form.get('kml_l1', None)
-        l2 = flask.request.form.get('kml_l2', None)
+        l0 = form.get('kml_l0', None)
+        l1 = form.get('kml_l1', None)
+        l2 = form.get('kml_l2', None)
         if l0 and l1 and l2:
             l0, l1, l2 = int(l0), int(l1), int(l2)
             assert l0 >= 0 and l0 <= 30
@@ -327,22 +404,22 @@ def patch(data):
             res.append((f"KERS Multiplier ({l0}, {l1}, {l2})",
                         patcher.kers_multi(l0, l1, l2)))
     else:
-        remove_kers = flask.request.form.get('remove_kers', None)
+        remove_kers = form.get('remove_kers', None)
         if remove_kers is not None:
             if device == "4pro" or (is_nb and device != "g2"):
                 res.append(("Remove KERS", patcher.kers_multi(0, 0, 0)))
             else:
                 res.append(("Remove KERS", patcher.remove_kers()))
 
-    remove_autobrake = flask.request.form.get('remove_autobrake', None)
+    remove_autobrake = form.get('remove_autobrake', None)
     if remove_autobrake is not None:
         res.append(("Remove Speed Check", patcher.remove_autobrake()))
 
-    remove_charging_mode = flask.request.form.get('remove_charging_mode', None)
+    remove_charging_mode = form.get('remove_charging_mode', None)
     if remove_charging_mode is not None:
         res.append(("Remove Charging Mode", patcher.remove_charging_mode()))
 
-    wheelsize = flask.request.form.get('wheelsize', None)
+    wheelsize = form.get('wheelsize', None)
     if wheelsize is not None:
         wheelsize = float(wheelsize)
         assert wheelsize >= 0 and wheelsize <= 100
@@ -352,40 +429,40 @@ def patch(data):
         mult = wheelsize/old_wheel
         res.append((f"Wheel Size: {wheelsize}\"", patcher.wheel_speed_const(mult)))
 
-    shutdown_time = flask.request.form.get('shutdown_time', None)
+    shutdown_time = form.get('shutdown_time', None)
     if shutdown_time is not None:
         shutdown_time = float(shutdown_time)
         assert shutdown_time >= 0 and shutdown_time <= 20
         res.append((f"Shutdown Time: {shutdown_time}s",
                     patcher.shutdown_time(shutdown_time)))
 
-    cc_delay = flask.request.form.get('cc_delay', None)
+    cc_delay = form.get('cc_delay', None)
     if cc_delay is not None:
         cc_delay = float(cc_delay)
         assert cc_delay >= 0 and cc_delay <= 9
         res.append((f"CC Delay: {cc_delay}s",
                     patcher.cc_delay(cc_delay)))
 
-    amm = flask.request.form.get('ammeter', None)
+    amm = form.get('ammeter', None)
     if amm is not None:
         res.append(("Current-Meter", patcher.ampere_meter()))
 
-    rfm = flask.request.form.get('rfm', None)
+    rfm = form.get('rfm', None)
     if rfm is not None:
         res.append(("Region-Free", patcher.region_free()))
 
-    rml = flask.request.form.get('rml', None)
+    rml = form.get('rml', None)
     if rml is not None:
         if is_nb:
             res.append(("Remove Model Lock", patcher.skip_key_check()))
         else:
             res.append(("Remove Model Lock", patcher.remove_modellock()))
 
-    dmn = flask.request.form.get('dmn', None)
+    dmn = form.get('dmn', None)
     if dmn is not None:
         res.append(("Disable motor NTC", patcher.disable_motor_ntc()))
 
-    blm = flask.request.form.get('blm', None)
+    blm = form.get('blm', None)
     if blm is not None:
         # TEMPORARY WORKAROUND FOR 4PRO
         if device == "4pro":
@@ -393,23 +470,23 @@ def patch(data):
         else:
             res.append(("Static Brakelight", patcher.brake_light()))
 
-    alm = flask.request.form.get('blm_alm', None)
+    alm = form.get('blm_alm', None)
     if alm is not None:
         res.append(("Auto-Light", patcher.lower_light()))
 
-    pnb = flask.request.form.get('pnb', None)
+    pnb = form.get('pnb', None)
     if pnb is not None:
         res.append(("Pedestrian No-Blink", patcher.ped_noblink()))
 
-    bts = flask.request.form.get('bts', None)
+    bts = form.get('bts', None)
     if bts is not None:
         res.append(("Button Swap", patcher.button_swap()))
 
-    baud = flask.request.form.get('baud', None)
+    baud = form.get('baud', None)
     if baud is not None:
         res.append(("Baudrate", patcher.bms_baudrate(76800)))
 
-    volt = flask.request.form.get('volt', None)
+    volt = form.get('volt', None)
     if volt is not None:
         volt = float(volt)
         assert volt >= 0 and volt <= 100
@@ -418,68 +495,431 @@ def patch(data):
     return res, patcher.data
 
 
-@app.route('/cfw', methods=['POST'])
-def patch_firmware():
+# form fields which don't change the patches applied
+OUTPUT_FIELDS = ('patch', 'custom_enc_key', 'zip_members')
+
+
+def patch_planned(data, form=None):
+    '''
+    patch() via the plan cache: the first request for an image and set of
+    patches (form fields) plans them, later ones only apply their values.
+    '''
+    if form is None:
+        form = flask.request.form
+    if plan_cache is None:
+        return patch(data, form)
+
+    device = form.get('device')
+    key = PlanCache.key(data, device, [k for k in form if k not in OUTPUT_FIELDS])
+    base = plan_cache.get(key)
+    if base is None:
+        # the cached base keeps the image once: a journal over it is never written, nor snapshotted
+        base = make_patcher(PatchJournal(bytes(data)), device)
+        base.plan(lambda patcher: patch(None, form, patcher)[0])
+        plan_cache.put(key, base)
+
+    # the upload holds the planned image, it is patched in place
+    patcher, res = base.apply(lambda patcher: patch(None, form, patcher)[0], data)
+    return res, patcher.data
+
+
+def patch_skipping(data, form=None):
+    '''
+    patch() in a PatchSession which skips the patches that fail: they are rolled back
+    and listed as ('Skipped ...', None), all others are applied to data in place.
+    '''
+    if form is None:
+        form = flask.request.form
+
+    patcher = make_patcher(data, form.get('device'))
+    session = patcher.session(skip_failures=True)
+    res, _ = patch(None, form, session.patcher)
+    session.commit()
+
+    res = [x for x in res if x[1] is not None]
+    return res + skipped_patches(session), patcher.data
+
+
+def skipped_patches(session):
+    '''
+    ('Skipped name(): Exception message', None) entries for the patches a session skipped.
+    '''
+    return [(f'Skipped {name}(): {type(e).__name__} {e}', None) for name, e in session.failures]
+
+
+def read_upload():
+    '''
+    Lowercase filename and content (one owned buffer) of the uploaded file, or (None, error response).
+    '''
     f = flask.request.files['filename']
 
     fname = f.filename.lower()
     if not fname.endswith((".bin", ".zip", ".bin.enc")):
-        return "Wrong file selected.", 400
-
-    data = f.read()
+        return None, ("Wrong file selected.", 400)
+
+    # read the upload once into the buffer which is then decrypted, extracted and patched in place
+    f.stream.seek(0, io.SEEK_END)
+    data = PatchBuffer(f.stream.tell())
+    f.stream.seek(0)
+    view, pos = memoryview(data), 0
+    while pos < len(data) and (n := f.stream.readinto(view[pos:])):
+        pos += n
+    view.release()
     if not len(data) > 0xf:
-        return 'No file selected.', 400
+        return None, ('No file selected.', 400)
+    return fname, data
 
-    dev = flask.request.form.get('device', None)
-    pod = flask.request.form.get('patch', None)
 
-    custom_enc_key = flask.request.form.get('custom_enc_key', None)
+def open_firmware(fname, data, dev):
+    '''
+    Zippy with the decrypted and extracted firmware of an upload.
+    '''
+    zippy = Zippy(data, model=dev)
+    if fname.endswith(".bin.enc"):
+        zippy.decrypt()
+    zippy.try_extract()
+    return zippy
+
+
+def read_enc_key(form):
+    custom_enc_key = form.get('custom_enc_key', None)
     custom_enc_key = custom_enc_key.strip() if custom_enc_key is not None else None
     if custom_enc_key:
         custom_enc_key = bytes.fromhex(custom_enc_key)
         assert len(custom_enc_key) == 16
+    return custom_enc_key
+
+
+OUTPUT_EXT = {'Zip': ".zip", 'Bin': ".bin", '.bin.enc': ".bin.enc"}
+
+
+def read_zip_members(form):
+    '''
+    Firmware files the zip should contain, 'zip_members' is a comma separated subset of ZIP_MEMBERS.
+    '''
+    members = form.get('zip_members', None)
+    if not members or not members.strip():
+        return ZIP_MEMBERS
+    members = tuple(x.strip() for x in members.split(','))
+    assert members and all(x in ZIP_MEMBERS for x in members), members
+    return members
+
+
+def build_output(zippy, pod, key=None, stream=False, members=ZIP_MEMBERS):
+    '''
+    Output file content and extension of a patched image for pod 'Zip', 'Bin' or '.bin.enc'.
+    With stream, a zip is returned as ZipStream instead of bytes.
+    '''
+    if pod == 'Zip':
+        if stream:
+            return zippy.zip_stream('nice'.encode(), key=key, members=members), OUTPUT_EXT[pod]
+        return zippy.zip_it('nice'.encode(), key=key, members=members), OUTPUT_EXT[pod]
+    elif pod == 'Bin':
+        return zippy.data, OUTPUT_EXT[pod]
+    elif pod == ".bin.enc":
+        return zippy.encrypt(key), OUTPUT_EXT[pod]
+    raise ValueError(f'Invalid output: {pod}')
+
+
+def send_output(content, dev, pod, chunks=None):
+    '''
+    Response with the output file, a ZipStream is sent as its chunks (or the given iterator over them).
+    '''
+    save_click('Bin' if pod == ".bin.enc" else pod)
+    download_name = f"ngfw_{dev}_{get_datetime()}" + OUTPUT_EXT[pod]
+    if isinstance(content, ZipStream):
+        # written chunk by chunk straight into the response, the size is known up front
+        return flask.Response(
+            iter(content) if chunks is None else chunks,
+            mimetype='application/octet-stream',
+            headers={
+                'Content-Length': str(len(content)),
+                'Content-Disposition': f'attachment; filename={download_name}',
+            },
+        )
+    return flask.send_file(
+        io.BytesIO(content),
+        as_attachment=True,
+        mimetype='application/octet-stream',
+        download_name=download_name,
+    )
+
+
+class ReleasingChunks():
+    '''
+    Chunks of a response which call release() once the last one was sent, or when
+    the response is closed before, e.g. because the client went away.
+    '''
+    def __init__(self, chunks, release):
+        self.chunks = chunks
+        self.release = release
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            self.release()
+
+
+def result_key(fname, data, form, pod, key=None):
+    '''
+    Result cache key of a /cfw request: the upload, its type, the patch
+    parameters (form fields minus output format and key) and the output.
+    '''
+    params = {k: v for k, v in form.items() if k not in ('patch', 'custom_enc_key')}
+    params['input'] = next(ext for ext in (".bin.enc", ".zip", ".bin") if fname.endswith(ext))
+    return ResultCache.key(data, params, pod, key)
+
+
+def patch_batch(data, device, forms, pod='Zip', key=None, members=ZIP_MEMBERS):
+    '''
+    Build one variant of the (decrypted) firmware per form, a mapping with the
+    same fields as the /cfw form. The signatures are resolved only once on the
+    unmodified image, every variant is patched on a copy of it.
+    Returns [(patches, content, extension, error), ...] in order of forms.
+    '''
+    base = make_patcher(data, device)
+    base.prescan()
+
+    results = []
+    for form in forms:
+        form = {**form, 'device': device}
+        try:
+            res, data_patched = patch(None, form, base.fork())
+        except (SignatureException, AssertionError, ValueError) as e:
+            results.append(([], None, None, f'{type(e).__name__}: {e}'))
+            continue
+
+        zippy = Zippy(data_patched, model=device)
+        zippy.params = '\n'.join([x[0] for x in res]) + '\n'
+        content, ext = build_output(zippy, pod, key, members=members)
+        results.append((res, content, ext, None))
+    return results
 
-    zippy = Zippy(data, model=dev)
-    if fname.endswith(".bin.enc"):
-        zippy.data = zippy.decrypt()
-    zippy.try_extract()
+
+@app.route('/cfw', methods=['POST'])
+def patch_firmware():
+    dev = flask.request.form.get('device', None)
+    pod = flask.request.form.get('patch', None)
+
+    fname, data = read_upload()
+    if fname is None:
+        return data
+
+    custom_enc_key = read_enc_key(flask.request.form)
+    members = read_zip_members(flask.request.form)
+
+    # with skip_failures, patches which can't be applied are left out instead of failing the request
+    skip_failures = flask.request.form.get('skip_failures', None) is not None
+
+    def build_content():
+        zippy = open_firmware(fname, data, dev)
+        res, zippy.data = (patch_skipping if skip_failures else patch_planned)(zippy.data)
+        zippy.params = '\n'.join([x[0] for x in res]) + '\n'
+        return build_output(zippy, pod, custom_enc_key, stream=True, members=members)[0]
+
+    def build_output_cached(key):
+        # another request may have finished the same output while we waited for it
+        if (content := result_cache.get(key)) is not None:
+            return content, None
+        content = build_content()
+        if isinstance(content, ZipStream):
+            # stored while it is sent
+            return content, result_cache.put_iter(key, content)
+        result_cache.put(key, content)
+        return content, None
 
     try:
-        res, data_patched = patch(zippy.data)
-        params = '\n'.join([x[0] for x in res]) + '\n'
-        zippy.params = params
-        zippy.data = data_patched
+        if pod in OUTPUT_EXT:
+            if result_cache is None:
+                return send_output(build_content(), dev, pod)
+
+            # concurrent identical requests are built once: the key is held until the output is in the
+            # result cache, which the requests waiting for it (in this or another worker) then read
+            key = result_key(fname, data, flask.request.form, pod, custom_enc_key)
+            release = single_flight.acquire(key)
+            try:
+                content, chunks = build_output_cached(key)
+            except BaseException:
+                release()
+                raise
+            if chunks is None:
+                release()
+                return send_output(content, dev, pod)
+            return send_output(content, dev, pod, ReleasingChunks(chunks, release))
+        elif pod in ['Doc']:
+            # only the patch records are shown: an uncommitted session neither writes nor copies the image
+            zippy = open_firmware(fname, data, dev)
+            session = make_patcher(zippy.data, dev).session(skip_failures)
+            res, _ = patch(None, flask.request.form, session.patcher)
+            save_click(pod)
+            return flask.render_template('doc.html', patches=[x for x in res if x[1]] + skipped_patches(session))
+        else:
+            return 'Invalid request.', 400
     except SignatureException as e:
-        return f'Some of the patches (patcher.{inspect.trace()[-2][3]}()) could not be applied. Please select unmodified input file. Message: {str(e)}'
-
-    if pod in ['Bin', '.bin.enc', 'Zip']:
-        filename = f"ngfw_{dev}_{get_datetime()}"
-        mem = io.BytesIO()
-        if pod == 'Zip':
-            data_patched = zippy.zip_it('nice'.encode(), key=custom_enc_key)
-            filename += ".zip"
-        elif pod == 'Bin':
-            filename += ".bin"
-        elif pod == ".bin.enc":
-            pod = 'Bin'
-            data_patched = zippy.encrypt(custom_enc_key)
-            filename += ".bin.enc"
-
-        mem.write(data_patched)
-        mem.seek(0)
-
-        #r = flask.Response(mem, mimetype="application/octet-stream")
-        #r.headers['Content-Length'] = mem.getbuffer().nbytes
-        #r.headers['Content-Disposition'] = "attachment; filename={}".format(f.filename)
-        save_click(pod)
-        return flask.send_file(
-            mem,
-            as_attachment=True,
-            mimetype='application/octet-stream',
-            download_name=filename,
-        )
-    elif pod in ['Doc']:
-        save_click(pod)
-        return flask.render_template('doc.html', patches=res)
-    else:
+        return f'Some of the patches (patcher.{failed_patch()}()) could not be applied. Please select unmodified input file. Message: {str(e)}'
+
+
+# every option of the /cfw form with a sample value, /analyze runs each through patch()
+ANALYZE_OPTIONS = {
+    'version_spoof': '1.0.0',
+    'speed_table_data': json.dumps([[0] * 9] * 6),
+    'embed_rand_code': '000000',
+    'embed_enc_key': '00' * 16,
+    'disable_custom_enc_key': 'on',
+    'us_region_spoof': 'on',
+    'allow_sn_change': 'on',
+    'dpc': 'on',
+    'sl_sport': '25',
+    'sl_drive': '20',
+    'sl_ped': '6',
+    'amps_sport': '20000',
+    'amps_drive': '15000',
+    'amps_ped': '5000',
+    'amps_ped_max': '10000',
+    'amps_drive_max': '25000',
+    'amps_sport_max': '35000',
+    'amps_brake_max': '50000',
+    'amps_brake_min': '5000',
+    'crc': '600',
+    'motor_start_speed': '5.0',
+    'kml': 'on',
+    'remove_kers': 'on',
+    'remove_autobrake': 'on',
+    'remove_charging_mode': 'on',
+    'wheelsize': '8.5',
+    'shutdown_time': '3.0',
+    'cc_delay': '5.0',
+    'ammeter': 'on',
+    'rfm': 'on',
+    'rml': 'on',
+    'dmn': 'on',
+    'blm': 'on',
+    'blm_alm': 'on',
+    'pnb': 'on',
+    'bts': 'on',
+    'baud': 'on',
+    'volt': '43.01',
+}
+ANALYZE_PARAMS = {'kml_l0': '1', 'kml_l1': '2', 'kml_l2': '3'}
+# fields patch() only reads together with an option
+ANALYZE_TOGETHER = {'kml': ('kml_l0', 'kml_l1', 'kml_l2')}
+ANALYZE_TOGETHER_MI = {
+    'amps_drive_max': ('amps_ped_max', 'amps_sport_max'),
+    'amps_sport_max': ('amps_ped_max', 'amps_drive_max'),
+}
+ANALYZE_TOGETHER_NB = {
+    'sl_sport': ('sl_drive', 'sl_ped'),
+    'sl_drive': ('sl_sport', 'sl_ped'),
+    'sl_ped': ('sl_sport', 'sl_drive'),
+}
+
+
+def analyze_probes(patcher):
+    '''
+    /cfw form option -> probe for BasePatcher.applicable_patches(): patch() with the
+    option's sample value and the fields it is only read together with.
+    '''
+    together = {**ANALYZE_TOGETHER, **(ANALYZE_TOGETHER_NB if isinstance(patcher, NbPatcher) else ANALYZE_TOGETHER_MI)}
+    samples = {**ANALYZE_OPTIONS, **ANALYZE_PARAMS}
+
+    def probe(fields):
+        form = {'device': patcher.model, **{field: samples[field] for field in fields}}
+        return lambda p: [site for _, sites in patch(None, form, p)[0] for site in sites or []]
+
+    return {option: probe((option, *together.get(option, ()))) for option in ANALYZE_OPTIONS}
+
+
+@app.route('/analyze', methods=['POST'])
+def analyze_firmware():
+    '''
+    Which options of the /cfw form apply to the uploaded firmware (and which
+    signature variant matched), as JSON, without building anything.
+    '''
+    dev = flask.request.form.get('device', None)
+
+    fname, data = read_upload()
+    if fname is None:
+        return data
+    zippy = open_firmware(fname, data, dev)
+
+    try:
+        patcher = make_patcher(zippy.data, dev)
+    except ValueError as e:
+        return str(e), 400
+
+    return flask.jsonify({
+        'device': dev,
+        'family': patcher.family(),
+        'patches': patcher.applicable_patches(analyze_probes(patcher)),
+    })
+
+
+# compression of the batch archive's outputs, as in ZIP_POLICY; zips are already compressed
+BATCH_POLICY = {
+    '.zip': (zipfile.ZIP_STORED, None),
+    '.bin': ZIP_POLICY['FIRM.bin'],
+    '.bin.enc': ZIP_POLICY['FIRM.bin.enc'],
+}
+
+
+@app.route('/cfw_batch', methods=['POST'])
+def patch_firmware_batch():
+    '''
+    Variants of one firmware: 'params' is a JSON list of /cfw form fields,
+    the response is a zip with one output file per variant.
+    '''
+    dev = flask.request.form.get('device', None)
+    pod = flask.request.form.get('patch', 'Zip')
+    if pod not in OUTPUT_EXT:
         return 'Invalid request.', 400
+
+    try:
+        forms = json.loads(flask.request.form.get('params', ''))
+        assert isinstance(forms, list) and all(isinstance(x, dict) for x in forms)
+    except (ValueError, AssertionError):
+        return "'params' must be a JSON list of objects.", 400
+
+    fname, data = read_upload()
+    if fname is None:
+        return data
+    zippy = open_firmware(fname, data, dev)
+
+    custom_enc_key = read_enc_key(flask.request.form)
+
+    try:
+        results = patch_batch(zippy.data, dev, forms, pod, custom_enc_key, read_zip_members(flask.request.form))
+    except ValueError as e:
+        return str(e), 400
+
+    stamp = get_datetime()
+    errors = []
+    mem = io.BytesIO()
+    with zipfile.ZipFile(mem, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i, (res, content, ext, error) in enumerate(results):
+            name = f"ngfw_{dev}_{stamp}_{i:03d}"
+            if error is not None:
+                errors.append(f'{name}: {error}')
+                continue
+            compress, level = BATCH_POLICY[ext]
+            zf.writestr(name + ext, content, compress_type=compress,
+                        compresslevel=DEFLATE_LEVEL if level is None else level)
+            zf.writestr(name + '.txt', '\n'.join([x[0] for x in res]) + '\n')
+        if errors:
+            zf.writestr('errors.txt', '\n'.join(errors) + '\n')
+    mem.seek(0)
+
+    save_click('Zip' if pod == 'Zip' else 'Bin')
+    return flask.send_file(
+        mem,
+        as_attachment=True,
+        mimetype='application/zip',
+        download_name=f"ngfw_{dev}_{stamp}_batch.zip",
+    )
@@ -17,11 +17,16 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+import hashlib
+from bisect import bisect_left
 from enum import Enum
 
-import capstone
 import keystone
-from util import FindPattern, FindPatternGracef, SignatureException
+from engines import Assemble, Capstone, Keystone
+from journal import PatchBuffer, PatchJournal
+from scanner import MultiScanner
+from stock import StockTable
+from util import Signature, SignatureException
 
 
 class PatchGroup(Enum):
@@ -39,43 +44,532 @@ def patch(label, description, group, min=None, max=None):
         return func
     return decorator
 
+# parameter values of a generic model
+DUMMY_DEFAULTS = {
+    "speed_limit_ped": 20,
+    "speed_limit_drive": 25,
+    "speed_limit_sport": 30,
+    "ampere_ped": 5000,
+    "ampere_drive": 15000,
+    "ampere_sport": 20000,
+    "ampere_ped_max": 10000,
+    "ampere_drive_max": 25000,
+    "ampere_sport_max": 35000,
+    "ampere_brake_min": 5000,
+    "ampere_brake_max": 50000,
+    "volt_limit": 43.01,
+    "current_raising_coeff": 600,
+    "motor_start_speed": 5.0,
+    "wheel_speed_const": 1.0,
+    "shutdown_time": 3.0,
+    "cc_delay": 5.0,
+    "wheel_size": 8.5
+}
+
+# arguments to dry-run @patch methods with, from the model defaults;
+# methods not listed take the default of their name, if any
+DRY_RUN_ARGS = {
+    'version_spoof': lambda d: ('1.0.0',),
+    'embed_rand_code': lambda d: ('000000',),
+    'embed_speed_table': lambda d: ([[0] * 9] * 6,),
+    'embed_enc_key': lambda d: ('00' * 16,),
+    'bms_baudrate': lambda d: (76800,),
+    'ampere_max': lambda d: (d['ampere_ped_max'], d['ampere_drive_max'], d['ampere_sport_max']),
+    'ampere_brake': lambda d: (d['ampere_brake_min'], d['ampere_brake_max']),
+}
+
+
+def _call(patcher, name, args):
+    method = getattr(patcher, name)
+    return method(**args) if isinstance(args, dict) else method(*args)
+
+
+def _patches(patches):
+    # {method name: args} as a callable patching a given patcher
+    if callable(patches):
+        return patches
+    return lambda patcher: [(name, _call(patcher, name, args)) for name, args in patches.items()]
+
+
+class PatchPlan():
+    '''
+    Outcome of every signature lookup made while planning patches on one image
+    (signature, start, maxit) -> offset or None if not found. The patch methods
+    themselves re-encode their sites for new values, from the replayed offsets.
+    '''
+    def __init__(self, image):
+        self.image = image
+        self.lookups = {}
+        self.recording = True
+
+
+class PatchSession():
+    '''
+    Transaction over a patcher's image: patches go to a PatchJournal on top of
+    the image, which is neither written nor copied until commit(). Each patch
+    called on session.patcher runs in its own savepoint; one that fails is rolled
+    back and re-raised, or with skip_failures only recorded in failures.
+    Rollbacks and commits cost O(changed bytes).
+    '''
+    def __init__(self, patcher, skip_failures=False):
+        self.base = patcher
+        self.skip_failures = skip_failures
+        self.journal = PatchJournal(patcher.data)
+        self.committed = 0
+        self.failures = []
+        self.depth = 0
+
+        if patcher.matches is None:
+            # searches (or prescans) the image itself when needed, without a snapshot
+            self.patcher = patcher.__class__(self.journal, patcher.model)
+            self.patcher._family = patcher._family
+        else:
+            self.patcher = patcher._clone(lambda: self.journal)
+
+        # every patch method, but not the patcher's own infrastructure
+        infrastructure = {name for name, attr in vars(BasePatcher).items() if not hasattr(attr, 'label')}
+        for name in dir(type(patcher)):
+            if name.startswith('_') or name in infrastructure or not callable(getattr(type(patcher), name)):
+                continue
+            setattr(self.patcher, name, self._guard(name, getattr(self.patcher, name)))
+
+    def _guard(self, name, method):
+        def guarded(*args, **kwargs):
+            # patches called by other patches belong to the caller's savepoint
+            if self.depth:
+                return method(*args, **kwargs)
+            savepoint = self.savepoint()
+            self.depth += 1
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                self.rollback(savepoint)
+                if not self.skip_failures:
+                    raise
+                self.failures.append((name, e))
+                return None
+            finally:
+                self.depth -= 1
+        return guarded
+
+    def savepoint(self):
+        return len(self.journal.records), dict(self.patcher.variants)
+
+    def rollback(self, savepoint):
+        '''
+        Undo all patches since the savepoint, the offsets found in the meantime are searched again.
+        '''
+        n, variants = savepoint
+        if n < self.committed:
+            raise ValueError('Patches were committed since the savepoint!')
+        removed = self.journal.truncate(n)
+        self.patcher.variants = variants
+        self.patcher._rescanned = min(self.patcher._rescanned, n)
+        self.patcher._rescan(sorted(removed))
+
+    def commit(self):
+        '''
+        Write the patches recorded since the last commit into the image, returns it.
+        '''
+        self.journal.apply(self.base.data, self.committed)
+        self.committed = len(self.journal.records)
+        return self.base.data
+
+
 class BasePatcher():
+    # all signatures used by the patch set, resolved together by prescan()
+    signatures = ()
+    # optional scanner.OffsetIndex, shared by all instances
+    index = None
+    # bundled offsets of known stock images, consulted before scanning
+    stock = StockTable.load()
+
     def __init__(self, data, model):
-        self.data = bytearray(data)
-        self.ks = keystone.Ks(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB)
-        self.cs = capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_THUMB)
+        # patched in place: a PatchBuffer (or a dry run's journal) is taken over as is, anything else copied
+        # into one, both record where they are written
+        self.data = data if isinstance(data, (PatchBuffer, PatchJournal)) else PatchBuffer(data)
+        self.scanner, self.scanned, self.matches = None, None, None
+        # written since scanned, the offsets are up to date with it
+        self._modified = False
+        # firmware family and the signature variant picked per patch
+        self._family = None
+        self.variants = {}
+        # lookups recorded by plan(), shared with forks of the same image
+        self._plan = None
+        # records of self.data already taken into account by rescan(), and those before this patcher's own
+        self._rescanned = self._origin = len(self.data.records)
+        # (signature, start, maxit) -> offset of this patcher's earlier lookups
+        self._lookups = {}
+        # size of self.data as last seen by rescan() without prescanned offsets
+        self._size = len(self.data)
+        # whether the stock table knows this image, see _served()
+        self._stock = None
 
         self.model = model
 
         self.defaults = {
-            "dummy": {
-                "speed_limit_ped": 20,
-                "speed_limit_drive": 25,
-                "speed_limit_sport": 30,
-                "ampere_ped": 5000,
-                "ampere_drive": 15000,
-                "ampere_sport": 20000,
-                "ampere_ped_max": 10000,
-                "ampere_drive_max": 25000,
-                "ampere_sport_max": 35000,
-                "ampere_brake_min": 5000,
-                "ampere_brake_max": 50000,
-                "volt_limit": 43.01,
-                "current_raising_coeff": 600,
-                "motor_start_speed": 5.0,
-                "wheel_speed_const": 1.0,
-                "shutdown_time": 3.0,
-                "cc_delay": 5.0,
-                "wheel_size": 8.5
-            }
+            "dummy": dict(DUMMY_DEFAULTS)
         }
     
+    @property
+    def ks(self):
+        return Keystone()
+
+    @property
+    def cs(self):
+        return Capstone()
+
     def get_defaults(self, device):
         return self.defaults.get(device, {})
 
-    def asm(self, x):
-        pre = bytes(self.ks.asm(x)[0])
-        return pre
+    def prescan(self, signatures=None):
+        '''
+        Resolve every signature of the patch set in a single pass over the image.
+        '''
+        if signatures is None:
+            signatures = self.signatures
+        self.scanner = MultiScanner.get(signatures)
+        self._modified = False
+        self._rescanned = len(self.data.records)
+        if isinstance(self.data, PatchJournal) and not self.data.records:
+            # a dry run never writes its image, no snapshot needed
+            self.scanned = self.data.image
+        else:
+            self.scanned = bytes(self.data)
+
+        found = None
+        if self.stock.images or self.index is not None:
+            digest = hashlib.sha256(self.scanned).hexdigest()
+            found = self.stock.lookup(self.scanned, digest, self.model, self.scanner)
+            if found is not None:
+                # the offsets of every known patch, served from the memo without rescans
+                self._lookups.update(self.stock.lookups(digest, self.model, self.scanner))
+        if found is None and self.index is not None:
+            found = self.index.lookup(digest, self.scanner)
+        if found is None:
+            found = self.scanner.scan(self.scanned)
+            if self.index is not None:
+                self.index.store(digest, self.scanner, found)
+
+        self.matches = dict(zip(self.scanner.signatures, found))
+
+    def _served(self):
+        '''
+        Whether prescan() is worth it for single lookups: a pure Python scan costs about as
+        much as searching every signature on its own, only the stock table and the offset index save work.
+        '''
+        if self.index is not None:
+            return True
+        if self._stock is None:
+            # patches don't turn an image into a stock one, looked up once
+            self._stock = bool(self.stock.images) and \
+                self.stock.key(hashlib.sha256(self.data).hexdigest(), self.model) in self.stock.images
+        return self._stock
+
+    def rescan(self):
+        '''
+        Bring the prescanned offsets up to date with patches applied since the
+        last scan, only re-scanning the written regions (plus signature overlap).
+        '''
+        if self.matches is None:
+            if len(self.data) != self._size:
+                # without offsets to move, lookups past an insertion are searched again
+                self._size = len(self.data)
+                self._lookups.clear()
+        elif len(self.data) != len(self.scanned):
+            return self.prescan(self.scanner.signatures)
+
+        # the PatchBuffer (or a dry run's journal) knows what was written since
+        dirty = sorted(self.data.ranges(self._rescanned))
+        if not dirty:
+            return
+        self._rescanned += len(dirty)
+        self._modified = True
+        self._rescan(dirty)
+
+    def _rescan(self, dirty):
+        if self.matches is not None:
+            size = len(self.data)
+            overlap = max((len(s) for s in self.scanner.signatures), default=1)
+            for a, b in dirty:
+                lo, hi = max(0, a - overlap + 1), min(size, b + overlap)
+                found = self.scanner.scan(self.data[lo:hi])
+                for signature, positions in zip(self.scanner.signatures, found):
+                    old = self.matches[signature]
+                    i, j = bisect_left(old, lo), bisect_left(old, b)
+                    self.matches[signature] = old[:i] + [lo + p for p in positions if lo + p < b] + old[j:]
+
+        # an earlier lookup holds until a write makes an earlier match (or breaks it, see find_pattern)
+        for key, ofs in list(self._lookups.items()):
+            earlier = self._written_match(*key, ofs, dirty)
+            if earlier is not None:
+                self._lookups[key] = earlier
+
+    def _written_match(self, signature, start, maxit, ofs, written):
+        '''
+        First match of signature within its bounds and before ofs (if not None) which
+        overlaps one of the written (start, stop) ranges, None if there is none.
+        '''
+        lo, stop = signature.bounds(len(self.data), start, maxit)
+        if ofs is not None:
+            stop = min(stop, ofs)
+        n, found = len(signature), None
+        for a, b in written:
+            i, j = max(lo, a - n + 1), min(stop if found is None else found, b)
+            if i < j:
+                found = next(signature.finditer(self.data, i, j - i), found)
+        return found
+
+    def _clone(self, data):
+        if self.matches is None:
+            self.prescan()
+        else:
+            self.rescan()
+
+        # offset lists are replaced on rescan, never mutated, so they can be shared
+        clone = self.__class__(data(), self.model)
+        clone.scanner, clone.scanned, clone.matches = self.scanner, self.scanned, dict(self.matches)
+        clone._modified = self._modified
+        clone._rescanned = clone._origin = len(clone.data.records)
+        clone._family = self._family
+        clone._lookups = dict(self._lookups)
+        # a plan only holds for the image it was made on, not once it was patched
+        if self._plan is not None and self._plan.image is self.scanned and not self._modified:
+            clone._plan = self._plan
+        return clone
+
+    def fork(self):
+        '''
+        Patcher on a copy of the image which shares the resolved offsets,
+        so variants of one firmware are scanned only once.
+        '''
+        return self._clone(lambda: PatchBuffer(self.data))
+
+    def dry_run(self):
+        '''
+        Patcher on the same image which only records its patches in a PatchJournal
+        (its data) instead of writing them, the image is neither modified nor copied.
+        The journal can be applied to any buffer later: patcher.data.apply(buffer).
+        '''
+        return self._clone(lambda: PatchJournal(bytes(self.data) if self._modified else self.scanned))
+
+    def session(self, skip_failures=False):
+        '''
+        PatchSession on this patcher's image, patch via session.patcher and commit() the result.
+        '''
+        return PatchSession(self, skip_failures)
+
+    def plan(self, patches):
+        '''
+        Phase one of a parametric re-patch: apply patches once in a dry run,
+        recording the outcome of every signature lookup.
+        patches is {method name: args} (a tuple or kwargs dict), or a callable
+        patching a given patcher and returning [(name, result), ...].
+        The plan is kept for apply() and fork(), this patcher's image is left as is.
+        '''
+        if self.matches is None:
+            self.prescan()
+        else:
+            self.rescan()
+
+        plan = PatchPlan(self.scanned)
+        self._plan = None
+        # only the lookups are kept, the patches go to a journal instead of a copy of the image
+        patcher = self.dry_run()
+        patcher._plan = plan
+        _patches(patches)(patcher)
+        plan.recording = False
+
+        self._plan = plan
+        return plan
+
+    def apply(self, values, data=None):
+        '''
+        Phase two: a fork of the planned image with the patches applied for new
+        values (same form as plan()), whose lookups are answered from the plan,
+        so no signature is searched again. Returns (patcher, [(name, result), ...]).
+        With data, a PatchBuffer holding a copy of the planned image, it is patched in place instead.
+        '''
+        if self._plan is None:
+            raise ValueError('No patch plan, call plan() first!')
+        patcher = self.fork() if data is None else self._clone(lambda: data)
+        return patcher, list(_patches(values)(patcher))
+
+    @classmethod
+    def patch_methods(cls):
+        '''
+        Name -> decorated function (with the @patch metadata) of every declared
+        patch, in declaration order; subclasses may declare more.
+        '''
+        methods = {}
+        for klass in reversed(cls.__mro__):
+            for name, func in vars(klass).items():
+                if hasattr(func, 'label'):
+                    methods[name] = func
+        return methods
+
+    def applicable_patches(self, probes=None):
+        '''
+        Dry-run patches after a single signature pass, each into its own journal, the image stays as is.
+        probes maps a name to a callable patching a given patcher and returning its
+        [(description, offset, pre, post), ...]; by default every @patch method with sample
+        arguments (DRY_RUN_ARGS, model defaults), whose entries also carry its 'label', 'description', 'group'.
+        Returns {name: {'applicable', 'variants', 'sites', 'error', ...}}.
+        '''
+        if self.matches is None:
+            self.prescan()
+        else:
+            self.rescan()
+
+        meta = {}
+        if probes is None:
+            defaults = {**DUMMY_DEFAULTS, **self.get_defaults(self.model)}
+            probes = {}
+            for name, func in self.patch_methods().items():
+                if name in DRY_RUN_ARGS:
+                    args = DRY_RUN_ARGS[name](defaults)
+                else:
+                    args = (defaults[name],) if name in defaults else ()
+                probes[name] = lambda patcher, name=name, args=args: getattr(patcher, name)(*args)
+                meta[name] = {'label': func.label, 'description': func.description, 'group': func.group.value}
+
+        matrix = {}
+        for name, probe in probes.items():
+            patcher = self.dry_run()
+            try:
+                sites = [(desc, ofs) for desc, ofs, _, _ in probe(patcher) or []]
+                error = None if sites else 'Nothing to patch'
+            except NotImplementedError:
+                sites, error = [], 'Not supported for this firmware type'
+            except Exception as e:
+                sites, error = [], f'{type(e).__name__}: {e}'
+            matrix[name] = {
+                **meta.get(name, {}),
+                'applicable': error is None,
+                'variants': patcher.variants,
+                'sites': sites,
+                'error': error,
+            }
+        return matrix
+
+    def find_pattern(self, signature, mask=None, start=None, maxit=None):
+        '''
+        Same contract as util.FindPattern on self.data, but served from the plan,
+        this patcher's earlier lookups or the prescanned offsets of the patch set's signatures.
+        '''
+        if mask or not isinstance(signature, Signature):
+            signature = Signature(signature, mask)
+
+        plan, key = self._plan, (signature, start, maxit)
+        if plan is not None and not plan.recording and key in plan.lookups:
+            # planned offsets hold for the planned image: checked against the bytes, and only
+            # the bytes this patcher wrote may hold an earlier match. Anything else is searched as usual.
+            ofs = plan.lookups[key]
+            if ofs is None or signature.matches(self.data, ofs):
+                earlier = self._written_match(signature, start, maxit, ofs, self.data.ranges(self._origin))
+                if earlier is not None:
+                    ofs = earlier
+                if ofs is None:
+                    raise SignatureException('Pattern not found!')
+                return ofs
+
+        # earlier lookups are moved to earlier matches by rescan(), they hold until a write breaks them
+        if self._lookups:
+            self.rescan()
+        ofs = self._lookups.get(key)
+        if ofs is not None:
+            if signature.matches(self.data, ofs):
+                return ofs
+            del self._lookups[key]
+
+        try:
+            ofs = self._find_pattern(signature, start, maxit)
+        except SignatureException:
+            if plan is not None and plan.recording:
+                plan.lookups[key] = None
+            raise
+        if plan is not None and plan.recording:
+            plan.lookups[key] = ofs
+        self._lookups[key] = ofs
+        return ofs
+
+    def _find_pattern(self, signature, start, maxit):
+        if self.matches is None and self._served():
+            self.prescan()
+        else:
+            self.rescan()
+
+        positions = None if self.matches is None else self.matches.get(signature)
+        if positions is None:
+            return signature.find(self.data, start=start, maxit=maxit)
+
+        start, stop = signature.bounds(len(self.data), start, maxit)
+
+        i = bisect_left(positions, start)
+        if i < len(positions) and positions[i] < stop:
+            return positions[i]
+
+        raise SignatureException('Pattern not found!')
+
+    def find_pattern_gracef(self, *args, **kwargs):
+        try:
+            return self.find_pattern(*args, **kwargs)
+        except SignatureException:
+            return -1
+
+    def family(self):
+        '''
+        Firmware family (e.g. DRV generation) of the image, None if the patcher doesn't tell them apart.
+        '''
+        return None
+
+    def find_variant(self, label, variants):
+        '''
+        Resolve the first matching (family, signature, delta[, extra]) variant, in the
+        given order (the patch's original fallback order, which decides when several match).
+        Returns (offset + delta, extra) and records the variant's family in self.variants.
+        '''
+        for family, signature, delta, *extra in variants:
+            ofs = self.find_pattern_gracef(signature)
+            if ofs != -1:
+                self.variants[label] = family
+                return ofs + delta, extra[0] if extra else None
+        raise SignatureException('Pattern not found!')
+
+    def find_all(self, signature, mask=None, start=None, maxit=None):
+        '''
+        Lazily yield all non-overlapping matches. Patches applied to earlier
+        matches while iterating are taken into account.
+        '''
+        if mask or not isinstance(signature, Signature):
+            signature = Signature(signature, mask)
+        start, stop = signature.bounds(len(self.data), start, maxit)
+        while (ofs := self.find_pattern_gracef(signature, start=start, maxit=stop - start)) != -1:
+            yield ofs
+            start = ofs + len(signature)
+
+    def find_last(self, *args, **kwargs):
+        last = None
+        for last in self.find_all(*args, **kwargs):
+            pass
+        if last is None:
+            raise SignatureException('Pattern not found!')
+        return last
+
+    def count_pattern(self, *args, **kwargs):
+        return sum(1 for _ in self.find_all(*args, **kwargs))
+
+    def find_exactly(self, signature, n, **kwargs):
+        '''
+        All matches as a list, raises if there are not exactly n of them.
+        '''
+        found = list(self.find_all(signature, **kwargs))
+        if len(found) != n:
+            raise SignatureException(f'Pattern found {len(found)} times, expected {n}!')
+        return found
+
+    def asm(self, x, addr=0):
+        return Assemble(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB, x, addr)
 
     def disasm(self, pre):
         pre_dis = [' '.join([x.bytes.hex(), x.mnemonic, x.op_str])
@@ -0,0 +1,398 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Micro benchmarks for the patcher internals, run: python bench.py [name ...]
+#####
+
+import time
+
+from tests.firmware import FindPatternNaive, planted_image, random_image
+from util import FindPattern
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+
+def bench_find_pattern():
+    # literal speed table row (NbPatcher.embed_speed_table), wildcarded
+    # thumb signature and a masked one, planted at the end of the image
+    speed_row = list(b''.join(x.to_bytes(4, 'little') for x in [16, 35, 13, 25, 55, 17, 32, 100, 35]))
+    wildcard = [0xa4, 0xf8, 0xe2, None, 0xa4, 0xf8, 0xf0, None, 0xa4, 0xf8, 0xee, None]
+    masked = ([0x4f, 0xf4, 0x7a, 0x71, 0x00, 0x28], [0xff, 0xff, 0xff, 0xff, 0xff, 0xf0])
+    cases = [
+        ('literal', speed_row, None, bytes(speed_row)),
+        ('wildcard', wildcard, None, bytes(0 if b is None else b for b in wildcard)),
+        ('masked', masked[0], masked[1], bytes(masked[0][:-1]) + b'\x2a'),
+    ]
+
+    print('find_pattern: size, signature, naive [ms], anchored [ms], speedup')
+    for size in (64 << 10, 256 << 10, 1 << 20):
+        image = random_image(size)
+        for name, sig, mask, planted in cases:
+            data = bytearray(image)
+            data[-len(planted)-1:-1] = planted
+            expect = FindPatternNaive(data, list(sig), mask=mask)
+            assert FindPattern(data, list(sig), mask=mask) == expect
+
+            t_naive = timeit(lambda: FindPatternNaive(data, list(sig), mask=mask), repeat=1)
+            t_fast = timeit(lambda: FindPattern(data, list(sig), mask=mask))
+            print(f'{size >> 10:>5} KB  {name:<9} {t_naive * 1e3:9.2f} {t_fast * 1e3:9.3f} {t_naive / t_fast:8.0f}x')
+
+
+def bench_asm():
+    import keystone
+    from engines import Assemble, AssembleCacheInfo
+    from thumb_encode import ThumbEncode
+
+    ks = keystone.Ks(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB)
+    texts = ['NOP', 'CMP R0, R0', 'MOVW R2,#25000', 'STRH.W r7,[r5,#0xf8]', 'POP.W {R4, R5, R6, PC}']
+
+    t_ks = timeit(lambda: [ks.asm(x) for x in texts * 100])
+    t_native = timeit(lambda: [ThumbEncode(x) for x in texts * 100])
+    t_cached = timeit(lambda: [Assemble(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB, x) for x in texts * 100])
+    n = len(texts) * 100
+    print(f'asm: keystone {t_ks / n * 1e6:.1f} us, native {t_native / n * 1e6:.1f} us, '
+          f'cached {t_cached / n * 1e6:.2f} us per instruction')
+    print(f'asm cache: {AssembleCacheInfo()}')
+
+
+def bench_engines():
+    import capstone
+    import keystone
+    from engines import Capstone, Keystone
+
+    def construct():
+        keystone.Ks(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB)
+        capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_THUMB)
+
+    def pooled():
+        Keystone()
+        Capstone()
+
+    n = 200
+    t_new = timeit(lambda: [construct() for _ in range(n)])
+    t_pool = timeit(lambda: [pooled() for _ in range(n)])
+    print(f'engines: new Ks+Cs {t_new / n * 1e6:.1f} us, pooled {t_pool / n * 1e6:.2f} us per patcher')
+
+
+def bench_plan():
+    from mi_patcher import MiPatcher
+
+    image = planted_image()
+
+    def values(i):
+        return {
+            'speed_limit_sport': (20 + i,),
+            'speed_limit_drive': (15 + i % 5,),
+            'ampere_sport': (20000 + 500 * i,),
+            'current_raising_coeff': (300 + 10 * i,),
+            'motor_start_speed': (3.0 + i / 10,),
+            'ampere_ped': (7000 + 100 * i,),
+        }
+
+    def fresh(i):
+        patcher = MiPatcher(bytearray(image), '1s')
+        for name, args in values(i).items():
+            getattr(patcher, name)(*args)
+        return patcher.data
+
+    base = MiPatcher(bytearray(image), '1s')
+    base.prescan()
+
+    def fork(i):
+        patcher = base.fork()
+        for name, args in values(i).items():
+            getattr(patcher, name)(*args)
+        return patcher.data
+
+    planned = MiPatcher(bytearray(image), '1s')
+    t_plan = timeit(lambda: planned.plan(values(0)), repeat=1)
+    lookups = len(planned._plan.lookups)
+
+    def apply(i):
+        return planned.apply(values(i))[0].data
+
+    n = 20
+    for i in range(n):
+        assert fresh(i) == fork(i) == apply(i)
+    t_copy = timeit(lambda: [bytearray(image) for i in range(n)])
+    rows = [(name, timeit(lambda: [f(i) for i in range(n)]))
+            for name, f in (('new patcher', fresh), ('fork', fork), ('plan.apply', apply))]
+    print(f'plan: {len(image) >> 10} KB image, {lookups} lookups, plan {t_plan * 1e3:.2f} ms, '
+          f'memcpy {t_copy / n * 1e3:.3f} ms per submit')
+    for name, t in rows:
+        print(f'  {name:<12} {t / n * 1e3:8.3f} ms per submit')
+
+
+def bench_memo():
+    # patches sharing a signature (SIG_SPEED_PARAMS) after earlier writes to the image
+    from mi_patcher import MiPatcher
+
+    image = planted_image(1 << 20)
+    values = {'speed_limit_sport': (25,), 'speed_limit_drive': (18,), 'ampere_sport': (25000,),
+              'current_raising_coeff': (500,), 'motor_start_speed': (4.0,), 'ampere_ped': (9000,)}
+    base = MiPatcher(bytearray(image), '1s')
+    base.prescan()
+
+    def run(memo):
+        patcher = base.fork()
+        for name, args in values.items():
+            if not memo:
+                patcher._lookups.clear()
+            getattr(patcher, name)(*args)
+        return patcher.data
+
+    n = 20
+    assert run(True) == run(False)
+    rows = [(name, timeit(lambda: [run(memo) for _ in range(n)], repeat=3))
+            for name, memo in (('no memo', False), ('memo', True))]
+    print(f'memo: {len(image) >> 10} KB image, {len(values)} patches per fork')
+    for name, t in rows:
+        print(f'  {name:<8} {t / n * 1e3:8.3f} ms per fork')
+
+
+def bench_dry_run():
+    # a Doc request: only the patch records are needed
+    import tracemalloc
+    from journal import PatchJournal
+    from mi_patcher import MiPatcher
+
+    size = 1 << 20
+    image = planted_image(size)
+    values = {'speed_limit_sport': (25,), 'speed_limit_drive': (18,), 'ampere_sport': (25000,),
+              'current_raising_coeff': (500,), 'motor_start_speed': (4.5,), 'ampere_ped': (8000,)}
+
+    def patched(make):
+        patcher = make()
+        return [getattr(patcher, name)(*args) for name, args in values.items()]
+
+    builds = (
+        ('patch a copy', lambda: MiPatcher(bytearray(image), '1s')),
+        ('dry run', lambda: MiPatcher(PatchJournal(image), '1s')),
+    )
+    assert patched(builds[0][1]) == patched(builds[1][1])
+    print(f'dry run: {size >> 10} KB image, time [ms], peak (x image)')
+    for name, make in builds:
+        t = timeit(lambda: patched(make))
+        tracemalloc.start()
+        patched(make)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'  {name:<14} {t * 1e3:8.1f} {peak / size:6.2f}x')
+
+
+def bench_session():
+    # one of the requested patches fails: retry without it vs. skip it in a session
+    from mi_patcher import MiPatcher
+    from util import SignatureException
+
+    image = planted_image(1 << 20)
+    values = {'speed_limit_sport': (25,), 'speed_limit_drive': (18,), 'volt_limit': (40.0,),
+              'ampere_sport': (25000,), 'current_raising_coeff': (500,), 'motor_start_speed': (4.5,)}
+
+    def retry():
+        todo = dict(values)
+        while True:
+            patcher = MiPatcher(bytearray(image), '1s')
+            try:
+                for name, args in todo.items():
+                    getattr(patcher, name)(*args)
+                return patcher.data
+            except SignatureException:
+                del todo[name]
+
+    def skip():
+        patcher = MiPatcher(bytearray(image), '1s')
+        session = patcher.session(skip_failures=True)
+        for name, args in values.items():
+            getattr(session.patcher, name)(*args)
+        assert [name for name, _ in session.failures] == ['volt_limit']
+        return session.commit()
+
+    assert retry() == skip()
+    t_retry, t_skip = timeit(retry), timeit(skip)
+    print(f'session: 1 of {len(values)} patches fails, retry without it {t_retry * 1e3:.1f} ms, '
+          f'skip in a session {t_skip * 1e3:.1f} ms')
+
+
+def bench_memory():
+    # peak memory of one /cfw request with every patch of the planted image, relative to the image size;
+    # tests/test_memory.py holds the bound
+    import io
+    import tracemalloc
+    import app as web
+
+    size = 1 << 20
+    image = planted_image(size)
+    image[0x100:0x10f] = b'DRV_STM32F103CE'
+    image = bytes(image)
+    form = {'device': '1s', 'sl_sport': '27', 'sl_drive': '18', 'amps_sport': '25000',
+            'amps_ped': '8000', 'crc': '500', 'motor_start_speed': '4.5'}
+    client = web.app.test_client()
+
+    print(f'memory: peak (x image) of a {size >> 10} KB image per /cfw request, plan cache cold / warm')
+    for pod in ('Zip', 'Bin', '.bin.enc'):
+        rows = []
+        for warm in (False, True):
+            data = {**form, 'patch': pod}
+            client.post('/cfw', data={**data, 'filename': (io.BytesIO(image), 'x.bin')}).close()
+            if not warm and web.plan_cache is not None:
+                web.plan_cache.entries.clear()
+            tracemalloc.start()
+            response = client.post('/cfw', data={**data, 'filename': (io.BytesIO(image), 'x.bin')}, buffered=False)
+            for _ in response.response:
+                pass
+            response.close()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append(f'{peak / size:.2f}x')
+        print(f'  {pod:<9} {rows[0]} / {rows[1]}')
+
+
+def bench_tea():
+    import tea
+
+    data = bytes(random_image(256 << 10))
+    print('tea: backend, encrypt [MB/s], decrypt [MB/s]')
+    for backend in [cls() for cls in tea.BACKENDS if cls.available()]:
+        enc = backend.encrypt(data)
+        assert backend.decrypt(enc)[:len(data)] == data
+        repeat = 1 if backend.name in ('python', 'ninebottea') else 3
+        t_enc = timeit(lambda: backend.encrypt(data), repeat=repeat)
+        t_dec = timeit(lambda: backend.decrypt(enc), repeat=repeat)
+        selected = ' (selected)' if backend.name == tea.Tea.name else ''
+        print(f'{backend.name:<11} {len(data) / t_enc / 1e6:9.2f} {len(data) / t_dec / 1e6:9.2f}{selected}')
+
+
+def ZipItBuffered(zippy, comment, key=None):
+    '''
+    Reference: the archive built with zipfile in a BytesIO and copied out, as zip_it was implemented before.
+    '''
+    import io
+    import zipfile
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED, False) as zf:
+        zf.writestr('FIRM.bin', zippy.data)
+        zf.writestr('FIRM.bin.enc', zippy.encrypt(key))
+        zf.writestr('info.json', b'{}')
+        zf.comment = comment
+    return buffer.getvalue()
+
+
+def bench_zip():
+    import tracemalloc
+    from zippy import Zippy
+
+    print('zip: size, buffered first byte [ms] / peak, streamed first byte [ms] / peak')
+    for size in (256 << 10, 1 << 20):
+        zippy = Zippy(random_image(size))
+        rows = []
+        for build in (lambda: [ZipItBuffered(zippy, b'nice')], lambda: zippy.zip_stream(b'nice')):
+            tracemalloc.start()
+            t = time.perf_counter()
+            chunks = iter(build())
+            next(chunks)
+            t = time.perf_counter() - t
+            for _ in chunks:
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append(f'{t * 1e3:8.1f} / {peak / size:.2f}x')
+        print(f'{size >> 10:>5} KB  {rows[0]}  {rows[1]}')
+
+
+def bench_zip_policy():
+    import zipfile
+    import zippy
+    from zippy import Zippy
+
+    deflated = {name: (zipfile.ZIP_DEFLATED, None) for name in zippy.ZIP_POLICY}
+    policies = [
+        # name, member policy, FIRM.bin level, members
+        ('deflate all (before)', deflated, None, zippy.ZIP_MEMBERS),
+        ('store enc', zippy.ZIP_POLICY, None, zippy.ZIP_MEMBERS),
+        ('store enc, level 1', zippy.ZIP_POLICY, 1, zippy.ZIP_MEMBERS),
+        ('store enc, level 9', zippy.ZIP_POLICY, 9, zippy.ZIP_MEMBERS),
+        ('bin only', zippy.ZIP_POLICY, None, ('FIRM.bin',)),
+        ('enc only', zippy.ZIP_POLICY, None, ('FIRM.bin.enc',)),
+    ]
+
+    print('zip policy: image, policy, time [ms], size [KB]')
+    default = zippy.ZIP_POLICY
+    try:
+        # DRV sized and VCU sized images
+        for size in (64 << 10, 1 << 20):
+            image = Zippy(random_image(size), params='Speed-Limit Sport: 30km/h\n', model='1s')
+            for name, policy, level, members in policies:
+                zippy.ZIP_POLICY = policy
+                content = image.zip_it(b'nice', members=members, level=level)
+                t = timeit(lambda: image.zip_it(b'nice', members=members, level=level))
+                print(f'{size >> 10:>5} KB  {name:<22} {t * 1e3:8.1f} {len(content) / 1024:8.0f}')
+    finally:
+        zippy.ZIP_POLICY = default
+
+
+def bench_zip_pipeline():
+    import zippy
+    from zippy import Zippy
+
+    print(f'zip pipeline: image, sequential [ms], {zippy.ZIP_WORKERS} workers [ms], speedup ({zippy.Tea.name})')
+    workers = zippy.ZIP_WORKERS
+    try:
+        for size in (256 << 10, 1 << 20, 4 << 20):
+            image = Zippy(random_image(size), params='Speed-Limit Sport: 30km/h\n', model='1s')
+            times = []
+            for n in (0, workers):
+                zippy.ZIP_WORKERS = n
+                times.append(timeit(lambda: image.zip_it(b'nice')))
+            print(f'{size >> 10:>5} KB  {times[0] * 1e3:8.1f} {times[1] * 1e3:8.1f}  {times[0] / times[1]:.2f}x')
+    finally:
+        zippy.ZIP_WORKERS = workers
+
+
+BENCHMARKS = {
+    'find_pattern': bench_find_pattern,
+    'asm': bench_asm,
+    'engines': bench_engines,
+    'memory': bench_memory,
+    'tea': bench_tea,
+    'zip': bench_zip,
+    'zip_policy': bench_zip_policy,
+    'zip_pipeline': bench_zip_pipeline,
+    'plan': bench_plan,
+    'memo': bench_memo,
+    'dry_run': bench_dry_run,
+    'session': bench_session,
+}
+
+
+if __name__ == "__main__":
+    import sys
+
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    # no cross process locking on windows
+    fcntl = None
+
+
+class DiskCache():
+    '''
+    Size capped on-disk key/value store with LRU eviction.
+
+    Every entry is one file named after the hash of (version, key), so bumping
+    the version makes all old entries unreachable; they age out by eviction.
+    Access times are tracked via the file mtime, which also works across
+    processes sharing the same directory.
+    '''
+    def __init__(self, path, max_size=64 << 20, version=''):
+        self.path = path
+        self.max_size = max_size
+        self.version = str(version)
+        os.makedirs(path, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def filename(self, key):
+        digest = hashlib.sha256(f'{self.version}\0{key}'.encode()).hexdigest()
+        return os.path.join(self.path, digest)
+
+    def get(self, key):
+        fn = self.filename(key)
+        try:
+            with open(fn, 'rb') as fp:
+                value = fp.read()
+            os.utime(fn)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Store value, bytes or an iterable of byte chunks.
+        '''
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = (value,)
+        for _ in self.put_iter(key, value):
+            pass
+
+    def put_iter(self, key, chunks):
+        '''
+        Yield the chunks while storing them, e.g. on their way into a response.
+        The entry only appears once the last chunk was written, stopping early drops it.
+        '''
+        # write to a temporary file first, readers never see partial entries
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                for chunk in chunks:
+                    fp.write(chunk)
+                    yield chunk
+            os.replace(tmp, self.filename(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.startswith('.tmp'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache(DiskCache):
+    '''
+    Finished output files, addressed by everything their content depends on:
+    the input, the normalized patch parameters, the output format and the
+    custom encryption key. The patcher version goes into the cache version.
+    '''
+    def __init__(self, path, max_size=256 << 20, version=''):
+        super().__init__(path, max_size, version)
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(data, params, output, enc_key=None):
+        digest = hashlib.sha256(data).hexdigest()
+        params = json.dumps(sorted((str(k), str(v).strip()) for k, v in params.items()))
+        key_fp = hashlib.sha256(enc_key).hexdigest() if enc_key else ''
+        return f'{digest}:{hashlib.sha256(params.encode()).hexdigest()}:{output}:{key_fp}'
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None:
+            with self.lock:
+                self.bytes_saved += len(value)
+        return value
+
+    def stats(self):
+        return {**super().stats(), 'bytes_saved': self.bytes_saved}
+
+
+class PlanCache():
+    '''
+    In-memory LRU of patchers holding the patch plan (BasePatcher.plan()) of an
+    image for one set of patches, so re-submits with other values only apply them.
+    '''
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data, device, fields):
+        return f'{hashlib.sha256(data).hexdigest()}:{device}:{",".join(sorted(fields))}'
+
+    def get(self, key):
+        with self.lock:
+            patcher = self.entries.get(key)
+            if patcher is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return patcher
+
+    def put(self, key, patcher):
+        with self.lock:
+            self.entries[key] = patcher
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SingleFlight():
+    '''
+    Serializes identical calls: a caller holds its key until it releases it,
+    callers of the same key arriving meanwhile wait for that and then look up
+    the shared store (ResultCache) the holder published its result to.
+
+    With a lock directory the holder also holds a file lock (one of a fixed
+    number of stripes per key), which serializes identical calls of other
+    processes on the same host, e.g. pre-forked workers.
+    '''
+    def __init__(self, lock_dir=None, stripes=256):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.stripes = stripes
+        if self.lock_dir is not None:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.waited = 0
+
+    def _lock_file(self, key):
+        if self.lock_dir is None:
+            return None
+        stripe = int(hashlib.sha256(key.encode()).hexdigest(), 16) % self.stripes
+        fp = open(os.path.join(self.lock_dir, f'{stripe:03d}.lock'), 'a')
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+        except BaseException:
+            fp.close()
+            raise
+        return fp
+
+    def acquire(self, key):
+        '''
+        Wait until no other thread or process holds key and hold it. Returns the
+        function releasing it, which may be called more than once (e.g. by a
+        response once its last chunk was sent and again when it is closed).
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.waited += 1
+            call.holders += 1
+
+        def done():
+            with self.lock:
+                call.holders -= 1
+                if not call.holders:
+                    del self.calls[key]
+
+        call.lock.acquire()
+        try:
+            fp = self._lock_file(key)
+        except BaseException:
+            call.lock.release()
+            done()
+            raise
+
+        released = threading.Lock()
+
+        def release():
+            if not released.acquire(blocking=False):
+                return
+            if fp is not None:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+                fp.close()
+            call.lock.release()
+            done()
+        return release
+
+    def stats(self):
+        return {
+            'leaders': self.leaders,
+            'waited': self.waited,
+            'in_flight': len(self.calls),
+        }
+
+
+class _Call():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holders = 0
@@ -22,38 +22,26 @@
 # All original mod authors are mentioned in the function comments!
 #####
 
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from mi_patcher import MiPatcher
 from nb_patcher import NbPatcher
 
 from util import SignatureException
 
+MI_MODELS = ['1s', 'pro2', 'lite', 'mi3', '4pro']
+NB_MODELS = ['4plus', '4max', 'f2pro', 'f2plus', 'f2', 'g2']
 
-if __name__ == "__main__":
-    import sys
-    from argparse import ArgumentParser
-    from zippy import Zippy
+mult = 10./8.5  # new while size / old wheel size
 
-    parser = ArgumentParser()
-    parser.add_argument("type", choices=['mi', 'nb'])
-    parser.add_argument("model", choices=['1s', 'pro2', 'lite', 'mi3', '4pro', '4plus', '4max', 'f2pro', 'f2plus', 'f2', 'g2'])
-    parser.add_argument("infile")
-    parser.add_argument("outfile")
-    parser.add_argument("patches")
-    args = parser.parse_args()
-
-    def eprint(*args, **kwargs):
-        print(*args, file=sys.stderr, **kwargs)
-
-
-    with open(args.infile, 'rb') as fp:
-        data = fp.read()
 
-    mult = 10./8.5  # new while size / old wheel size
-
-    if args.type == 'mi':
-        vlt = MiPatcher(data, args.model)
-
-        patches = {
+def get_patches(vlt):
+    if isinstance(vlt, MiPatcher):
+        return {
             'dpc': lambda: vlt.dpc(),
             'sdt': lambda: vlt.shutdown_time(1),
             'mss': lambda: vlt.motor_start_speed(3),
@@ -84,30 +72,53 @@ if __name__ == "__main__":
             'abr': lambda: vlt.ampere_brake(min_=25000, max_=60000),
             'kml': lambda: vlt.kers_multi(2, 5, 10),
         }
+
+    return {
+        'dmn': lambda: vlt.disable_motor_ntc(),
+        'asc': lambda: vlt.allow_sn_change(),
+        'skc': lambda: vlt.skip_key_check(),
+        'rfm': lambda: vlt.region_free(),
+        'kml': lambda: vlt.kers_multi(2, 5, 10),
+        'slp': lambda: vlt.speed_params(23, 22, 21, 20),
+        'dpc': lambda: vlt.dpc(),
+        'rab': lambda: vlt.remove_autobrake(),
+        'ccd': lambda: vlt.cc_delay(3),
+        'rcm': lambda: vlt.remove_charging_mode(),
+        'rks': lambda: vlt.remove_kers(),
+        'amp': lambda: vlt.ampere_ped(5000),
+        'ame': lambda: vlt.ampere_eco(10000),
+        'amd': lambda: vlt.ampere_drive(20000),
+        'ams': lambda: vlt.ampere_sport(30000),
+        'mme': lambda: vlt.ampere_max_eco(20000),
+        'mmd': lambda: vlt.ampere_max_drive(40000),
+        'mms': lambda: vlt.ampere_max_sport(60000),
+        'bud': lambda: vlt.bms_baudrate(76800),
+    }
+
+
+def read_firmware(path):
+    with open(path, 'rb') as fp:
+        data = fp.read()
+
+    if path.endswith((".zip", ".enc")):
+        from zippy import Zippy
+        zippy = Zippy(data)
+        if path.endswith(".enc"):
+            zippy.decrypt()
+        zippy.try_extract()
+        data = zippy.data
+
+    return data
+
+
+def patch_file(args):
+    data = read_firmware(args.infile)
+
+    if args.type == 'mi':
+        vlt = MiPatcher(data, args.model)
     elif args.type == 'nb':
         vlt = NbPatcher(data, args.model)
-
-        patches = {
-            'dmn': lambda: vlt.disable_motor_ntc(),
-            'asc': lambda: vlt.allow_sn_change(),
-            'skc': lambda: vlt.skip_key_check(),
-            'rfm': lambda: vlt.region_free(),
-            'kml': lambda: vlt.kers_multi(2, 5, 10),
-            'slp': lambda: vlt.speed_params(23, 22, 21, 20),
-            'dpc': lambda: vlt.dpc(),
-            'rab': lambda: vlt.remove_autobrake(),
-            'ccd': lambda: vlt.cc_delay(3),
-            'rcm': lambda: vlt.remove_charging_mode(),
-            'rks': lambda: vlt.remove_kers(),
-            'amp': lambda: vlt.ampere_ped(5000),
-            'ame': lambda: vlt.ampere_eco(10000),
-            'amd': lambda: vlt.ampere_drive(20000),
-            'ams': lambda: vlt.ampere_sport(30000),
-            'mme': lambda: vlt.ampere_max_eco(20000),
-            'mmd': lambda: vlt.ampere_max_drive(40000),
-            'mms': lambda: vlt.ampere_max_sport(60000),
-            'bud': lambda: vlt.bms_baudrate(76800),
-        }
+    patches = get_patches(vlt)
 
     for k in patches:
         if k not in args.patches.split(",") and args.patches != 'all':
@@ -128,8 +139,154 @@ if __name__ == "__main__":
         except SignatureException:
             print("SIGERR", k)
 
-    with open(args.outfile, 'wb') as fp:
-        if args.outfile.endswith(".zip"):
-            fp.write(Zippy(vlt.data).zip_it("ilike".encode()))
+    write_firmware(args.outfile, vlt.data)
+
+
+def write_firmware(path, data):
+    with open(path, 'wb') as fp:
+        if path.endswith(".zip"):
+            from zippy import Zippy
+            fp.writelines(Zippy(data).zip_stream("ilike".encode()))
         else:
-            fp.write(vlt.data)
+            fp.write(data)
+
+
+def batch_init():
+    '''
+    Warm up a batch worker once: assembler/disassembler engines and the signature scanners.
+    '''
+    from engines import Assemble, Capstone, Keystone
+    from scanner import MultiScanner
+    import keystone
+
+    Keystone()
+    Capstone()
+    Assemble(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB, 'NOP')
+    MultiScanner.get(MiPatcher.signatures)
+    MultiScanner.get(NbPatcher.signatures)
+
+
+def batch_file(path, spec, outdir):
+    '''
+    Patch one file of a batch, returns (path, input size, applied, failed, error).
+    '''
+    model = spec['model']
+    selection = spec.get('patches', 'all')
+    if isinstance(selection, str):
+        selection = selection.split(',')
+
+    try:
+        data = read_firmware(path)
+        vlt = (MiPatcher if model in MI_MODELS else NbPatcher)(data, model)
+        patches = get_patches(vlt)
+
+        applied, failed = [], []
+        for k in patches:
+            if k not in selection and selection != ['all']:
+                continue
+            try:
+                patches[k]()
+                applied.append(k)
+            except SignatureException:
+                failed.append(k)
+
+        name = os.path.basename(path).split('.')[0]
+        write_firmware(os.path.join(outdir, f'{name}.{model}.{spec.get("format", "bin")}'), vlt.data)
+    except Exception as e:
+        return path, 0, [], [], f'{type(e).__name__}: {e}'
+    return path, len(data), applied, failed, None
+
+
+def batch(args):
+    '''
+    Patch every firmware file of the given directories/globs in parallel, with one
+    patch spec for all: {"model": "1s", "patches": "all" or [names], "format": "bin" or "zip"}.
+    '''
+    with open(args.spec, 'r') as fp:
+        spec = json.load(fp)
+    if spec.get('model') not in MI_MODELS + NB_MODELS:
+        raise SystemExit(f'Invalid model in spec: {spec.get("model")}')
+    if spec.get('format', 'bin') not in ('bin', 'zip'):
+        raise SystemExit(f'Invalid format in spec: {spec.get("format")}')
+
+    paths = []
+    for x in args.inputs:
+        if os.path.isdir(x):
+            paths += sorted(os.path.join(x, name) for name in os.listdir(x)
+                            if name.lower().endswith(('.bin', '.zip', '.enc')))
+        else:
+            paths += sorted(glob.glob(x))
+    os.makedirs(args.outdir, exist_ok=True)
+
+    t = time.perf_counter()
+    files, size, errors = 0, 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=batch_init) as pool:
+        jobs = [pool.submit(batch_file, path, spec, args.outdir) for path in paths]
+        for job in as_completed(jobs):
+            path, n, applied, failed, error = job.result()
+            if error is not None:
+                errors += 1
+                print(f'ERR  {path}: {error}')
+                continue
+            files += 1
+            size += n
+            status = 'OK  ' if not failed else 'PART'
+            print(f'{status} {path}: {len(applied)} applied' + (f', SIGERR {",".join(failed)}' if failed else ''))
+    t = time.perf_counter() - t
+
+    print(f'{files} files ({size / 1e6:.2f} MB) in {t:.2f}s, {errors} errors: '
+          f'{files / t:.1f} files/s, {size / 1e6 / t:.2f} MB/s')
+
+
+def stock_table(args):
+    '''
+    Regenerate the known stock firmware table from a corpus laid out as <corpus>/<model>/<firmware files>.
+    '''
+    from stock import StockTable
+
+    table = StockTable() if args.clean else StockTable.load(args.table)
+    for model in sorted(os.listdir(args.corpus)):
+        if model not in MI_MODELS + NB_MODELS:
+            continue
+        patcher_cls = MiPatcher if model in MI_MODELS else NbPatcher
+        model_dir = os.path.join(args.corpus, model)
+        for name in sorted(os.listdir(model_dir)):
+            data = read_firmware(os.path.join(model_dir, name))
+            names = get_patches(patcher_cls(data, model)).keys()
+            patches = {k: (lambda vlt, k=k: get_patches(vlt)[k]()) for k in names}
+            print(model, name)
+            digest = table.add(data, model, patcher_cls, patches)
+            print(f'  {digest}')
+    table.save(args.table)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from stock import STOCK_TABLE
+
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for type_, models in [('mi', MI_MODELS), ('nb', NB_MODELS)]:
+        p = commands.add_parser(type_, help=f"patch a {type_} firmware file")
+        p.add_argument("model", choices=MI_MODELS + NB_MODELS)
+        p.add_argument("infile")
+        p.add_argument("outfile")
+        p.add_argument("patches")
+        p.set_defaults(func=patch_file, type=type_)
+
+    p = commands.add_parser("batch", help="patch many firmware files in parallel")
+    p.add_argument("spec", help="JSON patch spec: model, patches and output format")
+    p.add_argument("inputs", nargs="+", help="firmware directories or glob patterns")
+    p.add_argument("-o", "--outdir", default="out")
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    p.set_defaults(func=batch)
+
+    p = commands.add_parser("stock-table", help="regenerate the known stock firmware table")
+    p.add_argument("corpus", help="directory with one sub directory of firmware files per model")
+    p.add_argument("--table", default=STOCK_TABLE)
+    p.add_argument("--clean", action="store_true", help="drop existing entries")
+    p.set_defaults(func=stock_table)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import threading
+from functools import lru_cache
+
+import capstone
+import keystone
+from thumb_encode import ThumbEncode
+
+ASM_CACHE_SIZE = 4096
+
+# engines are not thread-safe, every thread gets its own (created once, then reused)
+_local = threading.local()
+
+
+def Keystone(arch=keystone.KS_ARCH_ARM, mode=keystone.KS_MODE_THUMB):
+    engines = _local.__dict__.setdefault('ks', {})
+    ks = engines.get((arch, mode))
+    if ks is None:
+        ks = engines[(arch, mode)] = keystone.Ks(arch, mode)
+    return ks
+
+
+def Capstone(arch=capstone.CS_ARCH_ARM, mode=capstone.CS_MODE_THUMB):
+    engines = _local.__dict__.setdefault('cs', {})
+    cs = engines.get((arch, mode))
+    if cs is None:
+        cs = engines[(arch, mode)] = capstone.Cs(arch, mode)
+    return cs
+
+
+@lru_cache(maxsize=ASM_CACHE_SIZE)
+def Assemble(arch, mode, text, addr=0):
+    '''
+    Assemble text at the given address, memoized process wide.
+    Common thumb instructions are encoded natively, everything else by Keystone.
+    '''
+    if arch == keystone.KS_ARCH_ARM and mode == keystone.KS_MODE_THUMB:
+        encoding = ThumbEncode(text, addr)
+        if encoding is not None:
+            return encoding
+    encoding, _ = Keystone(arch, mode).asm(text, addr)
+    return bytes(encoding)
+
+
+def AssembleCacheInfo():
+    info = Assemble.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_ratio': info.hits / lookups if lookups else 0.0,
+    }
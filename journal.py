@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Patch journal: the patches of a dry run, recorded instead of written,
+# and the patch buffer, an image which remembers where it was written.
+#####
+
+from bisect import bisect_left, insort
+
+
+class PatchJournal():
+    '''
+    Stands in for a patcher's data in a dry run: writes are recorded as
+    (offset, pre, post) on top of a read-only image, which is neither modified
+    nor copied; reads see the image with the recorded writes applied.
+    '''
+    def __init__(self, image):
+        self.image = image
+        self.records = []
+        # current value of every written byte, and the written offsets in order
+        self.written = {}
+        self.offsets = []
+
+    def __len__(self):
+        return len(self.image)
+
+    def _range(self, key):
+        if not isinstance(key, slice):
+            if key < 0:
+                key += len(self.image)
+            if not 0 <= key < len(self.image):
+                raise IndexError('journal index out of range')
+            return key, key + 1
+        start, stop, step = key.indices(len(self.image))
+        if step != 1:
+            raise ValueError('extended slices are not supported')
+        return start, max(start, stop)
+
+    def _written(self, start, stop):
+        return self.offsets[bisect_left(self.offsets, start):bisect_left(self.offsets, stop)]
+
+    def __getitem__(self, key):
+        start, stop = self._range(key)
+        if not isinstance(key, slice):
+            return self.written.get(start, self.image[start])
+        out = bytearray(self.image[start:stop])
+        for ofs in self._written(start, stop):
+            out[ofs - start] = self.written[ofs]
+        return out
+
+    def __setitem__(self, key, value):
+        start, stop = self._range(key)
+        post = bytes(value) if isinstance(key, slice) else bytes((value,))
+        if len(post) != stop - start:
+            raise ValueError('patches must not change the image size')
+        self.records.append((start, bytes(self[start:stop]), post))
+        for ofs, b in enumerate(post, start):
+            if ofs not in self.written:
+                insort(self.offsets, ofs)
+            self.written[ofs] = b
+
+    def __bytes__(self):
+        return bytes(self[:])
+
+    def __eq__(self, other):
+        if isinstance(other, PatchJournal):
+            other = bytes(other)
+        return bytes(self) == other
+
+    __hash__ = None
+
+    def find(self, sub, start=None, end=None):
+        '''
+        bytes.find on the patched image: matches touching written bytes are
+        searched around them, all others directly in the image.
+        '''
+        start, end = self._range(slice(start, end))
+        n = len(sub)
+        found = []
+
+        # runs of consecutive written offsets, each with the few bytes around it
+        runs = []
+        for ofs in self._written(start - n + 1, end):
+            if runs and runs[-1][1] == ofs:
+                runs[-1][1] = ofs + 1
+            else:
+                runs.append([ofs, ofs + 1])
+        for a, b in runs:
+            lo, hi = max(start, a - n + 1), min(end, b + n - 1)
+            if (i := self[lo:hi].find(sub)) != -1:
+                found.append(lo + i)
+
+        pos = start
+        while (pos := self.image.find(sub, pos, end)) != -1:
+            if not self._written(pos, pos + n):
+                found.append(pos)
+                break
+            pos += 1
+        return min(found, default=-1)
+
+    def truncate(self, n):
+        '''
+        Drop all records after the first n (a rollback), returns their (start, stop) ranges.
+        '''
+        removed = self.ranges(n)
+        del self.records[n:]
+        self.written, self.offsets = {}, []
+        for ofs, _, post in self.records:
+            for i, b in enumerate(post, ofs):
+                self.written[i] = b
+        self.offsets = sorted(self.written)
+        return removed
+
+    def ranges(self, since=0):
+        '''
+        Written (start, stop) ranges of the records since the given record count.
+        '''
+        return [(ofs, ofs + len(post)) for ofs, _, post in self.records[since:]]
+
+    def apply(self, buffer, since=0):
+        '''
+        Write the recorded patches (since the given record count) into buffer, e.g.
+        another copy of the image, in one pass, in order, each only where its pre bytes are found.
+        '''
+        for ofs, pre, post in self.records[since:]:
+            if buffer[ofs:ofs+len(pre)] != pre:
+                raise ValueError(f'Unexpected bytes at {hex(ofs)}: {bytes(buffer[ofs:ofs+len(pre)]).hex()}, expected {pre.hex()}')
+            buffer[ofs:ofs+len(post)] = post
+        return buffer
+
+
+class PatchBuffer(bytearray):
+    '''
+    A patcher's image: a bytearray which records the (start, stop) range of each
+    item or slice assignment, so the patcher re-scans only what was written.
+    Writes through a memoryview (e.g. readinto) are not seen.
+    '''
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.records = []
+
+    def __setitem__(self, key, value):
+        size = len(self)
+        super().__setitem__(key, value)
+        if not isinstance(key, slice):
+            start = key + size if key < 0 else key
+            self.records.append((start, start + 1))
+        elif len(self) != size:
+            # resized: everything from the slice on has moved
+            self.records.append((key.indices(size)[0], len(self)))
+        elif (written := range(*key.indices(size))):
+            self.records.append((min(written), max(written) + 1))
+
+    def ranges(self, since=0):
+        '''
+        Written (start, stop) ranges since the given record count, like PatchJournal.ranges.
+        '''
+        return self.records[since:]
+
@@ -1,14 +1,172 @@
 import struct
 
 from base_patcher import BasePatcher
-from util import PatchImm, FindPattern, NearestConst, SignatureException
+from util import PatchImm, NearestConst, Signature, SignatureException
 
 # https://web.eecs.umich.edu/~prabal/teaching/eecs373-f10/readings/ARMv7-M_ARM.pdf
 MOVW_T3_IMM = [*[None]*5, 11, *[None]*6, 15, 14, 13, 12, None, 10, 9, 8, *[None]*4, 7, 6, 5, 4, 3, 2, 1, 0]
 MOVS_T1_IMM = [*[None]*8, 7, 6, 5, 4, 3, 2, 1, 0]
 
+# remove_modellock
+SIG_MODELLOCK = Signature([0x01, 0xeb, 0x00, 0x0c, 0x13, 0xf8, 0x00, 0x80,
+                           0x9c, 0xf8, 0x04, 0xc0, 0xc4, 0x45])
+SIG_MODELLOCK_016 = Signature([None, 0x18, None, 0xf8, 0x00, 0xc0, None, 0x79, None, 0x45])
+
+# remove_kers
+SIG_KERS = Signature([0x00, 0xeb, 0x80, 0x00, 0x80, 0x00, 0x80, 0x0a])
+SIG_KERS_022 = Signature([0x00, 0xdd, 0x80, 0x20, 0xc0, 0x04, 0x00, 0x0c])
+
+# remove_autobrake
+SIG_AUTOBRAKE = Signature([None, 0x68, 0x42, 0xf6, 0x6e, 0x0c])
+SIG_AUTOBRAKE_022 = Signature([0x2C, 0xE0, 0x18, 0x68, 0x42, 0xF6, 0xD0, 0x7b])
+
+# remove_charging_mode
+SIG_CHARGING_MODE = Signature([0xF8, 0x12, 0x00, 0x20, 0xB1, None, 0xF8, 0x3A, None, None, 0x7b])
+
+# current_raising_coeff / speed_limit_* / ampere_sport
+SIG_SPEED_PARAMS = Signature([0x95, 0xf8, 0x34, None, None, 0x21, 0x4f, 0xf4, 0x96, 0x70])
+SIG_SPEED_PARAMS_242 = Signature([0x85, 0xf8, 0x40, 0x60, 0x95, 0xf8, 0x34, 0x30])
+SIG_SPEED_PARAMS_016 = Signature([0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0])
+SIG_CRC_022 = Signature([0x95, 0xf8, 0x34, 0xc0, 0x4f, 0xf4, 0x96, 0x73])
+
+# speed_limit_drive
+SIG_SL_DRIVE_242 = Signature([0xa1, 0x85, 0x0f, 0x20, 0x20, 0x84])
+SIG_SL_DRIVE_022 = Signature([0x59, 0x00, 0x14, 0x22, 0x46])
+
+# speed_limit_sport
+SIG_SL_SPORT_022 = Signature([0x4f, 0xf0, 0x19, 0x0e, 0x4f, 0xf0, 0x05, 0x09])
+
+# speed_limit_ped
+SIG_SL_PED = Signature([0x4f, 0xf0, 0x05, None, 0x01, None, 0x02, 0xd1])
+SIG_SL_PED_022 = Signature([0x4f, 0xf0, 0x05, 0x09, 0xbc, 0xf1, 0x01, 0x0f])
+
+# motor_start_speed
+SIG_MSS = Signature([0x01, 0x68, 0x40, 0xF2, 0xBD, 0x62])
+SIG_MSS_022 = Signature([0x01, 0x08, 0xb1, 0xf5, 0xff, 0x6f])
+
+# wheel_speed_const
+SIG_WHEEL_SPEED = Signature([0xB4, 0xF9, None, 0x00, 0x40, 0xF2, 0x59, 0x11, 0x48, 0x43])
+SIG_WHEEL_OTHER = Signature([0x60, 0x60, 0x60, 0x68, 0x40, 0xF2, 0x6B, 0x51, 0x48, 0x43])
+SIG_WHEEL_SPEED_022 = Signature([0xA4, 0xF8, 0x4A, 0x50, 0x6F, 0xF4, 0xCC, 0x70])
+SIG_WHEEL_OTHER_022_0 = Signature([0xBD, 0xF9, 0x24, 0x50, 0x40, 0xF2, 0xEE, 0x66])
+SIG_WHEEL_OTHER_022_1 = Signature([0xBD, 0xF9, 0x24, 0x60, 0x40, 0xF2, 0xEE, 0x67])
+
+# ampere_sport
+SIG_AMP_SPORT_NOP = Signature([0x13, 0xD2, None, 0x85, None, 0xE0, None, 0x8E])
+SIG_AMP_SPORT_NOP_242 = Signature([0x88, 0x42, 0x01, 0xd2, 0xa0, 0x85, 0x00, 0xe0])
+SIG_AMP_SPORT_NOP_016 = Signature([0x98, 0x42, 0x01, 0xd2, 0xe0, 0x85, 0x00, 0xe0])
+SIG_AMP_SPORT_NOP_022 = Signature([0x60, 0x86, 0x2d, 0xe0, 0x58, 0x45, 0x01, 0xd2])
+SIG_AMP_SPORT = Signature([None, 0x21, 0x4f, 0xf4, 0x96, 0x70])
+SIG_AMP_SPORT_022 = Signature([0x59, 0x00, None, 0x22, 0x46, 0xf2, 0x84, 0x7b])
+
+# ampere_drive
+SIG_AMP_DRIVE = Signature([0x95, 0xf8, 0x40, None, 0x01, None, 0x06, 0xd0, None, 0x8e])
+SIG_AMP_DRIVE_016 = Signature([0x95, 0xf8, 0x40, 0xc0, 0xbc, 0xf1, 0x01, 0x0f, 0x05, 0xd0])
+SIG_AMP_DRIVE_NOP_242 = Signature([0x88, 0x42, 0x09, 0xd2, 0xa0, 0x85, 0x08, 0xe0])
+
+# ampere_ped
+SIG_AMP_PED = Signature([None, None, 0x41, 0xf6, 0x58, None, None, None, 0x01, 0xd2])
+
+# ampere_max
+SIG_AMP_MAX_PED = Signature([0xa4, 0xf8, None, None, 0x4f, 0xf4, 0xfa])
+SIG_AMP_MAX = Signature([0x02, 0xd0, 0xa4, 0xf8, 0x22, 0x80, None, 0xe0, 0x61, 0x84, None, 0xe0])
+SIG_AMP_MAX_SPORT_242 = Signature([0x95, 0xf8, 0x34, 0x80, 0x4f, 0xf4, 0xfa, 0x43])
+SIG_AMP_MAX_DRIVE_016 = Signature([0x95, 0xf8, 0x43, 0xc0, 0x46, 0xf6, 0x60, 0x50])
+SIG_AMP_MAX_SPORT_016 = Signature([0x95, 0xf8, 0x43, 0xc0, 0x4d, 0xf2, 0xd8, 0x60])
+SIG_AMP_MAX_DRIVE_022 = Signature([0x95, 0xf8, 0x41, 0x00, 0x48, 0xf6, 0xb8, 0x0c])
+SIG_AMP_MAX_SPORT_022 = Signature([0x95, 0xf8, 0x41, 0x30, 0x4d, 0xf2, 0xd8, 0x60])
+
+# dpc
+SIG_DPC = Signature([0x00, 0x21, 0xa1, 0x71, 0xa2, 0xf8, 0xec, 0x10, 0x63, 0x79])
+SIG_DPC_022 = Signature([0xdf, 0xf8, 0x28, 0x91, 0xa9, 0xf8, 0xec, 0x70, 0x69, 0x79])
+SIG_DPC_RESET = Signature([0xf8, 0xe2, None, None, 0xf8, 0xf0, None, None, 0xf8, 0xee, None])
+
+# shutdown_time
+SIG_SHUTDOWN = Signature([0xb0, 0xf5, 0xfa, 0x7f, 0x08, 0xd9, None, 0x79, 0x30, 0xb9])
+
+# ped_noblink
+SIG_PED_NOBLINK = Signature([0x01, 0x29, None, 0xd0, 0xa1, 0x79, None, 0x29, None, 0xd0, 0x90, 0xf8, 0x34, 0x10, None, 0x29])
+SIG_PED_NOBLINK_2 = Signature([0x89, 0x07, 0x02, 0xd5, 0x90, 0xf8, None, 0x10, 0x19, 0xb3, 0x90, 0xf8, 0x34, 0x00, 0x01, 0x28])
+
+# brake_light_static
+SIG_BLM_THROTTLE = Signature([0x01, 0x29, None, 0xd0, 0xa1, 0x79, 0x01, 0x29])
+SIG_BLM_GLOB = Signature([0x90, 0xf8, None, None, 0x00, 0x28, None, 0xd1])
+
+# brake_light
+SIG_BLM_ADDR_1 = Signature([0x10, 0xbd, 0x00, 0x00, None, 0x04, 0x00, 0x20, 0x70, 0xb5])
+SIG_BLM_ADDR_2 = Signature([None, 0x00, 0x00, 0x20, None, 0x06, 0x00, 0x20, None, 0x03, 0x00, 0x20])
+SIG_BLM = Signature([0x90, 0xf8, None, None, None, 0x28, None, 0xd1])
+SIG_BLM_242 = Signature([0xa0, 0x7d, 0x40, 0x1c, 0xc0, 0xb2, 0xa0, 0x75])
+
+# region_free
+SIG_RFM_1 = Signature([0x81, 0xf8, 0x43, 0x20])  # STRB.W R2,[R1,#0x43]
+SIG_RFM_2 = Signature([0x8a, 0x77])  # STRB R2,[R1,#0x1e]
+SIG_RFM_3 = Signature([0x81, 0xf8, 0x41, 0x20])  # STRB.W R2,[R1,#0x41]
+SIG_RFM_CC_022 = Signature([0xa5, 0xf8, 0xee, 0x80])  # STRH.W r8,[r5,#0xee]
+SIGS_RFM_FLAGS_022 = [
+    Signature([0x86, 0xf8, 0x3e, 0x70]),  # STRB.W R7,[R6,#0x3e]
+    Signature([0x86, 0xf8, 0x41, 0x70]),  # STRB.W R7,[R6,#0x41]
+    Signature([0x86, 0xf8, 0x43, 0x70]),  # STRB.W R7,[R6,#0x43]
+    Signature([0x86, 0xf8, 0x44, 0x70]),  # STRB.W R7,[R6,#0x44]
+    Signature([0x86, 0xf8, 0x45, 0x70]),  # STRB.W R7,[R6,#0x45]
+]
+
+# lower_light
+SIG_LOWER_LIGHT = Signature([0x4f, 0xf0, 0x80, 0x40, 0x04, 0xf0, None, None, 0x20, 0x88])
+
+# ampere_meter
+SIG_AMPERE_METER = Signature([None, 0x79, None, 0x49, 0x10, 0xb9, 0xfd, 0xf7, None, None, 0x48, 0x70])
+
+# cc_delay
+SIG_CC_DELAY = Signature([0xb0, 0xf8, 0xf8, 0x10, None, 0x4b, 0x4f, 0xf4, 0x7a, 0x70])
+SIG_CC_DELAY_022 = Signature([0xf8, 0x00, 0x89, 0x46, 0x60, 0x4b, 0x4f, 0xf4, 0x7a, 0x71])
+
+# lever_resolution
+SIG_LEVER_BRAKE = Signature(bytes.fromhex("732800dd7320"))
+
+# bms_baudrate
+SIG_BMS_BAUDRATE = Signature([0x00, 0xf0, 0xe6, 0xf8, 0x00, 0x21, 0x4f, 0xf4, 0xe1, 0x30])
+SIG_BMS_BAUDRATE_022 = Signature([0x20, 0x46, 0x00, 0xf0, 0xa6, 0xfa, 0x4f, 0xf4, 0xe1, 0x30])
+
+# volt_limit
+SIG_VOLT_LIMIT = Signature([0x40, 0xF2, 0xA5, 0x61, 0xA0, 0xF6, 0x28, 0x20, 0x88, 0x42])
+SIG_VOLT_LIMIT_022 = Signature([0x40, 0xf2, 0xa5, 0x61, 0x88, 0x42, 0x04, 0xd3, 0x18, 0x20])
+
+# button_swap
+SIG_BTS_DAT = Signature([None, 0x00, 0x00, 0x20, 0x10, 0xb5, 0x00, 0x23, 0x1a, 0x46, 0x03, 0xe0])
+SIG_BTS_LIGHT = Signature([0x22, 0x71, 0x22, 0x81, 0xb8, 0x78, 0x10, 0xb1, 0xba, 0x70, 0x2a, 0x72,
+                           0x37, 0xe0, 0x64, 0x20, 0xb8, 0x70, 0x2e, 0x72, 0x33, 0xe0])
+SIG_BTS_MODE = Signature([0x22, 0x71, 0x22, 0x81, 0x01, 0x78, 0x21, 0xb1, 0x01, 0x29, 0x07, 0xd0,
+                          0x02, 0x29, 0x10, 0xd1, 0x0a, 0xe0, 0x02, 0x21, 0x01, 0x70, 0x85, 0xf8,
+                          0x3d, 0x60, 0x02, 0xe0, 0x02, 0x70, 0x85, 0xf8, 0x3d, 0x20, 0x85, 0xf8,
+                          0x3c, 0x20, 0x04, 0xe0, 0x06, 0x70, 0x85, 0xf8, 0x3d, 0x20, 0x85, 0xf8,
+                          0x3c, 0x60, 0x22, 0x70, 0xe2, 0x80])
+
+# fake_uid
+SIG_FAKE_UID = Signature([0xfd, 0xf7, None, None, None, 0x48, 0xb0, 0xf9, 0x00, 0x10, 0xb4, 0xf9, 0xb4, 0x21, 0x91, 0x42])
+
+# ampere_brake
+SIG_AMP_BRAKE = Signature([0x00, 0xdd, 0x73, 0x20, None, None, None, None, 0x50, 0x43, 0x73, 0x22, 0x90, 0xfb, 0xf2, 0xf0, None, None, 0x10, 0x1a])
+SIG_AMP_BRAKE_MIN_022 = Signature([0xf2, 0xf0, None, None, 0x10, 0x1a, 0xa0, 0xf5, 0xfa, 0x50])
+
+# kers_multi
+SIG_KERS_MULTI = Signature([0x00, 0xeb, 0x40, 0x00, 0x40, 0x00, 0x05, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0x01, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0x80, 0x00])
+SIG_KERS_MULTI_022 = Signature([0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x55, 0x20, 0x20, 0x86, 0x0a, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x15, 0x20, 0x20, 0x86, 0x04, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0xc0, 0xf3, 0x15, 0x20])
+
+SIGNATURES = [v for k, v in sorted(globals().items()) if k.startswith('SIG_')] + SIGS_RFM_FLAGS_022
+
+# DRV families, told apart by the layout of their speed parameter block
+FAMILIES = [
+    ('default', SIG_SPEED_PARAMS),
+    ('242', SIG_SPEED_PARAMS_242),
+    ('016', SIG_SPEED_PARAMS_016),
+    ('022', SIG_CRC_022),
+]
+
 
 class MiPatcher(BasePatcher):
+    signatures = SIGNATURES
+
     def __init__(self, data, model):
         super().__init__(data, model)
 
@@ -43,6 +201,15 @@ class MiPatcher(BasePatcher):
             }
         }
 
+    def family(self):
+        '''
+        Classify the DRV family, once per image, as reported by /analyze.
+        '''
+        if self._family is None:
+            self._family = next((family for family, sig in FAMILIES
+                                 if self.find_pattern_gracef(sig) != -1), 'unknown')
+        return self._family
+
     def remove_modellock(self):
         '''
         Creator/Author: Turbojeet
@@ -50,13 +217,12 @@ class MiPatcher(BasePatcher):
         '''
         try:
             # 017
-            sig = [0x01, 0xeb, 0x00, 0x0c, 0x13, 0xf8, 0x00, 0x80,
-                   0x9c, 0xf8, 0x04, 0xc0, 0xc4, 0x45]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_MODELLOCK
+            ofs = self.find_pattern(sig) + len(sig)
         except SignatureException:
             # 016 / 252 / 245
-            sig = [None, 0x18, None, 0xf8, 0x00, 0xc0, None, 0x79, None, 0x45]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_MODELLOCK_016
+            ofs = self.find_pattern(sig) + len(sig)
 
         pre = self.data[ofs:ofs+2]
         post = pre.copy()
@@ -71,15 +237,12 @@ class MiPatcher(BasePatcher):
         Creator/Author: Turbojeet
         Description: Alternate (improved) version of No Kers Mod
         '''
-        try:
-            sig = [0x00, 0xeb, 0x80, 0x00, 0x80, 0x00, 0x80, 0x0a]
-            ofs = FindPattern(self.data, sig) + 6
-        except SignatureException:
-            # 022
-            sig = [0x00, 0xdd, 0x80, 0x20, 0xc0, 0x04, 0x00, 0x0c]
-            ofs = FindPattern(self.data, sig) + 6
+        ofs, _ = self.find_variant('no_kers', [
+            ('default', SIG_KERS, 6),
+            ('022', SIG_KERS_022, 6),
+        ])
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('MOVS R0, #0')[0])
+        post = self.asm('MOVS R0, #0')
         self.data[ofs:ofs+2] = post
         return [("no_kers", hex(ofs), pre.hex(), post.hex())]
 
@@ -87,16 +250,11 @@ class MiPatcher(BasePatcher):
         '''
         Creator/Author: BotoX
         '''
-        reg = 12
-        try:
-            sig = [None, 0x68, 0x42, 0xf6, 0x6e, 0x0c]
-            ofs = FindPattern(self.data, sig) + 2
-        except SignatureException:
-            # 022
-            sig = [0x2C, 0xE0, 0x18, 0x68, 0x42, 0xF6, 0xD0, 0x7b]
-            ofs = FindPattern(self.data, sig) + 4
-            reg = 11
-        post = bytes(self.ks.asm(f'MOVW R{reg}, #0xffff')[0])
+        ofs, reg = self.find_variant('no_autobrake', [
+            ('default', SIG_AUTOBRAKE, 2, 12),
+            ('022', SIG_AUTOBRAKE_022, 4, 11),
+        ])
+        post = self.asm(f'MOVW R{reg}, #0xffff')
         pre = self.data[ofs:ofs+4]
         self.data[ofs:ofs+4] = post
         return [("no_autobrake", hex(ofs), pre.hex(), post.hex())]
@@ -105,10 +263,10 @@ class MiPatcher(BasePatcher):
         '''
         Creator/Author: BotoX
         '''
-        sig = [0xF8, 0x12, 0x00, 0x20, 0xB1, None, 0xF8, 0x3A, None, None, 0x7b]
-        ofs = FindPattern(self.data, sig) + 3
+        sig = SIG_CHARGING_MODE
+        ofs = self.find_pattern(sig) + 3
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('NOP')[0])
+        post = self.asm('NOP')
         self.data[ofs:ofs+2] = post
         return [("no_charge", hex(ofs), pre.hex(), post.hex())]
 
@@ -119,30 +277,15 @@ class MiPatcher(BasePatcher):
         ret = []
 
         # TODO: all trying to find same position
-        reg = 0
-        try:
-            sig = [0x95, 0xf8, 0x34, None, None, 0x21, 0x4f, 0xf4, 0x96, 0x70]
-            ofs = FindPattern(self.data, sig) + 6
-        except SignatureException:
-            try:
-                # 242
-                sig = [0x85, 0xf8, 0x40, 0x60, 0x95, 0xf8, 0x34, 0x30]
-                ofs = FindPattern(self.data, sig) + 0x8
-                reg = 2
-            except SignatureException:
-                try:
-                    # 016
-                    sig = [0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0]
-                    ofs = FindPattern(self.data, sig) + 0xa
-                    reg = 1
-                except SignatureException:
-                    # 022
-                    sig = [0x95, 0xf8, 0x34, 0xc0, 0x4f, 0xf4, 0x96, 0x73]
-                    ofs = FindPattern(self.data, sig) + 4
-                    reg = 3
+        ofs, reg = self.find_variant('crc', [
+            ('default', SIG_SPEED_PARAMS, 6, 0),
+            ('242', SIG_SPEED_PARAMS_242, 0x8, 2),
+            ('016', SIG_SPEED_PARAMS_016, 0xa, 1),
+            ('022', SIG_CRC_022, 4, 3),
+        ])
 
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('MOVW R{}, #{}'.format(reg, coeff))[0])
+        post = self.asm('MOVW R{}, #{}'.format(reg, coeff))
         self.data[ofs:ofs+4] = post
         ret.append(["crc", hex(ofs), pre.hex(), post.hex()])
         return ret
@@ -154,30 +297,15 @@ class MiPatcher(BasePatcher):
         ret = []
 
         # TODO: first two trying to find same position
-        try:
-            sig = [0x95, 0xf8, 0x34, None, None, 0x21, 0x4f, 0xf4, 0x96, 0x70]
-            ofs = FindPattern(self.data, sig) + 4
-            reg = 1
-        except SignatureException:
-            try:
-                # 016
-                sig = [0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0]
-                ofs = FindPattern(self.data, sig) + 0x8
-                reg = 2
-            except SignatureException:
-                try:
-                    # 242
-                    sig = [0xa1, 0x85, 0x0f, 0x20, 0x20, 0x84]
-                    ofs = FindPattern(self.data, sig) + 2
-                    reg = 0
-                except SignatureException:
-                    # 022
-                    sig = [0x59, 0x00, 0x14, 0x22, 0x46]
-                    ofs = FindPattern(self.data, sig) + 2
-                    reg = 2
+        ofs, reg = self.find_variant('sl_drive', [
+            ('default', SIG_SPEED_PARAMS, 4, 1),
+            ('016', SIG_SPEED_PARAMS_016, 0x8, 2),
+            ('242', SIG_SL_DRIVE_242, 2, 0),
+            ('022', SIG_SL_DRIVE_022, 2, 2),
+        ])
 
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('MOVS R{}, #{}'.format(reg, kmh))[0])
+        post = self.asm('MOVS R{}, #{}'.format(reg, kmh))
         self.data[ofs:ofs+2] = post
         ret.append(["sl_drive", hex(ofs), pre.hex(), post.hex()])
 
@@ -190,31 +318,17 @@ class MiPatcher(BasePatcher):
         ret = []
 
         # TODO: all trying to find same position
-        reg = 8
-        try:
-            # for 319 this moved to the top and 'movs' became 'mov.w'
-            sig = [0x95, 0xf8, 0x34, None, None, 0x21, 0x4f, 0xf4, 0x96, 0x70]
-            ofs = FindPattern(self.data, sig) + 0xe
-        except SignatureException:
-            try:
-                # 242
-                sig = [0x85, 0xf8, 0x40, 0x60, 0x95, 0xf8, 0x34, 0x30]
-                ofs = FindPattern(self.data, sig) + 0xc
-                reg = 12
-            except SignatureException:
-                try:
-                    # 016
-                    sig = [0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0]
-                    ofs = FindPattern(self.data, sig) + 0x12
-                except SignatureException:
-                    # 022
-                    sig = [0x4f, 0xf0, 0x19, 0x0e, 0x4f, 0xf0, 0x05, 0x09]
-                    ofs = FindPattern(self.data, sig)
-                    reg = 14
+        # for 319 this moved to the top and 'movs' became 'mov.w'
+        ofs, reg = self.find_variant('sl_speed', [
+            ('default', SIG_SPEED_PARAMS, 0xe, 8),
+            ('242', SIG_SPEED_PARAMS_242, 0xc, 12),
+            ('016', SIG_SPEED_PARAMS_016, 0x12, 8),
+            ('022', SIG_SL_SPORT_022, 0, 14),
+        ])
 
         pre = self.data[ofs:ofs+4]
         assert pre[-1] == reg
-        post = bytes(self.ks.asm('MOVW R{}, #{}'.format(reg, kmh))[0])
+        post = self.asm('MOVW R{}, #{}'.format(reg, kmh))
         self.data[ofs:ofs+4] = post
         ret.append(["sl_speed", hex(ofs), pre.hex(), post.hex()])
 
@@ -228,22 +342,15 @@ class MiPatcher(BasePatcher):
         ret = []
 
         # TODO: both trying to find same position
-        try:
-            sig = [0x4f, 0xf0, 0x05, None, 0x01, None, 0x02, 0xd1]
-            ofs = FindPattern(self.data, sig)
-        except SignatureException:
-            try:
-                # 016
-                sig = [0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0]
-                ofs = FindPattern(self.data, sig) + 0x16
-            except SignatureException:
-                # 0x22
-                sig = [0x4f, 0xf0, 0x05, 0x09, 0xbc, 0xf1, 0x01, 0x0f]
-                ofs = FindPattern(self.data, sig)
+        ofs, _ = self.find_variant('sl_ped', [
+            ('default', SIG_SL_PED, 0),
+            ('016', SIG_SPEED_PARAMS_016, 0x16),
+            ('022', SIG_SL_PED_022, 0),
+        ])
 
         pre = self.data[ofs:ofs+4]
         reg = pre[-1]
-        post = bytes(self.ks.asm('MOVW R{}, #{}'.format(reg, kmh))[0])
+        post = self.asm('MOVW R{}, #{}'.format(reg, kmh))
         self.data[ofs:ofs+4] = post
         ret.append(["sl_ped", hex(ofs), pre.hex(), post.hex()])
 
@@ -254,16 +361,16 @@ class MiPatcher(BasePatcher):
         Creator/Author: BotoX
         '''
         try:
-            sig = [0x01, 0x68, 0x40, 0xF2, 0xBD, 0x62]
-            ofs = FindPattern(self.data, sig) + 2
+            sig = SIG_MSS
+            ofs = self.find_pattern(sig) + 2
             val = struct.pack('<H', round(kmh * 345))
             pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
         except SignatureException:
             # 022
-            sig = [0x01, 0x08, 0xb1, 0xf5, 0xff, 0x6f]
-            ofs = FindPattern(self.data, sig) + 2
+            sig = SIG_MSS_022
+            ofs = self.find_pattern(sig) + 2
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm("CMP.W R1, #{}".format(round(kmh*408)))[0])
+            post = self.asm("CMP.W R1, #{}".format(round(kmh*408)))
             self.data[ofs:ofs+4] = post
         return [("mss", hex(ofs), pre.hex(), post.hex())]
 
@@ -274,8 +381,8 @@ class MiPatcher(BasePatcher):
         ret = []
 
         try:
-            sig = [0xB4, 0xF9, None, 0x00, 0x40, 0xF2, 0x59, 0x11, 0x48, 0x43]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_WHEEL_SPEED
+            ofs = self.find_pattern(sig) + 4
 
             val1 = struct.pack('<H', round(345/factor))
             val2 = struct.pack('<H', round(1387*factor))
@@ -289,35 +396,35 @@ class MiPatcher(BasePatcher):
                 pre, post = PatchImm(self.data, ofs, 4, val1, MOVW_T3_IMM)
                 ret.append(["wheel_speed_const_1", hex(ofs), pre.hex(), post.hex()])
 
-            sig = [0x60, 0x60, 0x60, 0x68, 0x40, 0xF2, 0x6B, 0x51, 0x48, 0x43]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_WHEEL_OTHER
+            ofs = self.find_pattern(sig) + 4
             pre, post = PatchImm(self.data, ofs, 4, val2, MOVW_T3_IMM)
             ret.append(["wheel_other_const", hex(ofs), pre.hex(), post.hex()])
         except SignatureException:
             # 022
-            sig = [0xA4, 0xF8, 0x4A, 0x50, 0x6F, 0xF4, 0xCC, 0x70]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_WHEEL_SPEED_022
+            ofs = self.find_pattern(sig) + 4
 
             val1 = int(round(408/factor))
             # TODO: val1 can be incompatible with MVN instruction
             val2 = int(round(1774*factor))
 
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm(f'MVN R0,#{val1}')[0])
+            post = self.asm(f'MVN R0,#{val1}')
             self.data[ofs:ofs+4] = post
             ret.append(['wheel_speed_const_0', hex(ofs), pre.hex(), post.hex()])
 
-            sig = [0xBD, 0xF9, 0x24, 0x50, 0x40, 0xF2, 0xEE, 0x66]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_WHEEL_OTHER_022_0
+            ofs = self.find_pattern(sig) + 4
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm(f'MOVW R6,#{val2}')[0])
+            post = self.asm(f'MOVW R6,#{val2}')
             self.data[ofs:ofs+4] = post
             ret.append(["wheel_other_const_0", hex(ofs), pre.hex(), post.hex()])
 
-            sig = [0xBD, 0xF9, 0x24, 0x60, 0x40, 0xF2, 0xEE, 0x67]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_WHEEL_OTHER_022_1
+            ofs = self.find_pattern(sig) + 4
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm(f"MOVW R7,#{val2}")[0])
+            post = self.asm(f"MOVW R7,#{val2}")
             ret.append(["wheel_other_const_1", hex(ofs), pre.hex(), post.hex()])
 
         return ret
@@ -331,46 +438,24 @@ class MiPatcher(BasePatcher):
         val = struct.pack('<H', amps)
 
         if force:
-            try:
-                sig = [0x13, 0xD2, None, 0x85, None, 0xE0, None, 0x8E]
-                ofs = FindPattern(self.data, sig) + 8
-            except SignatureException:
-                try:
-                    # 242
-                    sig = [0x88, 0x42, 0x01, 0xd2, 0xa0, 0x85, 0x00, 0xe0]
-                    ofs = FindPattern(self.data, sig)
-                except SignatureException:
-                    try:
-                        # 016
-                        sig = [0x98, 0x42, 0x01, 0xd2, 0xe0, 0x85, 0x00, 0xe0]
-                        ofs = FindPattern(self.data, sig)
-                    except SignatureException:
-                        # 022
-                        sig = [0x60, 0x86, 0x2d, 0xe0, 0x58, 0x45, 0x01, 0xd2]
-                        ofs = FindPattern(self.data, sig) + 4
+            ofs, _ = self.find_variant('amp_speed_nop', [
+                ('default', SIG_AMP_SPORT_NOP, 8),
+                ('242', SIG_AMP_SPORT_NOP_242, 0),
+                ('016', SIG_AMP_SPORT_NOP_016, 0),
+                ('022', SIG_AMP_SPORT_NOP_022, 4),
+            ])
 
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('CMP R0, R0')[0])
+            post = self.asm('CMP R0, R0')
             self.data[ofs:ofs+2] = post
             ret.append(["amp_speed_nop", hex(ofs), pre.hex(), post.hex()])
 
-        try:
-            sig = [None, 0x21, 0x4f, 0xf4, 0x96, 0x70]
-            ofs = FindPattern(self.data, sig) + 6
-        except SignatureException:
-            try:
-                # 242
-                sig = [0x85, 0xf8, 0x40, 0x60, 0x95, 0xf8, 0x34, 0x30]
-                ofs = FindPattern(self.data, sig) + 0x10
-            except SignatureException:
-                try:
-                    # 016
-                    sig = [0x00, 0xe0, 0x2e, 0x72, 0x95, 0xf8, 0x34, 0xc0]
-                    ofs = FindPattern(self.data, sig) + 0xe
-                except SignatureException:
-                    # 022
-                    sig = [0x59, 0x00, None, 0x22, 0x46, 0xf2, 0x84, 0x7b]
-                    ofs = FindPattern(self.data, sig) + 4
+        ofs, _ = self.find_variant('amp_speed', [
+            ('default', SIG_AMP_SPORT, 6),
+            ('242', SIG_SPEED_PARAMS_242, 0x10),
+            ('016', SIG_SPEED_PARAMS_016, 0xe),
+            ('022', SIG_AMP_SPORT_022, 4),
+        ])
 
         pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
         ret.append(["amp_speed", hex(ofs), pre.hex(), post.hex()])
@@ -385,28 +470,21 @@ class MiPatcher(BasePatcher):
 
         val = struct.pack('<H', amps)
 
-        try:
-            sig = [0x95, 0xf8, 0x40, None, 0x01, None, 0x06, 0xd0, None, 0x8e]
-            ofs = FindPattern(self.data, sig) + 0xa
+        # 242: drive has same amps as speed
+        ofs, own_amps = self.find_variant('amp_drive', [
+            ('default', SIG_AMP_DRIVE, 0xa, True),
+            ('016', SIG_AMP_DRIVE_016, len(SIG_AMP_DRIVE_016), True),
+            ('242', SIG_AMP_DRIVE_NOP_242, 0, False),
+        ])
+        ofs_f = ofs
+        if own_amps:
             pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
             ret.append(["amp_drive", hex(ofs), pre.hex(), post.hex()])
             ofs_f = ofs + 4
-        except SignatureException:
-            try:
-                # 016
-                sig = [0x95, 0xf8, 0x40, 0xc0, 0xbc, 0xf1, 0x01, 0x0f, 0x05, 0xd0]
-                ofs = FindPattern(self.data, sig) + len(sig)
-                pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
-                ret.append(["amp_drive", hex(ofs), pre.hex(), post.hex()])
-                ofs_f = ofs + 4
-            except SignatureException:
-                # 242: drive has same amps as speed
-                sig = [0x88, 0x42, 0x09, 0xd2, 0xa0, 0x85, 0x08, 0xe0]
-                ofs_f = FindPattern(self.data, sig)
 
         if force:
             pre = self.data[ofs_f:ofs_f+2]
-            post = bytes(self.ks.asm('CMP R0, R0')[0])
+            post = self.asm('CMP R0, R0')
             self.data[ofs_f:ofs_f+2] = post
             ret.append(["amp_drive_nop", hex(ofs_f), pre.hex(), post.hex()])
 
@@ -421,8 +499,8 @@ class MiPatcher(BasePatcher):
 
         val = struct.pack('<H', amps)
 
-        sig = [None, None, 0x41, 0xf6, 0x58, None, None, None, 0x01, 0xd2]
-        ofs = FindPattern(self.data, sig) + 2
+        sig = SIG_AMP_PED
+        ofs = self.find_pattern(sig) + 2
 
         pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
         ret.append(["amp_ped", hex(ofs), pre.hex(), post.hex()])
@@ -430,7 +508,7 @@ class MiPatcher(BasePatcher):
         if force:
             ofs += 4
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('CMP R0, R0')[0])
+            post = self.asm('CMP R0, R0')
             self.data[ofs:ofs+2] = post
             ret.append(["amp_ped_nop", hex(ofs), pre.hex(), post.hex()])
 
@@ -442,13 +520,13 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
 
-        sig = [0xa4, 0xf8, None, None, 0x4f, 0xf4, 0xfa]
-        ofs_p = FindPattern(self.data, sig) + 4
+        sig = SIG_AMP_MAX_PED
+        ofs_p = self.find_pattern(sig) + 4
 
         reg = 0
         try:
-            sig = [0x02, 0xd0, 0xa4, 0xf8, 0x22, 0x80, None, 0xe0, 0x61, 0x84, None, 0xe0]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_MAX
+            ofs = self.find_pattern(sig)
 
             b = self.data[ofs_p+3]
             if b == 0x52:  # 247
@@ -465,57 +543,57 @@ class MiPatcher(BasePatcher):
             if amps_ped is not None:
                 #pre, post = PatchImm(self.data, ofs, 4, val_ped, MOVW_T3_IMM)
                 pre = self.data[ofs_p:ofs_p+4]
-                post = bytes(self.ks.asm('MOVW R{},#{}'.format(reg, amps_ped))[0])
+                post = self.asm('MOVW R{},#{}'.format(reg, amps_ped))
                 self.data[ofs_p:ofs_p+4] = post
                 ret.append(["amp_max_ped", hex(ofs_p), pre.hex(), post.hex()])
 
             if amps_drive is not None:
                 #pre, post = PatchImm(self.data, ofs, 4, val_drive, MOVW_T3_IMM)
                 pre = self.data[ofs_d:ofs_d+4]
-                post = bytes(self.ks.asm('MOVW R{},#{}'.format(reg, amps_drive))[0])
+                post = self.asm('MOVW R{},#{}'.format(reg, amps_drive))
                 self.data[ofs_d:ofs_d+4] = post
                 ret.append(["amp_max_drive", hex(ofs_d), pre.hex(), post.hex()])
         except SignatureException:
             # 242 / 016
             if amps_ped is not None:
                 pre = self.data[ofs_p:ofs_p+4]
-                post = bytes(self.ks.asm('MOVW R{},#{}'.format(reg, amps_ped))[0])
+                post = self.asm('MOVW R{},#{}'.format(reg, amps_ped))
                 self.data[ofs_p:ofs_p+4] = post
                 ret.append(["amp_max_ped", hex(ofs_p), pre.hex(), post.hex()])
 
             try:
                 # 242
-                sig = [0x95, 0xf8, 0x34, 0x80, 0x4f, 0xf4, 0xfa, 0x43]
-                ofs_s = FindPattern(self.data, sig) + 4
+                sig = SIG_AMP_MAX_SPORT_242
+                ofs_s = self.find_pattern(sig) + 4
                 reg = 3  # TODO: cleanup
             except SignatureException:
                 try:
                     # 016
-                    sig = [0x95, 0xf8, 0x43, 0xc0, 0x46, 0xf6, 0x60, 0x50]
-                    ofs_d = FindPattern(self.data, sig) + 4
+                    sig = SIG_AMP_MAX_DRIVE_016
+                    ofs_d = self.find_pattern(sig) + 4
 
-                    sig = [0x95, 0xf8, 0x43, 0xc0, 0x4d, 0xf2, 0xd8, 0x60]
-                    ofs_s = FindPattern(self.data, sig) + 4
+                    sig = SIG_AMP_MAX_SPORT_016
+                    ofs_s = self.find_pattern(sig) + 4
                 except SignatureException:
                     # 022
-                    sig = [0x95, 0xf8, 0x41, 0x00, 0x48, 0xf6, 0xb8, 0x0c]
-                    ofs_d = FindPattern(self.data, sig) + 4
+                    sig = SIG_AMP_MAX_DRIVE_022
+                    ofs_d = self.find_pattern(sig) + 4
 
-                    sig = [0x95, 0xf8, 0x41, 0x30, 0x4d, 0xf2, 0xd8, 0x60]
-                    ofs_s = FindPattern(self.data, sig) + 4
+                    sig = SIG_AMP_MAX_SPORT_022
+                    ofs_s = self.find_pattern(sig) + 4
 
                 if amps_drive is not None:
                     pre = self.data[ofs_d:ofs_d+4]
                     reg_d = reg
                     if pre[-1] == 12:
                         reg_d = 12
-                    post = bytes(self.ks.asm('MOVW R{},#{}'.format(reg_d, amps_drive))[0])
+                    post = self.asm('MOVW R{},#{}'.format(reg_d, amps_drive))
                     self.data[ofs_d:ofs_d+4] = post
                     ret.append(["amp_max_drive", hex(ofs_d), pre.hex(), post.hex()])
         if amps_sport is not None:
             #pre, post = PatchImm(self.data, ofs, 4, val_speed, MOVW_T3_IMM)
             pre = self.data[ofs_s:ofs_s+4]
-            post = bytes(self.ks.asm('MOVW R{},#{}'.format(reg, amps_sport))[0])
+            post = self.asm('MOVW R{},#{}'.format(reg, amps_sport))
             self.data[ofs_s:ofs_s+4] = post
             ret.append(["amp_max_speed", hex(ofs_s), pre.hex(), post.hex()])
 
@@ -527,21 +605,21 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
         try:
-            sig = [0x00, 0x21, 0xa1, 0x71, 0xa2, 0xf8, 0xec, 0x10, 0x63, 0x79]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_DPC
+            ofs = self.find_pattern(sig) + 4
         except SignatureException:
             # 022
-            sig = [0xdf, 0xf8, 0x28, 0x91, 0xa9, 0xf8, 0xec, 0x70, 0x69, 0x79]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_DPC_022
+            ofs = self.find_pattern(sig) + 4
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('NOP')[0])
+        post = self.asm('NOP')
         self.data[ofs:ofs+2] = post
         self.data[ofs+2:ofs+4] = post
         post = self.data[ofs:ofs+4]
         ret.append(["dpc_nop", hex(ofs), pre.hex(), post.hex()])
 
-        sig = [0xf8, 0xe2, None, None, 0xf8, 0xf0, None, None, 0xf8, 0xee, None]
-        ofs = FindPattern(self.data, sig) + 3
+        sig = SIG_DPC_RESET
+        ofs = self.find_pattern(sig) + 3
 
         b = self.data[ofs+3]
         reg = 0
@@ -564,7 +642,7 @@ class MiPatcher(BasePatcher):
             raise Exception(f"Invalid firmware file: {hex(b)}")
 
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('STRH.W R{}, [R{}, #0xEC]'.format(reg, reg2))[0])
+        post = self.asm('STRH.W R{}, [R{}, #0xEC]'.format(reg, reg2))
         self.data[ofs:ofs+4] = post
         ret.append(["dpc_reset", hex(ofs), pre.hex(), post.hex()])
 
@@ -577,10 +655,10 @@ class MiPatcher(BasePatcher):
         '''
         delay = int(seconds * 200)
         assert delay.bit_length() <= 12, 'bit length overflow'
-        sig = [0xb0, 0xf5, 0xfa, 0x7f, 0x08, 0xd9, None, 0x79, 0x30, 0xb9]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_SHUTDOWN
+        ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('CMP.W R0, #{:n}'.format(delay))[0])
+        post = self.asm('CMP.W R0, #{:n}'.format(delay))
         self.data[ofs:ofs+4] = post
         return [("shutdown", hex(ofs), pre.hex(), post.hex())]
 
@@ -591,20 +669,20 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
 
-        sig = [0x01, 0x29, None, 0xd0, 0xa1, 0x79, None, 0x29, None, 0xd0, 0x90, 0xf8, 0x34, 0x10, None, 0x29]
-        ofs = FindPattern(self.data, sig) + len(sig)
+        sig = SIG_PED_NOBLINK
+        ofs = self.find_pattern(sig) + len(sig)
 
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('NOP')[0])
+        post = self.asm('NOP')
         self.data[ofs:ofs+2] = post
         ret.append(["pnb", hex(ofs), pre.hex(), post.hex()])
 
         try:
             #ofs += 30
-            sig = [0x89, 0x07, 0x02, 0xd5, 0x90, 0xf8, None, 0x10, 0x19, 0xb3, 0x90, 0xf8, 0x34, 0x00, 0x01, 0x28]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_PED_NOBLINK_2
+            ofs = self.find_pattern(sig) + len(sig)
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('NOP')[0])
+            post = self.asm('NOP')
             self.data[ofs:ofs+2] = post
             ret.append(["pnb2", hex(ofs), pre.hex(), post.hex()])
         except SignatureException:
@@ -620,23 +698,23 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
 
-        sig = [0x01, 0x29, None, 0xd0, 0xa1, 0x79, 0x01, 0x29]
-        ofs = FindPattern(self.data, sig) + 6
+        sig = SIG_BLM_THROTTLE
+        ofs = self.find_pattern(sig) + 6
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('CMP R1, #0xff')[0])
+        post = self.asm('CMP R1, #0xff')
         self.data[ofs:ofs+2] = post
         ret.append(["blm_throttle", hex(ofs), pre.hex(), post.hex()])
 
         ofs += 8
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('CMP R1, #0xff')[0])
+        post = self.asm('CMP R1, #0xff')
         self.data[ofs:ofs+2] = post
         ret.append(["blm_ped", hex(ofs), pre.hex(), post.hex()])
 
-        sig = [0x90, 0xf8, None, None, 0x00, 0x28, None, 0xd1]
-        ofs = FindPattern(self.data, sig) + 4
+        sig = SIG_BLM_GLOB
+        ofs = self.find_pattern(sig) + 4
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm('CMP R0, #0xff')[0])
+        post = self.asm('CMP R0, #0xff')
         self.data[ofs:ofs+2] = post
         ret.append(["blm_glob", hex(ofs), pre.hex(), post.hex()])
 
@@ -650,13 +728,13 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
 
-        sig = [0x10, 0xbd, 0x00, 0x00, None, 0x04, 0x00, 0x20, 0x70, 0xb5]
-        ofs = FindPattern(self.data, sig) + 4
+        sig = SIG_BLM_ADDR_1
+        ofs = self.find_pattern(sig) + 4
         ofs_1 = self.data[ofs:ofs+4]
         ofs_1 = struct.unpack("<L", ofs_1)[0]
 
-        sig = [None, 0x00, 0x00, 0x20, None, 0x06, 0x00, 0x20, None, 0x03, 0x00, 0x20]
-        ofs = FindPattern(self.data, sig) + 0x8
+        sig = SIG_BLM_ADDR_2
+        ofs = self.find_pattern(sig) + 0x8
         ofs_2 = self.data[ofs:ofs+4]
         ofs_2 = struct.unpack("<L", ofs_2)[0]
         adds = ofs_1 - ofs_2
@@ -664,21 +742,20 @@ class MiPatcher(BasePatcher):
         ofs = 0
         len_ = 46
         try:
-            sig = [0x90, 0xf8, None, None, None, 0x28, None, 0xd1]
-            ofs = FindPattern(self.data, sig) + 0x8
+            sig = SIG_BLM
+            ofs = self.find_pattern(sig) + 0x8
         except SignatureException:
             pass
 
         if not (ofs > 0 and ofs < 0x1000):
             # 242 / 245
-            sig = [0xa0, 0x7d, 0x40, 0x1c, 0xc0, 0xb2, 0xa0, 0x75]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_BLM_242
+            ofs = self.find_pattern(sig)
 
         # smash stuff
         pre = self.data[ofs:ofs+len_]
         nopcount = ((len_ - 4) // 2)
-        post = bytes(self.ks.asm('NOP')[0] * nopcount
-                     + self.ks.asm('POP.W {R4, R5, R6, PC}')[0])
+        post = self.asm('NOP') * nopcount + self.asm('POP.W {R4, R5, R6, PC}')
         assert len(post) == len_, len(post)
         self.data[ofs:ofs+len_] = post
 
@@ -696,7 +773,7 @@ class MiPatcher(BasePatcher):
         strh       r1,[r5,#0]
         """.format(adds)
 
-        patch = bytes(self.ks.asm(asm)[0])
+        patch = self.asm(asm)
         self.data[ofs:ofs+len(patch)] = patch
         post = self.data[ofs:ofs+len_]
         ret.append(["blm", hex(ofs), pre.hex(), post.hex()])
@@ -710,50 +787,48 @@ class MiPatcher(BasePatcher):
         ret = []
 
         try:
-            sig = self.ks.asm('STRB.W R2,[R1,#0x43]')[0]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_RFM_1
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm('NOP')[0])
+            post = self.asm('NOP')
             self.data[ofs:ofs+2] = post
             self.data[ofs+2:ofs+4] = post
             post = self.data[ofs:ofs+4]
             ret.append(["rfm1", hex(ofs), pre.hex(), post.hex()])
 
             # 248 / 321 (unused in 016)
-            sig = self.ks.asm('STRB R2,[R1,#0x1e]')[0]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_RFM_2
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('NOP')[0])
+            post = self.asm('NOP')
             self.data[ofs:ofs+2] = post
             post = self.data[ofs:ofs+2]
             ret.append(["rfm2", hex(ofs), pre.hex(), post.hex()])
 
             # 016 (unused in 248 / 321)
-            sig = self.ks.asm('STRB.W R2,[R1,#0x41]')[0]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_RFM_3
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm('NOP')[0])
+            post = self.asm('NOP')
             self.data[ofs:ofs+2] = post
             self.data[ofs+2:ofs+4] = post
             post = self.data[ofs:ofs+4]
             ret.append(["rfm3", hex(ofs), pre.hex(), post.hex()])
         except SignatureException:
             # 022
-            flag_offsets = [0x3e, 0x41, 0x43, 0x44, 0x45]
-            for i, f_ofs in enumerate(flag_offsets):
-                sig = self.ks.asm(f"STRB.W R7,[R6,#{f_ofs}]")[0]
-                ofs = FindPattern(self.data, sig)
+            for i, sig in enumerate(SIGS_RFM_FLAGS_022):
+                ofs = self.find_pattern(sig)
                 pre = self.data[ofs:ofs+4]
-                post = bytes(self.ks.asm('NOP.W')[0])
+                post = self.asm('NOP.W')
                 self.data[ofs:ofs+4] = post
                 post = self.data[ofs:ofs+4]
                 ret.append([f"rfm_{i}", hex(ofs), pre.hex(), post.hex()])
 
             # set CC on
-            sig = self.ks.asm("STRH.W r8,[r5,#0xee]")[0]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_RFM_CC_022
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm('STRH.W r7,[r5,#0xf8]')[0])
+            post = self.asm('STRH.W r7,[r5,#0xf8]')
             self.data[ofs:ofs+4] = post
             ret.append(["rfm_cc", hex(ofs), pre.hex(), post.hex()])
 
@@ -765,22 +840,22 @@ class MiPatcher(BasePatcher):
         Description: Lowers light intensity, for auto-light effect
         '''
         ret = []
-        sig = [0x4f, 0xf0, 0x80, 0x40, 0x04, 0xf0, None, None, 0x20, 0x88]
-        ofs = FindPattern(self.data, sig) + 0xa
+        sig = SIG_LOWER_LIGHT
+        ofs = self.find_pattern(sig) + 0xa
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm("adds r0,#1")[0])
+        post = self.asm("adds r0,#1")
         self.data[ofs:ofs+2] = post
         ret.append(["lower_light_step", hex(ofs), pre.hex(), post.hex()])
 
         ofs += 6
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm("cmp r0,#5")[0])
+        post = self.asm("cmp r0,#5")
         self.data[ofs:ofs+2] = post
         ret.append(["lower_light_cmp", hex(ofs), pre.hex(), post.hex()])
 
         ofs += 4
         pre = self.data[ofs:ofs+2]
-        post = bytes(self.ks.asm("movs r0,#5")[0])
+        post = self.asm("movs r0,#5")
         self.data[ofs:ofs+2] = post
         ret.append(["lower_light_max", hex(ofs), pre.hex(), post.hex()])
 
@@ -806,10 +881,10 @@ class MiPatcher(BasePatcher):
             0xa8: [0x9c, 5, -0x10],  # 319
         }
 
-        sig = [None, 0x79, None, 0x49, 0x10, 0xb9, 0xfd, 0xf7, None, None, 0x48, 0x70]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_AMPERE_METER
+        ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+0xa]
-        post = bytes(self.ks.asm(asm.format(*addr_table[pre[0]], shift))[0])
+        post = self.asm(asm.format(*addr_table[pre[0]], shift))
         self.data[ofs:ofs+0xa] = post
         ret.append(["ampere_meter", hex(ofs), pre.hex(), post.hex()])
 
@@ -825,15 +900,15 @@ class MiPatcher(BasePatcher):
 
         reg = 0
         try:
-            sig = [0xb0, 0xf8, 0xf8, 0x10, None, 0x4b, 0x4f, 0xf4, 0x7a, 0x70]
-            ofs = FindPattern(self.data, sig) + 6
+            sig = SIG_CC_DELAY
+            ofs = self.find_pattern(sig) + 6
         except SignatureException:
             # 022
-            sig = [0xf8, 0x00, 0x89, 0x46, 0x60, 0x4b, 0x4f, 0xf4, 0x7a, 0x71]
-            ofs = FindPattern(self.data, sig) + 6
+            sig = SIG_CC_DELAY_022
+            ofs = self.find_pattern(sig) + 6
             reg = 1
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('MOV.W R{},#{}'.format(reg, delay))[0])
+        post = self.asm('MOV.W R{},#{}'.format(reg, delay))
         self.data[ofs:ofs+4] = post
         ret.append(["cc_delay", hex(ofs), pre.hex(), post.hex()])
 
@@ -846,22 +921,22 @@ class MiPatcher(BasePatcher):
         ret = []
 
         if brake != 0x73:
-            sig = bytes.fromhex("732800dd7320")
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_LEVER_BRAKE
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('cmp r0,#{}'.format(brake))[0])
+            post = self.asm('cmp r0,#{}'.format(brake))
             self.data[ofs:ofs+2] = post
             ret.append(["lever_res_brake1", hex(ofs), pre.hex(), post.hex()])
 
             ofs += 4
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('movs r0,#{}'.format(brake))[0])
+            post = self.asm('movs r0,#{}'.format(brake))
             self.data[ofs:ofs+2] = post
             ret.append(["lever_res_brake2", hex(ofs), pre.hex(), post.hex()])
 
             ofs += 8
             pre = self.data[ofs:ofs+2]
-            post = bytes(self.ks.asm('movs r2,#{}'.format(brake))[0])
+            post = self.asm('movs r2,#{}'.format(brake))
             self.data[ofs:ofs+2] = post
             ret.append(["lever_res_brake3", hex(ofs), pre.hex(), post.hex()])
 
@@ -878,14 +953,14 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
         try:
-            sig = [0x00, 0xf0, 0xe6, 0xf8, 0x00, 0x21, 0x4f, 0xf4, 0xe1, 0x30]
-            ofs = FindPattern(self.data, sig) + 6
+            sig = SIG_BMS_BAUDRATE
+            ofs = self.find_pattern(sig) + 6
         except:
             # 022
-            sig = [0x20, 0x46, 0x00, 0xf0, 0xa6, 0xfa, 0x4f, 0xf4, 0xe1, 0x30]
-            ofs = FindPattern(self.data, sig) + 6
+            sig = SIG_BMS_BAUDRATE_022
+            ofs = self.find_pattern(sig) + 6
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('MOV.W R0,#{}'.format(val))[0])
+        post = self.asm('MOV.W R0,#{}'.format(val))
         self.data[ofs:ofs+4] = post
         ret.append(["bms_baudrate", hex(ofs), pre.hex(), post.hex()])
         return ret
@@ -897,12 +972,12 @@ class MiPatcher(BasePatcher):
         ret = []
         val = struct.pack('<H', int(volts * 100) - 2600)
         try:
-            sig = [0x40, 0xF2, 0xA5, 0x61, 0xA0, 0xF6, 0x28, 0x20, 0x88, 0x42]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_VOLT_LIMIT
+            ofs = self.find_pattern(sig)
         except SignatureException:
             # 022
-            sig = [0x40, 0xf2, 0xa5, 0x61, 0x88, 0x42, 0x04, 0xd3, 0x18, 0x20]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_VOLT_LIMIT_022
+            ofs = self.find_pattern(sig)
         pre, post = PatchImm(self.data, ofs, 4, val, MOVW_T3_IMM)
         ret.append(["volt_limit", hex(ofs), pre.hex(), post.hex()])
         return ret
@@ -914,19 +989,14 @@ class MiPatcher(BasePatcher):
         '''
         ret = []
 
-        sig = [None, 0x00, 0x00, 0x20, 0x10, 0xb5, 0x00, 0x23, 0x1a, 0x46, 0x03, 0xe0]
-        ofs_dat = FindPattern(self.data, sig)
+        sig = SIG_BTS_DAT
+        ofs_dat = self.find_pattern(sig)
 
-        sig = [0x22, 0x71, 0x22, 0x81, 0xb8, 0x78, 0x10, 0xb1, 0xba, 0x70, 0x2a, 0x72,
-               0x37, 0xe0, 0x64, 0x20, 0xb8, 0x70, 0x2e, 0x72, 0x33, 0xe0]
-        ofs_light = FindPattern(self.data, sig)
+        sig = SIG_BTS_LIGHT
+        ofs_light = self.find_pattern(sig)
 
-        sig = [0x22, 0x71, 0x22, 0x81, 0x01, 0x78, 0x21, 0xb1, 0x01, 0x29, 0x07, 0xd0,
-               0x02, 0x29, 0x10, 0xd1, 0x0a, 0xe0, 0x02, 0x21, 0x01, 0x70, 0x85, 0xf8,
-               0x3d, 0x60, 0x02, 0xe0, 0x02, 0x70, 0x85, 0xf8, 0x3d, 0x20, 0x85, 0xf8,
-               0x3c, 0x20, 0x04, 0xe0, 0x06, 0x70, 0x85, 0xf8, 0x3d, 0x20, 0x85, 0xf8,
-               0x3c, 0x60, 0x22, 0x70, 0xe2, 0x80]
-        ofs_mode = FindPattern(self.data, sig) - 2
+        sig = SIG_BTS_MODE
+        ofs_mode = self.find_pattern(sig) - 2
 
         diff = ofs_mode - ofs_light
         fofs = diff + 2
@@ -988,8 +1058,8 @@ class MiPatcher(BasePatcher):
              strb       r2,[r4,#0x0]
          EXIT2:
         """
-        post_light = bytes(self.ks.asm(asm_light)[0])
-        post_mode = bytes(self.ks.asm(asm_mode)[0])
+        post_light = self.asm(asm_light)
+        post_mode = self.asm(asm_mode)
         assert len(post_light) == 22
         assert len(post_mode) == 54
 
@@ -1010,8 +1080,8 @@ class MiPatcher(BasePatcher):
         Description: Fake MCU UID
         '''
         ret = []
-        sig = [0xfd, 0xf7, None, None, None, 0x48, 0xb0, 0xf9, 0x00, 0x10, 0xb4, 0xf9, 0xb4, 0x21, 0x91, 0x42]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_FAKE_UID
+        ofs = self.find_pattern(sig)
 
         asm = """
             ldr             r0,[pc, #0x244]
@@ -1040,7 +1110,7 @@ class MiPatcher(BasePatcher):
             nop
         """
 
-        post = bytearray(self.ks.asm(asm)[0])
+        post = bytearray(self.asm(asm))
         pre = self.data[ofs:ofs+len(post)]
 
         # postfix
@@ -1061,26 +1131,26 @@ class MiPatcher(BasePatcher):
         '''
 
         ret = []
-        sig = [0x00, 0xdd, 0x73, 0x20, None, None, None, None, 0x50, 0x43, 0x73, 0x22, 0x90, 0xfb, 0xf2, 0xf0, None, None, 0x10, 0x1a]
+        sig = SIG_AMP_BRAKE
 
-        ofs = FindPattern(self.data, sig) + 4
+        ofs = self.find_pattern(sig) + 4
         if max_ is not None:
             pre = self.data[ofs:ofs+4]
-            post = bytes(self.ks.asm('MOVW R2,#{}'.format(max_))[0])
+            post = self.asm('MOVW R2,#{}'.format(max_))
             self.data[ofs:ofs+4] = post
             ret.append(["abr_max", hex(ofs), pre.hex(), post.hex()])
 
         if min_ is not None:
             try:
                 # 022
-                sig = [0xf2, 0xf0, None, None, 0x10, 0x1a, 0xa0, 0xf5, 0xfa, 0x50]
-                ofs = FindPattern(self.data, sig) + 6
+                sig = SIG_AMP_BRAKE_MIN_022
+                ofs = self.find_pattern(sig) + 6
             except SignatureException:
                 ofs += 18
             pre = self.data[ofs:ofs+4]
             val = NearestConst(min_)
             assert abs(val-min_) < 100, "rounding outside tolerance"
-            post = bytes(self.ks.asm('SUB.W R0,R0,#{}'.format(val))[0])
+            post = self.asm('SUB.W R0,R0,#{}'.format(val))
             self.data[ofs:ofs+4] = post
             ret.append(["abr_min", hex(ofs), pre.hex(), post.hex()])
 
@@ -1107,8 +1177,8 @@ class MiPatcher(BasePatcher):
             MULT:
             muls  r0, r0, r1
             """
-            sig = [0x00, 0xeb, 0x40, 0x00, 0x40, 0x00, 0x05, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0x01, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0x80, 0x00]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_KERS_MULTI
+            ofs = self.find_pattern(sig)
         except SignatureException:
             # 022
             asm = f"""
@@ -1126,11 +1196,11 @@ class MiPatcher(BasePatcher):
             muls  r0, r0, r1
             lsrs    r0, r0, #0xa
             """
-            sig = [0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x55, 0x20, 0x20, 0x86, 0x0a, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x15, 0x20, 0x20, 0x86, 0x04, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0xc0, 0xf3, 0x15, 0x20]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_KERS_MULTI_022
+            ofs = self.find_pattern(sig)
 
         pre = self.data[ofs:ofs+len(sig)]
-        post = bytes(self.ks.asm(asm)[0])
+        post = self.asm(asm)
         assert len(pre) == len(post), f"{len(pre)}, {len(post)}"
         self.data[ofs:ofs+len(sig)] = post
         ret.append(["kers_multi", hex(ofs), pre.hex(), post.hex()])
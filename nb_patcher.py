@@ -18,12 +18,149 @@
 #
 
 import re
+from itertools import islice
 from base_patcher import BasePatcher
-from util import FindPattern, FindPatternGracef, SignatureException
+from util import Signature, SignatureException
 from nb_version_util import NbVersionUtil
 
+# embed_speed_table
+SIG_SPEED_TABLE_ROW_0 = Signature(b''.join(x.to_bytes(4, 'little') for x in [16, 35, 13, 25, 55, 17, 32, 100, 35]))
+
+# disable_custom_enc_key
+SIG_DEFAULT_ENC_KEY = Signature(bytes.fromhex('FE 80 1C B2 D1 EF 41 A6 A4 17 31 F5 A0 68 24 F0'))
+SIG_ENC_KEY_REF = Signature((0x8001420).to_bytes(4, byteorder='little'))
+
+# us_region_spoof
+SIG_US_REGION_FROM_G2 = Signature([
+              0x18, 0x78, 0xFF, 0x21, 0x03, 0x24, 0x30, 0x28, None, 0xD1, 0x5A, 0x78, 0x31, 0x2A, None, 0xD1,
+              0x9A, 0x78, 0x47, 0x2A, None, 0xD0
+])
+SIG_US_REGION_SWITCH_G2 = Signature([ 0xD8, 0x78, 0x54, 0x38, 0x07, 0x28, None, 0xD2, 0xDF, 0xE8, 0x00, 0xF0 ])
+SIG_US_REGION_FROM_ZT3 = Signature([ 0x01, 0x22, 0x31, 0x2c, None, None, 0x44, 0x78, 0x4b, 0x2c, None, None, 0x84, 0x78, 0x31, 0x2c ])
+SIG_US_REGION_FROM_G3 = Signature([
+              ord('1'), None,
+              None, 0xd1,
+              None, 0x78,
+              ord('C'), None,
+              None, 0xd1,
+              None, 0x78,
+              ord('G'), None,
+              None, 0xd1,
+              None, 0x78,
+              ord('A'), None
+])
+SIG_US_REGION_TO_G3 = Signature([0x00, 0x20, None, 0xe0])
+
+# us_region_spoof / region_free
+SIG_REGION_DST_ZT3 = Signature([ 0x03, 0x20, 0xc8, 0x70, 0x4a, 0x70 ])
+
+# disable_motor_ntc
+SIG_MOTOR_NTC = Signature([ 0xf6, 0xf7, None, 0xf9, 0xf6, 0xf7, None, 0xfa ])
+
+# skip_key_check
+SIG_KEY_CHECK_G3_MCU = Signature([
+              None, 0xdb,
+              None, None,
+              None, None, None, None,
+              None, 0xf5, 0x9a, 0x43,
+              0x43, None,
+              None, 0xd0
+])
+SIG_KEY_CHECK_CUT_SRC = Signature([0x40, 0x1c, 0x10, 0x28, None, 0xdb])
+SIG_KEY_CHECK_DST = Signature([0xdb, 0x0c, 0xb9, None, 0xf8, 0x05])
+
+# allow_sn_change
+SIG_SN_CHANGE_ZT3 = Signature([0x91, 0xf8, 0x24, 0x10])  # ldrb.w r1,[r1,#0x24]
+SIG_SN_CHANGE_G3 = Signature([0x93, 0xf8, 0x24, 0x30])  # ldrb.w r3,[r3,#0x24]
+SIG_SN_CHANGE = Signature([0x98, 0xf8, 0x4a, 0x00])  # ldrb.w r0,[r8,#0x4a]
+
+# region_free
+SIG_RFM_G2 = Signature([ 0x18, 0x78, 0xff, 0x21, 0x03, 0x24, 0x30, 0x28, 0x05, 0xd1 ])
+SIG_RFM_DST_G2 = Signature([ 0x33, 0x48, 0x5c, 0x30, 0xfc, 0xf7, 0xbe, 0xfe ])
+SIG_RFM_4MAX = Signature([ 0x34, 0x2b, 0x0e, 0xd1, 0x90, 0xf8, 0x01, 0xc0 ])
+SIG_RFM_DST_4MAX = Signature([ 0x04, 0x20, 0x87, 0xf8, 0x42, 0x00, 0x95, 0xe0 ])
+SIG_RFM_ZT3 = Signature([0xC0, 0x78, 0x45, 0x28])
+SIG_RFM = Signature([0x4e, 0x28])  # cmp r0, #0x4e
+SIG_RFM_DST_F2PRO = Signature([0x87, 0xf8, 0x4f, 0x40])  # strb.w r4,[r7,#0x4f]
+SIG_RFM_DST_F2PLUS = Signature([0x87, 0xf8, 0x59, 0x40])  # strb.w r4,[r7,#0x59]
+SIG_RFM_DST_F2 = Signature([0x87, 0xf8, 0x61, 0x40])  # strb.w r4,[r7,#0x61]
+
+# kers_multi
+SIG_KERS_MULTI = Signature([0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x94, 0x20, 0xaa, 0xf8, 0x38, 0x00, 0x0c, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x54, 0x20, 0xaa, 0xf8, 0x38, 0x00, 0x05, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0xc0, 0xf3, 0x54, 0x20, 0xaa, 0xf8, 0x38, 0x00])
+
+# speed_params / ampere_eco / ampere_drive
+SIG_SPEED_PARAMS = Signature([0x19, 0x48, 0x90, 0xf8, 0x4f, 0x00, 0x17, 0x4f, 0x1c, 0x4a, 0x1c, 0x4b])
+
+# speed_params
+SIG_SPEED_DRIVE_G2 = Signature([ 0xa9, 0x4f, 0xdf, 0xf8, 0xa8, 0x92 ])
+SIG_SPEED_ECO_G2 = Signature([ 0x10, 0x21, 0x81, 0x72, 0x80, 0xf8, 0x0b, 0xa0 ])
+SIG_SPEED_FIX_G2 = Signature([ 0xdf, 0xf8, 0x14, 0xa1, 0x45, 0x4b, 0x4f, 0xf0, 0x32, 0x09 ])
+SIG_SPEED_FIX_DST_G2 = Signature([ 0x58, 0x49, 0x08, 0x68, 0x43, 0xf6, 0x58, 0x62 ])
+SIG_SPEED_FIX2_G2 = Signature([ 0x08, 0xd0, 0xa2, 0xf8, 0xc8, 0x00 ])
+SIG_SPEED_PED_4MAX = Signature([ 0x87, 0xf8, 0x43, 0x50, 0x03, 0x78, 0xff, 0x24 ])
+SIG_SPEED_DRIVE_4MAX = Signature([ 0x87, 0xf8, 0x42, 0x40, 0x27, 0x48, 0x90, 0xf8, 0x42, 0xb0 ])
+SIG_SPEED_ECO = Signature([0x0f, 0x20, 0xb8, 0x70, 0x87, 0xf8, 0x03, 0xb0])
+
+# dpc
+SIG_DPC_G2 = Signature([ 0x90, 0xfb, 0xf2, 0xf0, 0x09, 0x68 ])
+SIG_DPC = Signature([0xaa, 0xf8, 0xec, 0x60, 0x42, 0x46])
+SIG_DPC_TMP = Signature([0xa0, 0xf8, 0x40, 0x50])  # strh.w r5,[r0,#0x40]
+
+# remove_autobrake
+SIG_AUTOBRAKE_G2 = Signature([ 0x58, 0x49, 0x08, 0x68, 0x43, 0xf6, 0x58, 0x62, 0x90, 0x42, 0x1a, 0xdd ])
+SIG_AUTOBRAKE_4MAX = Signature([ 0x38, 0x7b, 0xf8, 0xf7, 0x7f, 0xf8, 0xb0, 0xee, 0x4c, 0x8a ])
+SIG_AUTOBRAKE_DST_4MAX = Signature([ 0x70, 0x6f, 0xb0, 0x67, 0xb9, 0xf9, 0x64, 0x10, 0x05, 0x29, 0x12, 0xdc ])
+SIG_AUTOBRAKE = Signature([ 0x1a, 0x68, 0x90, 0x42, 0x30, 0xda ])
+SIG_AUTOBRAKE_DST = Signature([ 0x9a, 0xf8, 0x13, 0x00, 0x10, 0xb1, 0x01, 0x28, 0x34, 0xd1, 0x0f, 0xe0 ])
+
+# cc_delay
+SIG_CC_DELAY = Signature([0x4f, 0xf4, 0x7a, 0x71])  # mov.w r1, #1000
+SIG_CC_MODE_4MAX = Signature([0xa8, 0xf8, 0xee, 0x60])  # strh.w r6,[r8,#0xee]
+SIG_CC_MODE = Signature([0xa0, 0xf8, 0x42, 0x50])  # strh.w r5,[r0,#0x42]
+
+# remove_charging_mode
+SIG_CHARGING_MODE_G2 = Signature([0x7B, 0x20, 0xB9, None, 0x79, 0x10, 0xB9, None, 0xF8])
+SIG_CHARGING_MODE = Signature([0x78, 0x8A, 0x28, 0xB1, 0x86, 0xF8, 0x38, 0x40])
+
+# remove_kers
+SIG_KERS_G2 = Signature([ 0x0f, 0x4a, 0xb2, 0xf8, 0xf6, 0x30, 0x73, 0xb1 ])
+SIG_KERS_DST_G2 = Signature([ 0x00, 0x20, 0x08, 0x85, 0x70, 0x47 ])
+
+# ampere_eco
+SIG_AMP_ECO_G2 = Signature([ 0x4f, 0xf4, 0xfa, 0x51, 0x01, 0x2a, 0x10, 0xd0 ])
+
+# ampere_drive
+SIG_AMP_DRIVE_G2 = Signature([ 0x44, 0xf2, 0x68, 0x20, 0xa0, 0x67 ])
+
+# ampere_sport
+SIG_AMP_SPORT_G2 = Signature([ 0xfc, 0xf7, 0x0a, 0xfa, 0x45, 0xf6, 0xb4, 0x71, 0x01, 0x28, 0x0a, 0xd0 ])
+SIG_AMP_SPORT = Signature([ None, 0x71, 0xc7, 0xf8, 0x10, 0xc0 ])
+SIG_AMP_SPORT_STR = Signature([0xb8, 0x61])
+
+# ampere_max_eco
+SIG_AMP_MAX_ECO_G2 = Signature([ None, 0x49, 0x49, 0x42, 0x41, 0x62 ])
+SIG_AMP_MAX_ECO = Signature([ 0x47, 0xf2, 0x30, 0x50, 0x60, 0x61, 0xd1, 0xe0 ])
+
+# ampere_max_drive
+SIG_AMP_MAX_DRIVE_G2 = Signature([ 0x8f, 0x49, 0x49, 0x42, 0x41, 0x62 ])
+SIG_AMP_MAX_DRIVE = Signature([ 0x49, 0xf6, 0x40, 0x40, 0x60, 0x61 ])
+
+# ampere_max_sport
+SIG_AMP_MAX_SPORT_G2 = Signature([ 0x80, 0xc7, 0xfe, 0xff, 0x70, 0x11, 0x01, 0x00, 0x18, 0x02, 0xff, 0xff ])
+SIG_AMP_MAX_SPORT = Signature([ 0x40, 0x19, 0x01, 0x00, 0x80, 0x97, 0x06, 0x00, 0x00, 0xca, 0x08, 0x00 ])
+
+# bms_baudrate
+SIG_BMS_BAUDRATE = Signature([ 0x4f, 0xf4, 0xe1, 0x30, 0x03, 0x90, 0x00, 0x21, 0xad, 0xf8, 0x10, 0x10 ])
+
+# volt_limit
+SIG_VOLT_LIMIT = Signature([0x91, 0x42, 0x04, 0xD3, None, 0x68, 0x41, 0xF2, None, None, 0x88, 0x42, 0x06, 0xD9])
+
+SIGNATURES = [v for k, v in sorted(globals().items()) if k.startswith('SIG_')]
+
 
 class NbPatcher(BasePatcher):
+    signatures = SIGNATURES
+
     def __init__(self, data, model):
         super().__init__(data, model)
 
@@ -47,11 +184,7 @@ class NbPatcher(BasePatcher):
         register = match.group(2)
 
         orig_version_assignment = self.asm(orig_version_assignment)
-        start = 0
-        all_ofs = []
-        while (ofs := FindPatternGracef(self.data, orig_version_assignment, start=start)) != -1:
-            all_ofs.append(ofs)
-            start = ofs + len(orig_version_assignment)
+        all_ofs = list(self.find_all(orig_version_assignment))
 
         result = []
 
@@ -74,9 +207,7 @@ class NbPatcher(BasePatcher):
             assert len(speed_table_data) == 6
             for profile in speed_table_data:
                 assert len(profile) == 9
-            default_row_0_vals = [16, 35, 13, 25, 55, 17, 32, 100, 35]
-            default_row_0 = b''.join(x.to_bytes(4, 'little') for x in default_row_0_vals)
-            offs = FindPattern(self.data, default_row_0)
+            offs = self.find_pattern(SIG_SPEED_TABLE_ROW_0)
             custom_speed_config = b''.join(
                 val.to_bytes(4, 'little')
                     for profile in speed_table_data
@@ -160,33 +291,23 @@ class NbPatcher(BasePatcher):
         OP: trueToastedCode
         Description: Disable custom enc key
         '''
-        def find_pattern_wrap(*args, **kwargs):
-            try:
-                return FindPattern(*args, **kwargs)
-            except SignatureException:
-                return -1
-            
         result = []
 
         if self.model in [ "g2", "g3_vcu", "g3_mcu", "gt3_vcu" ]:
-            sig = bytes.fromhex('FE 80 1C B2 D1 EF 41 A6 A4 17 31 F5 A0 68 24 F0')
-            offset = -len(sig)
-            last_offset = None
-            while (offset := find_pattern_wrap(self.data, sig, start=offset + len(sig))) != -1:
-                last_offset = offset
-            if last_offset is None:
+            sig = SIG_DEFAULT_ENC_KEY
+            try:
+                last_offset = self.find_last(sig)
+            except SignatureException:
                 raise SignatureException('Default key not found')
             dst_addr = last_offset + 0x8001000
             assert dst_addr % 4 == 0
             post = dst_addr.to_bytes(4, byteorder='little')
 
-            pre = (0x8001420).to_bytes(4, byteorder='little')
-            offset = -len(pre)
-            i = 0
-            while (offset := find_pattern_wrap(self.data, pre, start=offset + len(pre))) != -1:
+            sig = SIG_ENC_KEY_REF
+            pre = bytes(sig)
+            for i, offset in enumerate(self.find_all(sig)):
                 self.data[offset : offset + 4] = post
                 result += self.ret(f'change_enc_key_reference_{i}', offset, pre, post)
-                i += 1
         
             if not result:
                 raise SignatureException('References to default key not found')
@@ -204,14 +325,11 @@ class NbPatcher(BasePatcher):
         Description: Spoof region always to be US
         '''
         if self.model == "g2":
-            sig_from = [
-                0x18, 0x78, 0xFF, 0x21, 0x03, 0x24, 0x30, 0x28, None, 0xD1, 0x5A, 0x78, 0x31, 0x2A, None, 0xD1, 
-                0x9A, 0x78, 0x47, 0x2A, None, 0xD0
-            ]
-            ofs_from = FindPattern(self.data, sig_from) + 0x14
+            sig_from = SIG_US_REGION_FROM_G2
+            ofs_from = self.find_pattern(sig_from) + 0x14
 
-            sig_switch_case_to = [ 0xD8, 0x78, 0x54, 0x38, 0x07, 0x28, None, 0xD2, 0xDF, 0xE8, 0x00, 0xF0 ]
-            ofs_switch_case_to = FindPattern(self.data, sig_switch_case_to) + 0xc
+            sig_switch_case_to = SIG_US_REGION_SWITCH_G2
+            ofs_switch_case_to = self.find_pattern(sig_switch_case_to) + 0xc
 
             # default
             # case 0: 84 = T
@@ -236,11 +354,11 @@ class NbPatcher(BasePatcher):
             return self.ret("us_region_spoof", ofs_from, pre, post)
 
         elif self.model == "zt3pro_vcu":
-            sig_from = [ 0x01, 0x22, 0x31, 0x2c, None, None, 0x44, 0x78, 0x4b, 0x2c, None, None, 0x84, 0x78, 0x31, 0x2c ]
-            ofs_from = FindPattern(self.data, sig_from) + 0x10
+            sig_from = SIG_US_REGION_FROM_ZT3
+            ofs_from = self.find_pattern(sig_from) + 0x10
 
-            sig_to = [ 0x03, 0x20, 0xc8, 0x70, 0x4a, 0x70 ]
-            ofs_to = FindPattern(self.data, sig_to, start=ofs_from + 2)
+            sig_to = SIG_REGION_DST_ZT3
+            ofs_to = self.find_pattern(sig_to, start=ofs_from + 2)
 
             patch_slice = slice(ofs_from, ofs_from + 2)
             pre = self.data[patch_slice]
@@ -250,20 +368,9 @@ class NbPatcher(BasePatcher):
             return self.ret("us_region_spoof", ofs_from, pre, post)
         
         elif self.model == "g3_vcu":
-            from_pattern = [
-                ord('1'), None,
-                None, 0xd1,
-                None, 0x78,
-                ord('C'), None,
-                None, 0xd1,
-                None, 0x78,
-                ord('G'), None,
-                None, 0xd1,
-                None, 0x78,
-                ord('A'), None
-            ]
-            from_ofs = FindPattern(self.data, from_pattern)
-            to_ofs = FindPattern(self.data, [0x00, 0x20, None, 0xe0], start=from_ofs + len(from_pattern))
+            from_pattern = SIG_US_REGION_FROM_G3
+            from_ofs = self.find_pattern(from_pattern)
+            to_ofs = self.find_pattern(SIG_US_REGION_TO_G3, start=from_ofs + len(from_pattern))
             patch_sl = slice(from_ofs, from_ofs + 2)
             pre = self.data[patch_sl]
             post = self.asm(f'b #{hex(to_ofs - from_ofs)}')
@@ -277,9 +384,9 @@ class NbPatcher(BasePatcher):
         OP: Turbojeet
         Description: Disables error 40/41, which is thrown when motor NTC is missing
         '''
-        sig = [ 0xf6, 0xf7, None, 0xf9, 0xf6, 0xf7, None, 0xfa ]
+        sig = SIG_MOTOR_NTC
 
-        ofs = FindPattern(self.data, sig)
+        ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+8]
         post = self.asm('nop.w\nnop.w')
         self.data[ofs:ofs+8] = post
@@ -291,15 +398,8 @@ class NbPatcher(BasePatcher):
         Description: Skips key check
         '''
         if self.model == "g3_mcu":
-            pattern_from = [
-                None, 0xdb,
-                None, None,
-                None, None, None, None,
-                None, 0xf5, 0x9a, 0x43,
-                0x43, None,
-                None, 0xd0
-            ]
-            ofs_from = FindPattern(self.data, pattern_from) + len(pattern_from) - 2
+            pattern_from = SIG_KEY_CHECK_G3_MCU
+            ofs_from = self.find_pattern(pattern_from) + len(pattern_from) - 2
             patch_sl = slice(ofs_from, ofs_from + 2)
             pre = self.data[patch_sl]
             instruction = self.disasm(self.data[patch_sl])[0]
@@ -308,25 +408,18 @@ class NbPatcher(BasePatcher):
             self.data[patch_sl] = post
             return self.ret("skip_key_check", ofs_from, pre, post)
 
-        def find_pattern_wrap(*args, **kwargs):
-            try:
-                return FindPattern(*args, **kwargs)
-            except SignatureException:
-                return -1
-
-        cut_src_sig = [0x40, 0x1c, 0x10, 0x28, None, 0xdb]
-        dst_sig = [0xdb, 0x0c, 0xb9, None, 0xf8, 0x05]
+        cut_src_sig = SIG_KEY_CHECK_CUT_SRC
+        dst_sig = SIG_KEY_CHECK_DST
 
         # previously the terms "skip key check" and "compat patch" have been used interchangeably
         # make sure the key check doesn't get applied twice
         # iterate through all patch candidates
-        offset = -len(cut_src_sig)
-        while (offset := find_pattern_wrap(self.data, cut_src_sig, start=offset + len(cut_src_sig))) != -1:
+        for offset in self.find_all(cut_src_sig):
             patch_offset = offset + 6
 
             # assuming this is the correct offset, find the destination
             try:
-                dst_offset = FindPattern(self.data, dst_sig, start=patch_offset + 2) + 1
+                dst_offset = self.find_pattern(dst_sig, start=patch_offset + 2) + 1
             except SignatureException:
                 continue
 
@@ -350,18 +443,18 @@ class NbPatcher(BasePatcher):
         Description: Allows changing the serial number
         '''
         if self.model == "zt3pro_vcu":
-            sig = self.asm('ldrb.w r1,[r1,#0x24]')
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_SN_CHANGE_ZT3
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
             post = self.asm('mov.w r1, #0x1')
         elif self.model == "g3_vcu":
-            sig = self.asm('ldrb.w r3,[r3,#0x24]')
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_SN_CHANGE_G3
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
             post = self.asm('mov.w r3, #0x1')
         else:
-            sig = self.asm('ldrb.w r0,[r8,#0x4a]')
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_SN_CHANGE
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+4]
             post = self.asm('mov.w r0, #0x1')
             
@@ -376,23 +469,23 @@ class NbPatcher(BasePatcher):
         res = []
 
         if self.model == "g2":
-            sig = [ 0x18, 0x78, 0xff, 0x21, 0x03, 0x24, 0x30, 0x28, 0x05, 0xd1 ]
-            ofs = FindPattern(self.data, sig) + len(sig) - 2
+            sig = SIG_RFM_G2
+            ofs = self.find_pattern(sig) + len(sig) - 2
             
-            sig = [ 0x33, 0x48, 0x5c, 0x30, 0xfc, 0xf7, 0xbe, 0xfe ]
-            ofs_dst = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_RFM_DST_G2
+            ofs_dst = self.find_pattern(sig, start=ofs)
 
             pre = self.data[ofs:ofs+2]
             post = self.asm(f"b #{ofs_dst-ofs}")
             self.data[ofs:ofs+2] = post
             res += self.ret("region_free", ofs, pre, post)
         elif self.model in ["4max", "4plus"]:
-            sig = [ 0x34, 0x2b, 0x0e, 0xd1, 0x90, 0xf8, 0x01, 0xc0 ]
-            ofs = FindPattern(self.data, sig) + 2
+            sig = SIG_RFM_4MAX
+            ofs = self.find_pattern(sig) + 2
             pre = self.data[ofs:ofs+2]
             
-            sig = [ 0x04, 0x20, 0x87, 0xf8, 0x42, 0x00, 0x95, 0xe0 ]
-            ofs_dst = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_RFM_DST_4MAX
+            ofs_dst = self.find_pattern(sig, start=ofs)
             post = self.asm(f"b #{ofs_dst-ofs}")
             self.data[ofs:ofs+2] = post
             res += self.ret("region_free_0", ofs, pre, post)
@@ -403,26 +496,26 @@ class NbPatcher(BasePatcher):
                 self.data[ofs_dst:ofs_dst+2] = post
                 res += self.ret("region_free_1", ofs_dst, pre, post)
         elif self.model == "zt3pro_vcu":
-            sig = [0xC0, 0x78, 0x45, 0x28]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_RFM_ZT3
+            ofs = self.find_pattern(sig)
 
-            sig = [0x03, 0x20, 0xC8, 0x70, 0x4A, 0x70]
-            ofs_dst = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_REGION_DST_ZT3
+            ofs_dst = self.find_pattern(sig, start=ofs)
 
             pre = self.data[ofs:ofs+2]
             post = self.asm(f"b {ofs_dst-ofs}")
             self.data[ofs:ofs+2] = post
             res += self.ret("region_free", ofs, pre, post)
         else:
-            sig = self.asm('cmp r0, #0x4e')
-            ofs = FindPattern(self.data, sig, start=0x8000) + len(sig)
+            sig = SIG_RFM
+            ofs = self.find_pattern(sig, start=0x8000) + len(sig)
             if self.model == "f2pro":
-                sig = self.asm('strb.w r4,[r7,#0x4f]')
+                sig = SIG_RFM_DST_F2PRO
             elif self.model == "f2plus":
-                sig = self.asm('strb.w r4,[r7,#0x59]')
+                sig = SIG_RFM_DST_F2PLUS
             elif self.model == "f2":
-                sig = self.asm('strb.w r4,[r7,#0x61]')
-            ofs_dst = FindPattern(self.data, sig, start=0x8000)
+                sig = SIG_RFM_DST_F2
+            ofs_dst = self.find_pattern(sig, start=0x8000)
 
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'b #{ofs_dst-ofs}')
@@ -456,11 +549,11 @@ class NbPatcher(BasePatcher):
         lsrs  r0, r0, #0xb
         strh.w  r0, [r10, #0x38]
         """
-        sig = [0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x94, 0x20, 0xaa, 0xf8, 0x38, 0x00, 0x0c, 0xe0, 0x00, 0xeb, 0x40, 0x00, 0xc0, 0xf3, 0x54, 0x20, 0xaa, 0xf8, 0x38, 0x00, 0x05, 0xe0, 0x00, 0xeb, 0x80, 0x00, 0xc0, 0xf3, 0x54, 0x20, 0xaa, 0xf8, 0x38, 0x00]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_KERS_MULTI
+        ofs = self.find_pattern(sig)
 
         pre = self.data[ofs:ofs+len(sig)]
-        post = bytes(self.ks.asm(asm)[0])
+        post = self.asm(asm)
         assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
         self.data[ofs:ofs+len(post)] = post
         ret.append(["kers_multi", hex(ofs), pre.hex(), post.hex()])
@@ -475,16 +568,16 @@ class NbPatcher(BasePatcher):
         ret = []
 
         if self.model == "g2":
-            sig = [ 0xa9, 0x4f, 0xdf, 0xf8, 0xa8, 0x92 ]
-            ofs = FindPattern(self.data, sig) + len(sig) + 2 * 4
+            sig = SIG_SPEED_DRIVE_G2
+            ofs = self.find_pattern(sig) + len(sig) + 2 * 4
             pre = self.data[ofs:ofs+4]
             post = self.asm(f'mov.w r10, #{max_drive}')
             self.data[ofs:ofs+len(post)] = post
             assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
             ret.append([f"speed_params_drive", hex(ofs), pre.hex(), post.hex()])
 
-            sig = [ 0x10, 0x21, 0x81, 0x72, 0x80, 0xf8, 0x0b, 0xa0 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_SPEED_ECO_G2
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'movs r1, #{max_eco}')
             self.data[ofs:ofs+len(post)] = post
@@ -499,10 +592,10 @@ class NbPatcher(BasePatcher):
             ret.append([f"speed_params_sport", hex(ofs), pre.hex(), post.hex()])
 
             # G2 has fancy additional checks
-            sig = [ 0xdf, 0xf8, 0x14, 0xa1, 0x45, 0x4b, 0x4f, 0xf0, 0x32, 0x09 ]
-            ofs = FindPattern(self.data, sig)
-            sig = [ 0x58, 0x49, 0x08, 0x68, 0x43, 0xf6, 0x58, 0x62 ]
-            ofs_dst = FindPattern(self.data, sig)
+            sig = SIG_SPEED_FIX_G2
+            ofs = self.find_pattern(sig)
+            sig = SIG_SPEED_FIX_DST_G2
+            ofs_dst = self.find_pattern(sig)
             pre = self.data[ofs:ofs+6]
             post = self.asm(f'''ldrb       r0,[r3,#0xc]
                                 strh       r0,[r4,#0x26]
@@ -511,24 +604,24 @@ class NbPatcher(BasePatcher):
             assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
             ret.append([f"speed_params_fix1", hex(ofs), pre.hex(), post.hex()])
 
-            sig = [ 0x08, 0xd0, 0xa2, 0xf8, 0xc8, 0x00 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_SPEED_FIX2_G2
+            ofs = self.find_pattern(sig)
             pre = self.data[ofs:ofs+2]
             post = self.asm('nop')
             self.data[ofs:ofs+len(post)] = post
             assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
             ret.append([f"speed_params_fix2", hex(ofs), pre.hex(), post.hex()])
         elif self.model in ["4max", "4plus"]:
-            sig = [ 0x87, 0xf8, 0x43, 0x50, 0x03, 0x78, 0xff, 0x24 ]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_SPEED_PED_4MAX
+            ofs = self.find_pattern(sig) + len(sig)
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'movs r2, #{max_ped}')
             self.data[ofs:ofs+len(post)] = post
             assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
             ret.append([f"speed_params_ped", hex(ofs), pre.hex(), post.hex()])
 
-            sig = [ 0x87, 0xf8, 0x42, 0x40, 0x27, 0x48, 0x90, 0xf8, 0x42, 0xb0 ]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_SPEED_DRIVE_4MAX
+            ofs = self.find_pattern(sig) + len(sig)
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'movs r4, #{max_drive}')
             self.data[ofs:ofs+len(post)] = post
@@ -542,8 +635,8 @@ class NbPatcher(BasePatcher):
             assert len(post) == len(pre), f"{len(post)}, {len(pre)}"
             ret.append([f"speed_params_sport", hex(ofs), pre.hex(), post.hex()])
         else:
-            sig = [0x19, 0x48, 0x90, 0xf8, 0x4f, 0x00, 0x17, 0x4f, 0x1c, 0x4a, 0x1c, 0x4b]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_SPEED_PARAMS
+            ofs = self.find_pattern(sig) + len(sig)
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'movs r1, #{max_ped}')
             self.data[ofs:ofs+len(post)] = post
@@ -561,13 +654,8 @@ class NbPatcher(BasePatcher):
                 ret.append([f"speed_params_drive_{i}", hex(ofs), pre.hex(), post.hex()])
 
 
-            sig = [0x0f, 0x20, 0xb8, 0x70, 0x87, 0xf8, 0x03, 0xb0]
-            for i in range(10):
-                try:
-                    ofs = FindPattern(self.data, sig, start=ofs+1)
-                except SignatureException:
-                    break
-
+            sig = SIG_SPEED_ECO
+            for i, ofs in enumerate(islice(self.find_all(sig, start=ofs+1), 10)):
                 pre = self.data[ofs:ofs+2]
                 post = self.asm(f'movs r0, #{max_eco}')
                 self.data[ofs:ofs+len(post)] = post
@@ -588,15 +676,15 @@ class NbPatcher(BasePatcher):
         res = []
 
         if self.model == "g2":
-            sig = [ 0x90, 0xfb, 0xf2, 0xf0, 0x09, 0x68 ]
-            ofs = FindPattern(self.data, sig) - 2
+            sig = SIG_DPC_G2
+            ofs = self.find_pattern(sig) - 2
             pre = self.data[ofs:ofs+2]
             post = self.asm('b #0x6')
             self.data[ofs:ofs+2] = post
             return self.ret("dpc", ofs, pre, post)
 
-        sig = [0xaa, 0xf8, 0xec, 0x60, 0x42, 0x46]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_DPC
+        ofs = self.find_pattern(sig)
 
         pre = self.data[ofs:ofs+4]
         post = self.asm('nop.w')
@@ -604,8 +692,8 @@ class NbPatcher(BasePatcher):
         res += self.ret("dpc_nop", ofs, pre, post)
 
         # temp fix, set to 1 instead of 0
-        sig = self.asm('strh.w r5,[r0,#0x40]')
-        ofs = FindPattern(self.data, sig, start=ofs)
+        sig = SIG_DPC_TMP
+        ofs = self.find_pattern(sig, start=ofs)
         pre = self.data[ofs:ofs+4]
         post = self.asm('strh.w r6,[r0,#0x1e]')
         self.data[ofs:ofs+4] = post
@@ -615,27 +703,27 @@ class NbPatcher(BasePatcher):
 
     def remove_autobrake(self):
         if self.model == "g2":
-            sig = [ 0x58, 0x49, 0x08, 0x68, 0x43, 0xf6, 0x58, 0x62, 0x90, 0x42, 0x1a, 0xdd ]
-            ofs = FindPattern(self.data, sig) + len(sig) - 2
+            sig = SIG_AUTOBRAKE_G2
+            ofs = self.find_pattern(sig) + len(sig) - 2
             pre = self.data[ofs:ofs+2]
             post = pre.copy()
             post[1] = 0xe0
             self.data[ofs:ofs+2] = post
         elif self.model in ["4max", "4plus"]:
-            sig = [ 0x38, 0x7b, 0xf8, 0xf7, 0x7f, 0xf8, 0xb0, 0xee, 0x4c, 0x8a ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AUTOBRAKE_4MAX
+            ofs = self.find_pattern(sig)
 
-            sig = [ 0x70, 0x6f, 0xb0, 0x67, 0xb9, 0xf9, 0x64, 0x10, 0x05, 0x29, 0x12, 0xdc ]
-            ofs_dst = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_AUTOBRAKE_DST_4MAX
+            ofs_dst = self.find_pattern(sig, start=ofs)
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'b #{ofs_dst-ofs}')
             self.data[ofs:ofs+2] = post
         else:
-            sig = [ 0x1a, 0x68, 0x90, 0x42, 0x30, 0xda ]
-            ofs = FindPattern(self.data, sig) + 4
+            sig = SIG_AUTOBRAKE
+            ofs = self.find_pattern(sig) + 4
             
-            sig = [ 0x9a, 0xf8, 0x13, 0x00, 0x10, 0xb1, 0x01, 0x28, 0x34, 0xd1, 0x0f, 0xe0 ]
-            ofs_dst  = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_AUTOBRAKE_DST
+            ofs_dst  = self.find_pattern(sig, start=ofs)
 
             pre = self.data[ofs:ofs+2]
             post = self.asm(f'b #{ofs_dst-ofs}')
@@ -648,8 +736,8 @@ class NbPatcher(BasePatcher):
 
         delay = int(seconds * 200)
 
-        sig = self.asm('mov.w r1, #1000')
-        ofs = FindPattern(self.data, sig, start=0x2000)
+        sig = SIG_CC_DELAY
+        ofs = self.find_pattern(sig, start=0x2000)
         pre = self.data[ofs:ofs+4]
         post = self.asm(f'mov.w r1, #{delay}')
         self.data[ofs:ofs+4] = post
@@ -659,13 +747,13 @@ class NbPatcher(BasePatcher):
         # Todo: Move this into own patch
         try:
             if self.model in ["4max", "4plus"]:
-                sig = self.asm('strh.w r6,[r8,#0xee]')
+                sig = SIG_CC_MODE_4MAX
                 post = self.asm('strh.w r6,[r8,#0xf8]')
             else:
-                sig = self.asm('strh.w r5,[r0,#0x42]')
+                sig = SIG_CC_MODE
                 post = self.asm('strh.w r6,[r0,#0x112]')
 
-            ofs = FindPattern(self.data, sig, start=ofs)
+            ofs = self.find_pattern(sig, start=ofs)
             pre = self.data[ofs:ofs+4]
             self.data[ofs:ofs+4] = post
             res += self.ret("tmp_cc_mode_1", ofs, pre, post)
@@ -676,14 +764,14 @@ class NbPatcher(BasePatcher):
 
     def remove_charging_mode(self):
         if self.model in ["g2", "4max", "4plus"]:
-            sig = [0x7B, 0x20, 0xB9, None, 0x79, 0x10, 0xB9, None, 0xF8]
-            ofs = FindPattern(self.data, sig) - 5
+            sig = SIG_CHARGING_MODE_G2
+            ofs = self.find_pattern(sig) - 5
             pre = self.data[ofs:ofs+4]
             post = self.asm("nop.w")
             self.data[ofs:ofs+4] = post
         else:
-            sig = [0x78, 0x8A, 0x28, 0xB1, 0x86, 0xF8, 0x38, 0x40]
-            ofs = FindPattern(self.data, sig) + 2
+            sig = SIG_CHARGING_MODE
+            ofs = self.find_pattern(sig) + 2
             pre = self.data[ofs:ofs+2]
             post = self.asm("nop")
             self.data[ofs:ofs+2] = post
@@ -691,11 +779,11 @@ class NbPatcher(BasePatcher):
 
     def remove_kers(self):
         if self.model == "g2":
-            sig = [ 0x0f, 0x4a, 0xb2, 0xf8, 0xf6, 0x30, 0x73, 0xb1 ]
-            ofs = FindPattern(self.data, sig) + len(sig) - 2
+            sig = SIG_KERS_G2
+            ofs = self.find_pattern(sig) + len(sig) - 2
 
-            sig = [ 0x00, 0x20, 0x08, 0x85, 0x70, 0x47 ]
-            ofs_dst = FindPattern(self.data, sig, start=ofs)
+            sig = SIG_KERS_DST_G2
+            ofs_dst = self.find_pattern(sig, start=ofs)
 
             pre = self.data[ofs:ofs+2]
             post = self.asm(f"b #{ofs_dst-ofs}")
@@ -709,12 +797,12 @@ class NbPatcher(BasePatcher):
     def ampere_eco(self, amps, force=True):
         reg = 12
         if self.model == "g2":
-            sig = [ 0x4f, 0xf4, 0xfa, 0x51, 0x01, 0x2a, 0x10, 0xd0 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_ECO_G2
+            ofs = self.find_pattern(sig)
             reg = 1
         else:
-            sig = [0x19, 0x48, 0x90, 0xf8, 0x4f, 0x00, 0x17, 0x4f, 0x1c, 0x4a, 0x1c, 0x4b]
-            ofs = FindPattern(self.data, sig) + len(sig) + 8
+            sig = SIG_SPEED_PARAMS
+            ofs = self.find_pattern(sig) + len(sig) + 8
         pre = self.data[ofs:ofs+4]
         post = self.asm(f'movw r{reg}, #{amps}')
         self.data[ofs:ofs+4] = post
@@ -723,12 +811,12 @@ class NbPatcher(BasePatcher):
     def ampere_drive(self, amps, force=True):
         reg = 9
         if self.model == "g2":
-            sig = [ 0x44, 0xf2, 0x68, 0x20, 0xa0, 0x67 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_DRIVE_G2
+            ofs = self.find_pattern(sig)
             reg = 0
         else:
-            sig = [0x19, 0x48, 0x90, 0xf8, 0x4f, 0x00, 0x17, 0x4f, 0x1c, 0x4a, 0x1c, 0x4b]
-            ofs = FindPattern(self.data, sig) + len(sig) + 30
+            sig = SIG_SPEED_PARAMS
+            ofs = self.find_pattern(sig) + len(sig) + 30
         pre = self.data[ofs:ofs+4]
         post = self.asm(f'movw r{reg}, #{amps}')
         self.data[ofs:ofs+4] = post
@@ -738,8 +826,8 @@ class NbPatcher(BasePatcher):
         res = []
 
         if self.model == "g2":
-            sig = [ 0xfc, 0xf7, 0x0a, 0xfa, 0x45, 0xf6, 0xb4, 0x71, 0x01, 0x28, 0x0a, 0xd0 ]
-            ofs = FindPattern(self.data, sig) + len(sig) - 2
+            sig = SIG_AMP_SPORT_G2
+            ofs = self.find_pattern(sig) + len(sig) - 2
             if force:
                 pre = self.data[ofs:ofs+2]
                 post = pre.copy()
@@ -756,11 +844,11 @@ class NbPatcher(BasePatcher):
 
         ofs = 0x8000
         for i in range(20):
-            sig = [ None, 0x71, 0xc7, 0xf8, 0x10, 0xc0 ]
+            sig = SIG_AMP_SPORT
             try:
-                ofs = FindPattern(self.data, sig, start=ofs+1)
-                sig = [0xb8, 0x61]
-                ofs = FindPattern(self.data, sig, start=ofs+1) - 4
+                ofs = self.find_pattern(sig, start=ofs+1)
+                sig = SIG_AMP_SPORT_STR
+                ofs = self.find_pattern(sig, start=ofs+1) - 4
             except SignatureException:
                 break
 
@@ -775,12 +863,12 @@ class NbPatcher(BasePatcher):
     def ampere_max_eco(self, amps):
         reg = 0
         if self.model == "g2":
-            sig = [ None, 0x49, 0x49, 0x42, 0x41, 0x62 ]
-            ofs = FindPattern(self.data, sig) + len(sig)
+            sig = SIG_AMP_MAX_ECO_G2
+            ofs = self.find_pattern(sig) + len(sig)
             reg = 1
         else:
-            sig = [ 0x47, 0xf2, 0x30, 0x50, 0x60, 0x61, 0xd1, 0xe0 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_MAX_ECO
+            ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+4]
         post = self.asm(f'movw r{reg}, #{amps}')
         self.data[ofs:ofs+4] = post
@@ -789,12 +877,12 @@ class NbPatcher(BasePatcher):
     def ampere_max_drive(self, amps):
         reg = 0
         if self.model == "g2":
-            sig = [ 0x8f, 0x49, 0x49, 0x42, 0x41, 0x62 ]
-            ofs = FindPattern(self.data, sig) + len(sig) + 6
+            sig = SIG_AMP_MAX_DRIVE_G2
+            ofs = self.find_pattern(sig) + len(sig) + 6
             reg = 1
         else:
-            sig = [ 0x49, 0xf6, 0x40, 0x40, 0x60, 0x61 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_MAX_DRIVE
+            ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+4]
         post = self.asm(f'movw r{reg}, #{amps}')
         self.data[ofs:ofs+4] = post
@@ -805,12 +893,12 @@ class NbPatcher(BasePatcher):
         Description: Set max current for sport mode, requires acceleration mode to be set to 2
         '''
         if self.model == "g2":
-            sig = [ 0x80, 0xc7, 0xfe, 0xff, 0x70, 0x11, 0x01, 0x00, 0x18, 0x02, 0xff, 0xff ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_MAX_SPORT_G2
+            ofs = self.find_pattern(sig)
             post = int.to_bytes((-amps), 4, byteorder='little', signed=True)
         else:
-            sig = [ 0x40, 0x19, 0x01, 0x00, 0x80, 0x97, 0x06, 0x00, 0x00, 0xca, 0x08, 0x00 ]
-            ofs = FindPattern(self.data, sig)
+            sig = SIG_AMP_MAX_SPORT
+            ofs = self.find_pattern(sig)
             post = amps.to_bytes(4, byteorder='little')
         pre = self.data[ofs:ofs+4]
         self.data[ofs:ofs+4] = post
@@ -820,19 +908,19 @@ class NbPatcher(BasePatcher):
         if self.model == "g2":
             raise NotImplementedError("Not supported on G2")
 
-        sig = [ 0x4f, 0xf4, 0xe1, 0x30, 0x03, 0x90, 0x00, 0x21, 0xad, 0xf8, 0x10, 0x10 ]
-        ofs = FindPattern(self.data, sig)
+        sig = SIG_BMS_BAUDRATE
+        ofs = self.find_pattern(sig)
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm('MOV.W R0,#{}'.format(val))[0])
+        post = self.asm('MOV.W R0,#{}'.format(val))
         self.data[ofs:ofs+4] = post
 
         return self.ret("bms_baudrate", ofs, pre, post)
 
     def volt_limit(self, volts):
-        sig = [0x91, 0x42, 0x04, 0xD3, None, 0x68, 0x41, 0xF2, None, None, 0x88, 0x42, 0x06, 0xD9]
-        ofs = FindPattern(self.data, sig) + 6
+        sig = SIG_VOLT_LIMIT
+        ofs = self.find_pattern(sig) + 6
         pre = self.data[ofs:ofs+4]
-        post = bytes(self.ks.asm(f"MOVW R1,#{int(volts*100)}")[0])
+        post = self.asm(f"MOVW R1,#{int(volts*100)}")
         self.data[ofs:ofs+4] = post
 
         return self.ret("volt_limit", ofs, pre, post)
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict, deque
+
+from cache import DiskCache
+from util import Signature
+
+# bump whenever the scan results or their serialization change
+INDEX_VERSION = 1
+
+
+class MultiScanner():
+    '''
+    Aho-Corasick automaton over the literal anchors of many signatures.
+
+    Every signature is reduced to its longest run of fully significant bytes
+    (no None wildcard, no mask bits cleared). All anchors are compiled into a
+    single DFA, so one pass over the firmware image yields the candidates for
+    every signature at once. Candidates are then verified against the full
+    signature, wildcards and masks included.
+    '''
+    # LRU of compiled scanners, one per signature set (patch sets, variants, stock table builds)
+    _cache = OrderedDict()
+    _cache_size = 16
+    _cache_lock = threading.Lock()
+
+    def __init__(self, signatures):
+        self.signatures = [s if isinstance(s, Signature) else Signature(s) for s in signatures]
+        self.unanchored = []
+
+        goto = [{}]
+        outputs = [[]]
+        for idx, signature in enumerate(self.signatures):
+            if not signature.anchor:
+                self.unanchored.append(idx)
+                continue
+
+            node = 0
+            for b in signature.anchor:
+                nxt = goto[node].get(b)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][b] = nxt
+                    goto.append({})
+                    outputs.append([])
+                node = nxt
+            outputs[node].append((idx, signature.anchor_ofs + len(signature.anchor) - 1))
+
+        # breadth first construction of failure links, folded into a dense DFA
+        delta = [None] * len(goto)
+        delta[0] = [goto[0].get(b, 0) for b in range(256)]
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            outputs[node] = outputs[node] + outputs[fail[node]]
+            row = list(delta[fail[node]])
+            for b, nxt in goto[node].items():
+                fail[nxt] = delta[fail[node]][b]
+                row[b] = nxt
+                queue.append(nxt)
+            delta[node] = row
+
+        self.delta = delta
+        self.outputs = [tuple(x) for x in outputs]
+
+        # identifies the signature set, so edited signatures never reuse old offsets
+        self.fingerprint = hashlib.sha256(
+            repr([(s.pattern, s.mask) for s in self.signatures]).encode()).hexdigest()
+
+    @classmethod
+    def get(cls, signatures):
+        '''
+        Return a (process wide) cached scanner for the given signature set.
+        '''
+        key = tuple(s if isinstance(s, Signature) else Signature(s) for s in signatures)
+        with cls._cache_lock:
+            scanner = cls._cache.get(key)
+            if scanner is not None:
+                cls._cache.move_to_end(key)
+                return scanner
+        scanner = cls(key)
+        with cls._cache_lock:
+            cls._cache[key] = scanner
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+        return scanner
+
+    def scan(self, data):
+        '''
+        Find all occurrences of all signatures in a single pass.
+        Returns a list (indexed like the input signatures) of sorted offsets
+        of every complete match.
+        '''
+        matches = [[] for _ in self.signatures]
+        size = len(data)
+        delta = self.delta
+        outputs = self.outputs
+
+        node = 0
+        for i, b in enumerate(data):
+            node = delta[node][b]
+            if outputs[node]:
+                for idx, end in outputs[node]:
+                    signature = self.signatures[idx]
+                    pos = i - end
+                    if pos < 0 or pos > size - len(signature):
+                        continue
+                    if signature.matches(data, pos):
+                        matches[idx].append(pos)
+
+        for idx in self.unanchored:
+            signature = self.signatures[idx]
+            matches[idx] = [pos for pos in range(0, size - len(signature) + 1)
+                            if signature.matches(data, pos)]
+
+        return matches
+
+
+class OffsetIndex(DiskCache):
+    '''
+    Persistent scan results, keyed by the content hash of the firmware image
+    and the fingerprint of the signature set.
+    '''
+    def __init__(self, path, max_size=16 << 20):
+        super().__init__(path, max_size=max_size, version=INDEX_VERSION)
+
+    def lookup(self, digest, scanner):
+        value = self.get(f'{digest}:{scanner.fingerprint}')
+        if value is None:
+            return None
+        matches = json.loads(value)
+        assert len(matches) == len(scanner.signatures), 'corrupt offset index entry!'
+        return matches
+
+    def store(self, digest, scanner, matches):
+        self.put(f'{digest}:{scanner.fingerprint}', json.dumps(matches).encode())
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Precomputed offsets for well-known stock firmware images.
+# The table is generated offline from a firmware corpus, see: python cli.py stock-table -h
+#####
+
+import hashlib
+import json
+import os
+
+STOCK_TABLE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'stock_firmware.json')
+STOCK_TABLE_VERSION = 2
+
+
+class StockTable():
+    '''
+    Maps (SHA-256 of the image, model) to the resolved signature offsets and,
+    per patch label, the offset/pre-bytes of its sites and the signature lookups it made.
+    '''
+    def __init__(self, images=None):
+        self.images = images if images is not None else {}
+
+    @staticmethod
+    def key(digest, model):
+        return f'{digest}:{model}'
+
+    @classmethod
+    def load(cls, path=STOCK_TABLE):
+        try:
+            with open(path, 'r') as fp:
+                table = json.load(fp)
+        except FileNotFoundError:
+            return cls()
+        if table.get('version') != STOCK_TABLE_VERSION:
+            return cls()
+        return cls(table['images'])
+
+    def save(self, path=STOCK_TABLE):
+        with open(path, 'w') as fp:
+            json.dump({'version': STOCK_TABLE_VERSION, 'images': self.images}, fp, indent=1, sort_keys=True)
+            fp.write('\n')
+
+    def lookup(self, data, digest, model, scanner):
+        '''
+        Signature offsets for a known image, or None on a miss, if the table
+        was built for other signatures or any patch site's pre-bytes differ.
+        '''
+        entry = self.images.get(self.key(digest, model))
+        if entry is None or entry['fingerprint'] != scanner.fingerprint:
+            return None
+        for patch in entry['patches'].values():
+            for ofs, pre in patch['sites']:
+                pre = bytes.fromhex(pre)
+                if data[ofs:ofs+len(pre)] != pre:
+                    return None
+        return entry['matches']
+
+    def lookups(self, digest, model, scanner):
+        '''
+        (signature, start, maxit) -> offset of every lookup the known patches make
+        on an image lookup() matched, so each patch finds its sites without a search.
+        '''
+        entry = self.images[self.key(digest, model)]
+        return {(scanner.signatures[i], start, maxit): ofs
+                for patch in entry['patches'].values()
+                for i, start, maxit, ofs in patch['lookups']}
+
+    def add(self, data, model, patcher_cls, patches):
+        '''
+        Record an image: patches maps a patch label to a callable applying it on
+        a given patcher, every patch is applied to a fresh copy of the image.
+        '''
+        digest = hashlib.sha256(data).hexdigest()
+        patcher = patcher_cls(data, model)
+        patcher.prescan()
+        index = {s: i for i, s in enumerate(patcher.scanner.signatures)}
+
+        recorded = {}
+        for label, apply in patches.items():
+            patched = patcher_cls(bytes(data), model)
+            try:
+                sites = sorted({(int(ofs, 0), pre) for _, ofs, pre, _ in apply(patched)})
+            except Exception as e:
+                print(f'  skipped {label}: {type(e).__name__} {e}')
+                continue
+            # lookups of signatures outside the patch set aren't kept, they are searched as usual
+            lookups = sorted([index[signature], start, maxit, ofs]
+                             for (signature, start, maxit), ofs in patched._lookups.items() if signature in index)
+            recorded[label] = {'sites': [list(x) for x in sites], 'lookups': lookups}
+
+        self.images[self.key(digest, model)] = {
+            'model': model,
+            'fingerprint': patcher.scanner.fingerprint,
+            'matches': [patcher.matches[s] for s in patcher.scanner.signatures],
+            'patches': recorded,
+        }
+        return digest
@@ -0,0 +1,344 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Firmware encryption (XiaoTea / NinebotTEA): TEA in CBC mode with a zero IV,
+# the key bytes advance by their index every 1 KB, the data is zero padded and
+# followed by its inverted word sum.
+# Several backends implement it, the fastest one reproducing the reference
+# output is picked at import. Decryption returns a bytearray, which is patched in place.
+# tests/test_tea.py cross-checks all available backends.
+#####
+
+import hashlib
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fasttea
+except ImportError:
+    fasttea = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from ninebottea import NinebotTEA
+except ImportError:
+    NinebotTEA = None
+
+DEFAULT_KEY = bytes.fromhex('fe801cb2d1ef41a6a41731f5a06824f0')
+DELTA = 0x9e3779b9
+ROUNDS = 32
+KEY_UPDATE = 1024  # bytes encrypted with the same key
+# prepared ciphers of custom keys: how many are kept and for how long (seconds) at most
+KEY_CACHE_SIZE = 64
+KEY_CACHE_TTL = 300
+
+M = 0xffffffff
+
+
+def _pad(data):
+    # zeros up to 4 bytes short of a full block, the checksum fills it
+    return b''.join((data, bytes((4 - len(data)) % 8)))
+
+
+def _checksum(padded):
+    ck = ~sum(struct.unpack(f'<{len(padded) // 4}I', padded)) & M
+    return struct.pack('<HH', ck >> 16, ck & 0xffff)
+
+
+def EncryptedSize(size):
+    '''
+    Size of the ciphertext of size bytes: zero padded to 4 bytes short of a block, plus the checksum.
+    '''
+    return size + (4 - size) % 8 + 4
+
+
+def KeySchedule(key):
+    '''
+    Key words for every KEY_UPDATE bytes, index with (offset // KEY_UPDATE) & 0xff:
+    byte j advances by j per update, so the schedule repeats after 256 updates.
+    '''
+    return [struct.unpack('<4I', bytes((b + i * j) & 0xff for j, b in enumerate(key)))
+            for i in range(256)]
+
+
+class KeyCache():
+    '''
+    Bounded, thread-safe LRU of prepared ciphers per custom key.
+    Entries expire ttl seconds after they were added, whether used or not, so
+    no key material outlives the TTL; the raw keys are only looked up by hash.
+    '''
+    def __init__(self, prepare, max_size=KEY_CACHE_SIZE, ttl=KEY_CACHE_TTL):
+        self.prepare = prepare
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.timer = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        digest = hashlib.sha256(key).digest()
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(digest)
+            if entry is not None:
+                self.entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        prepared = self.prepare(key)
+        with self.lock:
+            self.entries[digest] = (time.monotonic() + self.ttl, prepared)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self._schedule()
+        return prepared
+
+    def _expire(self):
+        now = time.monotonic()
+        for digest in [d for d, (deadline, _) in self.entries.items() if deadline <= now]:
+            del self.entries[digest]
+
+    def _schedule(self):
+        # drop expired entries even if the cache isn't used again
+        if self.timer is not None or not self.entries:
+            return
+        delay = min(deadline for deadline, _ in self.entries.values()) - time.monotonic()
+        self.timer = threading.Timer(max(delay, 0), self._sweep)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _sweep(self):
+        with self.lock:
+            self.timer = None
+            self._expire()
+            self._schedule()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PythonTea():
+    name = 'python'
+
+    def __init__(self):
+        self.default = self.prepare(DEFAULT_KEY)
+        self.keys = KeyCache(self.prepare)
+
+    @staticmethod
+    def available():
+        return True
+
+    @staticmethod
+    def prepare(key):
+        return KeySchedule(key)
+
+    def cipher(self, key):
+        return self.default if not key else self.keys.get(key)
+
+    def schedule(self, key):
+        return self.cipher(key)
+
+    def encrypt(self, data, key=None):
+        data = _pad(data)
+        data += _checksum(data)
+        schedule = self.schedule(key)
+
+        words = struct.unpack(f'<{len(data) // 4}I', data)
+        out = [0] * len(words)
+        c0 = c1 = 0
+        for i in range(0, len(words), 2):
+            k0, k1, k2, k3 = schedule[(i * 4 // KEY_UPDATE) & 0xff]
+            v0, v1 = words[i] ^ c0, words[i + 1] ^ c1
+            s = 0
+            for _ in range(ROUNDS):
+                s = (s + DELTA) & M
+                v0 = (v0 + ((((v1 << 4) & M) + k0) ^ (v1 + s) ^ ((v1 >> 5) + k1))) & M
+                v1 = (v1 + ((((v0 << 4) & M) + k2) ^ (v0 + s) ^ ((v0 >> 5) + k3))) & M
+            out[i], out[i + 1] = c0, c1 = v0, v1
+        return struct.pack(f'<{len(out)}I', *out)
+
+    def decrypt(self, data, key=None):
+        n = len(data) // 8 * 2
+        schedule = self.schedule(key)
+
+        words = struct.unpack_from(f'<{n}I', data)
+        out = [0] * n
+        c0 = c1 = 0
+        for i in range(0, n, 2):
+            k0, k1, k2, k3 = schedule[(i * 4 // KEY_UPDATE) & 0xff]
+            v0, v1 = words[i], words[i + 1]
+            s = (DELTA * ROUNDS) & M
+            for _ in range(ROUNDS):
+                v1 = (v1 - ((((v0 << 4) & M) + k2) ^ (v0 + s) ^ ((v0 >> 5) + k3))) & M
+                v0 = (v0 - ((((v1 << 4) & M) + k0) ^ (v1 + s) ^ ((v1 >> 5) + k1))) & M
+                s = (s - DELTA) & M
+            out[i], out[i + 1] = v0 ^ c0, v1 ^ c1
+            c0, c1 = words[i], words[i + 1]
+        plain = bytearray(n * 4)
+        struct.pack_into(f'<{n}I', plain, 0, *out)
+        # drop the checksum, in place
+        del plain[-4:]
+        return plain
+
+
+class NumpyTea(PythonTea):
+    '''
+    Decrypts all blocks at once (CBC decryption only depends on the ciphertext).
+    CBC encryption is inherently sequential, it stays on the pure Python loop.
+    '''
+    name = 'numpy'
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    @staticmethod
+    def prepare(key):
+        schedule = KeySchedule(key)
+        return schedule, np.array(schedule, dtype=np.uint32)
+
+    def schedule(self, key):
+        return self.cipher(key)[0]
+
+    def decrypt(self, data, key=None):
+        n = len(data) // 8
+        c = np.frombuffer(data, dtype='<u4', count=n * 2).reshape(n, 2).astype(np.uint32)
+        k0, k1, k2, k3 = self.cipher(key)[1][(np.arange(n) * 8 // KEY_UPDATE) & 0xff].T
+
+        v0, v1 = c[:, 0].copy(), c[:, 1].copy()
+        s = (DELTA * ROUNDS) & M
+        for _ in range(ROUNDS):
+            su = np.uint32(s)
+            v1 -= ((v0 << 4) + k2) ^ (v0 + su) ^ ((v0 >> 5) + k3)
+            v0 -= ((v1 << 4) + k0) ^ (v1 + su) ^ ((v1 >> 5) + k1)
+            s = (s - DELTA) & M
+        v0[1:] ^= c[:-1, 0]
+        v1[1:] ^= c[:-1, 1]
+        plain = bytearray(n * 8)
+        words = np.frombuffer(plain, dtype='<u4').reshape(n, 2)
+        words[:, 0], words[:, 1] = v0, v1
+        # the view must go before the checksum is dropped in place
+        del words
+        del plain[-4:]
+        return plain
+
+
+class FastTea():
+    # takes the raw key on every call, there is no prepared state to cache
+    name = 'fasttea'
+
+    @staticmethod
+    def available():
+        return fasttea is not None
+
+    def encrypt(self, data, key=None):
+        # fasttea's own padding is broken (reads past the buffer), hand it pre-padded data
+        data = _pad(data)
+        return fasttea.encrypt(data, key) if key else fasttea.encrypt(data)
+
+    def decrypt(self, data, key=None):
+        # it only takes bytes and returns bytes, the copy of the input goes before the output's
+        data = bytes(data)
+        plain = fasttea.decrypt(data, key) if key else fasttea.decrypt(data)
+        del data
+        return bytearray(plain)
+
+
+class NinebotTea():
+    name = 'ninebottea'
+
+    def __init__(self):
+        self.default = NinebotTEA() if NinebotTEA is not None else None
+        self.keys = KeyCache(lambda key: NinebotTEA(key=key))
+
+    @staticmethod
+    def available():
+        return NinebotTEA is not None
+
+    def cipher(self, key):
+        return self.default if not key else self.keys.get(key)
+
+    def encrypt(self, data, key=None):
+        return self.cipher(key).encrypt(bytes(data))
+
+    def decrypt(self, data, key=None):
+        return bytearray(self.cipher(key).decrypt(bytes(data)))
+
+
+# fastest first
+BACKENDS = [FastTea, NumpyTea, NinebotTea, PythonTea]
+
+
+def CrossCheck(backend, reference, sizes=(4, 17, 1020, 2563)):
+    '''
+    True if backend's encryption and decryption are byte identical to the reference
+    (sizes cover all paddings and at least one key update).
+    '''
+    rnd = random.Random(0)
+    custom_key = bytes(rnd.randrange(256) for _ in range(16))
+    for size in sizes:
+        data = bytes(rnd.randrange(256) for _ in range(size))
+        for key in (None, custom_key):
+            try:
+                enc = reference.encrypt(data, key)
+                if backend.encrypt(data, key) != enc or backend.decrypt(enc, key) != reference.decrypt(enc, key):
+                    return False
+            except Exception:
+                return False
+    return True
+
+
+def SelectBackend(name=None):
+    '''
+    The backend with the given name, or else the fastest available one that
+    passes the cross-check against NinebotTEA (or the pure Python implementation).
+    '''
+    backends = [cls() for cls in BACKENDS if cls.available()]
+    if name is not None:
+        return next(b for b in backends if b.name == name)
+
+    reference = backends[-1] if NinebotTEA is None else next(b for b in backends if b.name == 'ninebottea')
+    return next(b for b in backends if b is reference or CrossCheck(b, reference))
+
+
+# used by Zippy, NGFW_TEA_BACKEND forces one (fasttea, numpy, ninebottea, python)
+Tea = SelectBackend(os.environ.get('NGFW_TEA_BACKEND'))
+
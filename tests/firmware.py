@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Synthetic firmware images and a reference pattern search for the tests and benchmarks (bench.py).
+#####
+
+import random
+
+from util import SignatureException
+
+
+def random_image(size, seed=0):
+    # firmware like byte distribution: lots of zeros and thumb opcodes
+    rnd = random.Random(seed)
+    return bytearray(rnd.choice(b'\x00\x00\x00\x20\x46\x68\x70\xb5\xbd\xd0\xe0\xf8')
+                     for _ in range(size))
+
+
+def planted_image(size=256 << 10):
+    # random image with the Mi speed/current parameter sites the parametric patches look for
+    image = random_image(size)
+    image[0x8000:0x8012] = bytes.fromhex('95f8340000214ff49670000000004ff01908')
+    image[0x9000:0x900a] = bytes.fromhex('13d2008500e0008e0000')
+    image[0xa000:0xa00a] = bytes.fromhex('016840f2bd6200000000')
+    image[0xb000:0xb00e] = bytes.fromhex('000041f65800000001d200000000')
+    return image
+
+
+def FindPatternNaive(data, signature, mask=None, start=None, maxit=None):
+    '''
+    Byte by byte reference search, as FindPattern was implemented before.
+    '''
+    sig_len = len(signature)
+    if start is None:
+        start = 0
+    stop = len(data) - len(signature)
+    if maxit is not None:
+        stop = start + maxit
+
+    if mask:
+        signature = [b & m if b is not None else None for b, m in zip(signature, mask)]
+
+    for i in range(start, stop):
+        matches = 0
+
+        while signature[matches] is None or signature[matches] == (data[i + matches] & (mask[matches] if mask else 0xFF)):
+            matches += 1
+            if matches == sig_len:
+                return i
+
+    raise SignatureException('Pattern not found!')
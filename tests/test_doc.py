@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# The Doc output of /cfw lists the patches it skipped, as the patched files do.
+#####
+
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import app as web
+from tests.firmware import planted_image
+
+FORM = {
+    'device': '1s',
+    'patch': 'Doc',
+    'sl_drive': '18',
+    'crc': '500',
+    # no site on the planted image
+    'remove_kers': 'on',
+}
+
+
+def post(form):
+    image = planted_image()
+    image[0x100:0x10f] = b'DRV_STM32F103CE'
+    client = web.app.test_client()
+    return client.post('/cfw', data={**form, 'filename': (io.BytesIO(bytes(image)), 'x.bin')})
+
+
+def test_doc_skipped():
+    response = post({**FORM, 'skip_failures': 'on'})
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Speed-Limit Drive: 18km/h' in page
+    assert 'Skipped remove_kers(): SignatureException Pattern not found!' in page
+
+
+def test_doc_failed():
+    page = post(FORM).get_data(as_text=True)
+    assert 'patcher.remove_kers()' in page
+    assert 'Skipped' not in page
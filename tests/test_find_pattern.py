@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Lookups served without a search (earlier lookups, plans) see matches written since.
+#####
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from journal import PatchBuffer
+from mi_patcher import SIG_MSS, MiPatcher
+from tests.firmware import planted_image
+
+SITE = 0xa000
+
+
+def patcher_and_site():
+    image = PatchBuffer(planted_image())
+    return MiPatcher(image, '1s'), bytes(image[SITE:SITE+len(SIG_MSS)])
+
+
+@pytest.mark.parametrize('prescan', [False, True])
+def test_earlier_lookup(prescan):
+    patcher, site = patcher_and_site()
+    if prescan:
+        patcher.prescan()
+    # one signature of the patch set and one which is always searched directly
+    literal = list(site[1:])
+    assert patcher.find_pattern(SIG_MSS) == SITE
+    assert patcher.find_pattern(literal) == SITE + 1
+
+    # a patch writes an earlier occurrence
+    patcher.data[0x4000:0x4000+len(site)] = site
+    assert patcher.find_pattern(SIG_MSS) == 0x4000
+    assert patcher.find_pattern(literal) == 0x4001
+    # and breaks it again
+    patcher.data[0x4004] ^= 0xff
+    assert patcher.find_pattern(SIG_MSS) == SITE
+    assert patcher.find_pattern(literal) == SITE + 1
+    # single lookups search directly, unless the stock table or offset index knows the image
+    assert (patcher.matches is not None) == prescan
+
+
+def test_insertion():
+    patcher, site = patcher_and_site()
+    assert patcher.find_pattern(SIG_MSS) == SITE
+    patcher.data[0x4000:0x4000] = b'\x00' * 8
+    assert patcher.find_pattern(SIG_MSS) == SITE + 8
+
+
+def test_rollback():
+    patcher, site = patcher_and_site()
+    session = patcher.session()
+    assert session.patcher.find_pattern(SIG_MSS) == SITE
+    savepoint = session.savepoint()
+    session.patcher.data[0x4000:0x4000+len(site)] = site
+    assert session.patcher.find_pattern(SIG_MSS) == 0x4000
+    session.rollback(savepoint)
+    assert session.patcher.find_pattern(SIG_MSS) == SITE
+
+
+def test_planned_lookup():
+    patcher, site = patcher_and_site()
+
+    def probe(value):
+        def run(patcher):
+            patcher.data[0x4000:0x4000+len(value)] = value
+            return [('lookup', patcher.find_pattern(SIG_MSS))]
+        return run
+
+    patcher.plan(probe(bytes(len(site))))
+    # other values write an earlier match, which the planned offset doesn't know of
+    _, res = patcher.apply(probe(site))
+    assert res == [('lookup', 0x4000)]
+    _, res = patcher.apply(probe(b'\xff' * len(site)))
+    assert res == [('lookup', SITE)]
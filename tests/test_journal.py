@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# PatchJournal against a patched bytearray: reads, find, ranges, truncate and apply.
+#####
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from journal import PatchJournal
+
+ALPHABET = b'\x00\x01\x02'
+
+
+def random_bytes(rnd, n):
+    return bytes(rnd.choice(ALPHABET) for _ in range(n))
+
+
+def random_writes(rnd, size, n):
+    # short writes into a small image, so many of them overlap
+    for _ in range(n):
+        ofs = rnd.randrange(size)
+        yield ofs, random_bytes(rnd, rnd.randrange(1, 6))[:size - ofs]
+
+
+def check_reads(rnd, journal, reference):
+    size = len(reference)
+    for _ in range(20):
+        sub = random_bytes(rnd, rnd.randrange(1, 4))
+        start, end = sorted(rnd.randrange(-5, size + 5) for _ in range(2))
+        assert journal.find(sub, start, end) == reference.find(sub, start, end), (sub, start, end)
+        assert journal[start:end] == reference[start:end]
+    for i in (0, size - 1, -1, rnd.randrange(size)):
+        assert journal[i] == reference[i]
+    assert bytes(journal) == reference
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_differential(seed):
+    rnd = random.Random(seed)
+    image = random_bytes(rnd, rnd.randrange(1, 300))
+    journal, reference = PatchJournal(image), bytearray(image)
+    # the reference after each record, for truncate
+    history = [bytes(reference)]
+    writes = list(random_writes(rnd, len(image), rnd.randrange(12)))
+    for ofs, post in writes:
+        journal[ofs:ofs+len(post)] = post
+        reference[ofs:ofs+len(post)] = post
+        history.append(bytes(reference))
+        check_reads(rnd, journal, reference)
+    assert journal.image == image
+
+    since = rnd.randrange(len(writes) + 1)
+    assert journal.ranges(since) == [(ofs, ofs + len(post)) for ofs, post in writes[since:]]
+    assert journal.apply(bytearray(image)) == reference
+    assert journal.apply(bytearray(history[since]), since) == reference
+    if writes:
+        # a buffer without the pre bytes of a record is refused
+        other = bytearray(image)
+        other[writes[0][0]] ^= 0xff
+        with pytest.raises(ValueError):
+            journal.apply(other)
+
+    # roll back to an earlier record, then keep writing on top of it
+    removed = journal.truncate(since)
+    assert removed == [(ofs, ofs + len(post)) for ofs, post in writes[since:]]
+    reference = bytearray(history[since])
+    check_reads(rnd, journal, reference)
+    assert len(journal.records) == since
+    for ofs, post in random_writes(rnd, len(image), 4):
+        journal[ofs:ofs+len(post)] = post
+        reference[ofs:ofs+len(post)] = post
+    check_reads(rnd, journal, reference)
+    assert journal.apply(bytearray(image)) == reference
+
+
+def test_overlapping_records():
+    journal = PatchJournal(bytes(8))
+    journal[2:6] = b'abcd'
+    journal[4:8] = b'WXYZ'
+    journal[3] = ord('-')
+    assert bytes(journal) == b'\x00\x00a-WXYZ'
+    # each record keeps the bytes it overwrote, as seen through the earlier records
+    assert journal.records == [(2, bytes(4), b'abcd'), (4, b'cd\x00\x00', b'WXYZ'), (3, b'b', b'-')]
+    assert journal.ranges(1) == [(4, 8), (3, 4)]
+    assert journal.truncate(1) == [(4, 8), (3, 4)]
+    assert bytes(journal) == b'\x00\x00abcd\x00\x00'
+    assert journal.find(b'd\x00') == 5
+
+
+def test_rejects_resizing():
+    journal = PatchJournal(bytes(8))
+    with pytest.raises(ValueError):
+        journal[0:2] = b'abc'
+    with pytest.raises(ValueError):
+        journal[::2] = b'abcd'
+    with pytest.raises(IndexError):
+        journal[8] = 0
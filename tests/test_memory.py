@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Peak memory of one /cfw request (tracemalloc), relative to the firmware size.
+#####
+
+import io
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import app as web
+from tests.firmware import planted_image
+
+SIZE = 1 << 20
+# what one request may hold at once: the request body, the upload buffer (decrypted, extracted
+# and patched in place), the plan cache's copy of the image, the compressed FIRM.bin and the
+# ciphertext, plus small allocations. Fixed, a change exceeding it is a regression.
+PEAK_BOUND = 5.5
+
+# every patch the planted image supports
+FORM = {
+    'device': '1s',
+    'sl_sport': '27',
+    'sl_drive': '18',
+    'amps_sport': '25000',
+    'amps_ped': '8000',
+    'crc': '500',
+    'motor_start_speed': '4.5',
+}
+
+
+@pytest.fixture(scope='module')
+def image():
+    image = planted_image(SIZE)
+    image[0x100:0x10f] = b'DRV_STM32F103CE'
+    return bytes(image)
+
+
+@pytest.mark.parametrize('skip_failures', [False, True])
+@pytest.mark.parametrize('pod', ['Zip', 'Bin', '.bin.enc'])
+def test_cfw_peak_memory(image, pod, skip_failures):
+    client = web.app.test_client()
+    form = {**FORM, 'patch': pod}
+    if skip_failures:
+        form['skip_failures'] = 'on'
+
+    # warm up the shared scanner and engines, then start with an empty plan cache
+    client.post('/cfw', data={**form, 'filename': (io.BytesIO(image), 'x.bin')}).close()
+    if web.plan_cache is not None:
+        web.plan_cache.entries.clear()
+
+    body = io.BytesIO(image)
+    tracemalloc.start()
+    try:
+        response = client.post('/cfw', data={**form, 'filename': (body, 'x.bin')}, buffered=False)
+        sent = sum(len(chunk) for chunk in response.response)
+        response.close()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 200
+    assert sent >= SIZE
+    assert peak < PEAK_BOUND * SIZE, f'{peak / SIZE:.2f}x'
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Rescans after patches: the PatchBuffer records what was written, only that is searched again.
+#####
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from journal import PatchBuffer
+from mi_patcher import SIG_MSS, MiPatcher
+from tests.firmware import planted_image
+
+
+def test_records():
+    buffer = PatchBuffer(b'abcdefgh')
+    buffer[1:3] = b'xy'
+    buffer[-1] = 0x41
+    buffer[::2] = b'1234'
+    buffer[4:4] = b''
+    with memoryview(buffer) as view:
+        view[0] = 0x30
+    assert buffer.records == [(1, 3), (7, 8), (0, 7)]
+    assert buffer.ranges(2) == [(0, 7)]
+    buffer[2:2] = b'zz'
+    assert buffer.ranges(3) == [(2, 10)]
+
+
+def test_rescan_written():
+    image = PatchBuffer(planted_image())
+    site = bytes(image[0xa000:0xa00a])
+    patcher = MiPatcher(image, '1s')
+    patcher.prescan()
+    assert patcher.data is image
+    assert patcher.find_pattern(SIG_MSS, start=0x1000) == 0xa000
+
+    # a new earlier occurrence, then the original one broken
+    patcher.data[0x4000:0x400a] = site
+    patcher.data[0xa000] ^= 0xff
+    assert patcher.find_pattern(SIG_MSS, start=0x2000) == 0x4000
+    assert patcher.matches[SIG_MSS] == [0x4000]
+    assert patcher._rescanned == len(image.records) == 2
+
+    # forks have their own buffer, the parent's later writes don't show up in them
+    fork = patcher.fork()
+    patcher.data[0x4000] ^= 0xff
+    assert fork.find_pattern(SIG_MSS, start=0x3000) == 0x4000
+    assert patcher.find_pattern_gracef(SIG_MSS, start=0x3000) == -1
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Signature / FindPattern against the byte by byte reference search (FindPatternNaive).
+#####
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from scanner import MultiScanner
+from tests.firmware import FindPatternNaive
+from util import FindAll, FindPattern, Signature, SignatureException
+
+
+def outcome(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except SignatureException:
+        return None
+
+
+def random_case(rnd):
+    # few distinct bytes, so there are plenty of partial and repeated matches
+    data = bytes(rnd.choice(b'\x00\x20\x46\xb5') for _ in range(rnd.randrange(8, 200)))
+    n = rnd.randrange(1, 7)
+    ofs = rnd.randrange(len(data) - n + 1)
+    pattern = [None if rnd.random() < 0.2 else b for b in data[ofs:ofs+n]]
+    if rnd.random() < 0.3:
+        # a missing pattern
+        pattern[rnd.randrange(n)] = 0xff
+    mask = [rnd.choice((0xff, 0xf0, 0x0f, 0xfe)) for _ in range(n)] if rnd.random() < 0.4 else None
+    return data, pattern, mask
+
+
+def random_bounds(rnd, size, n):
+    start = rnd.choice((None, rnd.randrange(size)))
+    if rnd.random() < 0.5:
+        return start, None
+    # the reference reads past the image if the window does
+    first = start or 0
+    return start, rnd.randrange(max(0, size - n + 1 - first) + 1)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_differential(seed):
+    rnd = random.Random(seed)
+    for _ in range(40):
+        data, pattern, mask = random_case(rnd)
+        start, maxit = random_bounds(rnd, len(data), len(pattern))
+        expect = outcome(FindPatternNaive, data, pattern, mask=mask, start=start, maxit=maxit)
+        assert outcome(FindPattern, data, pattern, mask=mask, start=start, maxit=maxit) == expect, \
+            (data.hex(), pattern, mask, start, maxit)
+        # a default window is the same as explicit bounds
+        signature = Signature(pattern, mask, window=(start, maxit))
+        assert outcome(signature.find, data) == expect
+        assert outcome(signature.find, bytearray(data)) == expect
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_find_all(seed):
+    rnd = random.Random(seed)
+    for _ in range(20):
+        data, pattern, mask = random_case(rnd)
+        # non-overlapping: each match is searched again behind the previous one
+        expect, start = [], 0
+        while start < len(data) and (ofs := outcome(FindPatternNaive, data, pattern, mask=mask, start=start)) is not None:
+            expect.append(ofs)
+            start = ofs + len(pattern)
+        assert list(FindAll(data, pattern, mask=mask)) == expect
+
+
+def test_wildcards_and_masks():
+    data = bytes.fromhex('00 4f f4 7a 71 00 28 4f f4 7a 71 00 2c 00')
+    assert FindPattern(data, [0xf4, None, 0x71]) == 2
+    assert FindPattern(data, [0xf4, None, 0x71], start=3) == 8
+    # the low nibble of the last byte is free
+    assert FindPattern(data, [0x71, 0x00, 0x20], mask=[0xff, 0xff, 0xf0]) == 4
+    assert FindPattern(data, [0x71, 0x00, 0x2f], mask=[0xff, 0xff, 0xf0], start=5) == 10
+    assert FindPattern(data, [None, None], start=4) == 4
+    with pytest.raises(SignatureException):
+        FindPattern(data, [0x7a, 0x72])
+
+
+def test_bounds():
+    data = bytes(10) + b'\x12\x34'
+    # without maxit the last possible offset is not searched, as the reference always did
+    assert outcome(FindPattern, data, [0x12, 0x34]) is None
+    assert outcome(FindPatternNaive, data, [0x12, 0x34]) is None
+    assert FindPattern(data, [0x12, 0x34], maxit=11) == 10
+    assert FindPattern(data, [0x12, 0x34], start=10, maxit=1) == 10
+    # maxit counts candidate offsets from start, beyond the image it is clamped
+    assert outcome(FindPattern, data, [0x12, 0x34], start=4, maxit=6) is None
+    assert FindPattern(data, [0x12, 0x34], start=4, maxit=7) == 10
+    assert FindPattern(data, [0x12, 0x34], start=4, maxit=1000) == 10
+    assert outcome(FindPattern, data, [0x12, 0x34], start=11, maxit=10) is None
+    assert outcome(FindPattern, data, [0x00], start=0, maxit=0) is None
+
+
+def test_scanner_cache_bound():
+    first = MultiScanner.get([[0x01, 0x02]])
+    assert MultiScanner.get([[0x01, 0x02]]) is first
+    for i in range(MultiScanner._cache_size):
+        MultiScanner.get([[0x03, i]])
+    assert len(MultiScanner._cache) <= MultiScanner._cache_size
+    assert MultiScanner.get([[0x01, 0x02]]) is not first
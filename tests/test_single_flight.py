@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Concurrent identical /cfw requests of several worker processes build their output once.
+#####
+
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import app as web
+from cache import ResultCache, SingleFlight
+from tests.firmware import planted_image
+
+PROCESSES = 3
+THREADS = 2
+
+FORM = {
+    'device': '1s',
+    'sl_sport': '27',
+    'sl_drive': '18',
+    'crc': '500',
+}
+
+
+def worker(tmp, image, pod, barrier, n):
+    web.result_cache = ResultCache(os.path.join(tmp, 'results'), version='test')
+    web.single_flight = SingleFlight(os.path.join(tmp, 'locks'))
+    patch_planned = web.patch_planned
+
+    def counted(data):
+        with open(os.path.join(tmp, 'builds'), 'a') as fp:
+            fp.write(f'{n}\n')
+        # long enough for every other request to arrive meanwhile
+        time.sleep(0.5)
+        return patch_planned(data)
+    web.patch_planned = counted
+
+    digests, errors = [], []
+
+    def request():
+        try:
+            client = web.app.test_client()
+            barrier.wait()
+            response = client.post('/cfw', data={**FORM, 'patch': pod, 'filename': (io.BytesIO(image), 'x.bin')},
+                                   buffered=False)
+            digests.append(hashlib.sha256(b''.join(response.response)).hexdigest())
+            response.close()
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    with open(os.path.join(tmp, f'out{n}'), 'w') as fp:
+        fp.write('\n'.join(digests))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+@pytest.mark.parametrize('pod', ['Zip', 'Bin'])
+def test_single_build(tmp_path, pod):
+    image = bytes(planted_image())
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(PROCESSES * THREADS)
+    procs = [ctx.Process(target=worker, args=(str(tmp_path), image, pod, barrier, n)) for n in range(PROCESSES)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+    assert [p.exitcode for p in procs] == [0] * PROCESSES
+
+    assert len((tmp_path / 'builds').read_text().split()) == 1
+    digests = [x for n in range(PROCESSES) for x in (tmp_path / f'out{n}').read_text().split()]
+    assert len(digests) == PROCESSES * THREADS
+    assert len(set(digests)) == 1
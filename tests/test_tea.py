@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Every available TEA backend against the reference (NinebotTEA, or else the pure Python one).
+#####
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import tea
+from tea import BACKENDS, CrossCheck, EncryptedSize
+
+# all paddings, key updates (every 1 KB) and the empty image
+SIZES = (0, 1, 4, 8, 17, 1016, 1020, 1024, 4096, 10001)
+AVAILABLE = [cls for cls in BACKENDS if cls.available()]
+
+
+@pytest.fixture(scope='module')
+def reference():
+    backends = {cls.name: cls() for cls in AVAILABLE}
+    return backends.get('ninebottea', backends['python'])
+
+
+@pytest.mark.parametrize('backend', AVAILABLE, ids=lambda cls: cls.name)
+def test_cross_check(backend, reference):
+    assert CrossCheck(backend(), reference, SIZES)
+
+
+@pytest.mark.parametrize('backend', AVAILABLE, ids=lambda cls: cls.name)
+def test_round_trip(backend):
+    backend = backend()
+    data = bytes(range(256)) * 40
+    key = bytes(range(16))
+    for size in SIZES:
+        enc = backend.encrypt(data[:size], key)
+        assert len(enc) == EncryptedSize(size)
+        plain = backend.decrypt(enc, key)
+        # a buffer the patcher can take over
+        assert isinstance(plain, bytearray)
+        assert plain[:size] == data[:size]
+
+
+def test_selected():
+    assert tea.Tea.name in [cls.name for cls in AVAILABLE]
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# ThumbEncode against Keystone, over a sample of the immediate and register space.
+#####
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from thumb_encode import ThumbEncode
+
+keystone = pytest.importorskip('keystone')
+
+REGS = ['r0', 'r1', 'r2', 'r7', 'r8', 'r10', 'r12', 'lr']
+# every modified immediate (rotated 8 bit and the replicated byte patterns) plus a few that are none
+MODIFIED = sorted({(b | 0x80) << (24 - r) & 0xffffffff for b in range(0x80) for r in range(24)}
+                  | {b * f for b in range(0x100) for f in (1, 0x00010001, 0x01000100, 0x01010101)})
+SAMPLES = 200
+
+
+@pytest.fixture(scope='module')
+def check():
+    ks = keystone.Ks(keystone.KS_ARCH_ARM, keystone.KS_MODE_THUMB)
+
+    def keystone_asm(text, addr):
+        try:
+            encoding, _ = ks.asm(text, addr)
+            return bytes(encoding) if encoding else None
+        except keystone.KsError:
+            return None
+
+    def check(text, addr=0):
+        # ThumbEncode may leave an instruction to Keystone (None), but never encode it differently
+        native = ThumbEncode(text, addr)
+        if native is None:
+            return 0
+        expect = keystone_asm(text, addr)
+        assert native == expect, f'{text} @ {hex(addr)}: {native.hex()} != {expect.hex() if expect else None}'
+        return 1
+    return check
+
+
+def sample(seq, n=SAMPLES, seed=0):
+    seq = list(seq)
+    return random.Random(seed).sample(seq, min(n, len(seq)))
+
+
+def test_nop(check):
+    assert check('NOP') + check('nop.w') == 2
+
+
+@pytest.mark.parametrize('r', REGS)
+def test_registers_imm8(check, r):
+    n = 0
+    for imm in range(0x100):
+        n += check(f'MOVS {r}, #{imm}') + check(f'CMP {r}, #{hex(imm)}')
+    for rm in REGS:
+        n += check(f'CMP {r}, {rm}')
+    # the narrow immediate forms only take r0-r7
+    assert n or r not in ('r0', 'r1', 'r2', 'r7')
+
+
+@pytest.mark.parametrize('r', REGS)
+def test_wide_immediates(check, r):
+    n = 0
+    for imm in sample(range(0x10000)) + [0, 0xff, 0x100, 0xffff]:
+        n += check(f'MOVW {r},#{imm}')
+    for imm in sample(MODIFIED) + [0x101, 0x1fe01, 0x15f, 0x12345678]:
+        n += check(f'MOV.W {r}, #{imm}') + check(f'CMP.W {r}, #{hex(imm)}')
+    assert n
+
+
+@pytest.mark.parametrize('r', REGS)
+def test_stores(check, r):
+    n = 0
+    for base in REGS:
+        for imm in sample(range(0x1000), 20) + [0, 0xfff]:
+            n += check(f'STRH.W {r}, [{base}, #{hex(imm)}]') + check(f'strb.w {r},[{base},#{imm}]')
+        n += check(f'strh.w {r},[{base}]')
+    assert n
+
+
+@pytest.mark.parametrize('addr', [0, 0x100, 0x1000])
+def test_branches(check, addr):
+    n = 0
+    for target in sample(range(addr - 0x1000, addr + 0x1000, 2)) + [addr, addr + 2, addr - 0x1000]:
+        n += check(f'b #{hex(target)}', addr) + check(f'beq {target}', addr) + check(f'bne #{target}', addr)
+    assert n
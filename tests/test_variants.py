@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Signature variants: the original fallback order decides when several variants match.
+#####
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from mi_patcher import SIG_SL_DRIVE_242, SIG_SPEED_PARAMS_016, SIG_SPEED_PARAMS_242, MiPatcher
+from tests.firmware import random_image
+
+
+def test_fallback_order():
+    # a 242 image by its speed parameter block, which also holds the 016 sl_drive site
+    image = random_image(0x10000)
+    for ofs, signature in ((0x1000, SIG_SPEED_PARAMS_242), (0x2000, SIG_SPEED_PARAMS_016),
+                           (0x3000, SIG_SL_DRIVE_242)):
+        image[ofs:ofs+len(signature)] = bytes(signature)
+    patcher = MiPatcher(image, '1s')
+    assert patcher.family() == '242'
+
+    # as the try/except chain it replaced: default, 016, 242, 022
+    res = patcher.speed_limit_drive(20)
+    assert res[0][1] == hex(0x2000 + 8)
+    assert patcher.variants['sl_drive'] == '016'
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Archives of zip_stream read the way streaming readers (e.g. ZipInputStream) do:
+# local header after local header, without the central directory.
+#####
+
+import io
+import os
+import struct
+import sys
+import zipfile
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import zippy
+from zippy import Zippy
+
+DATA_DESCRIPTOR = 0x08
+
+
+def read_sequential(archive):
+    '''
+    Name and data of each member, checked against the CRC and sizes of its local header.
+    '''
+    members, pos = {}, 0
+    while archive[pos:pos+4] == zipfile.stringFileHeader:
+        header = struct.unpack_from(zipfile.structFileHeader, archive, pos)
+        flag_bits, compress_type = header[3], header[4]
+        crc, compress_size, file_size = header[7:10]
+        pos += zipfile.sizeFileHeader
+        name = archive[pos:pos+header[10]].decode()
+        pos += header[10] + header[11]
+        assert not flag_bits & DATA_DESCRIPTOR, name
+        data = archive[pos:pos+compress_size]
+        pos += compress_size
+        if compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        else:
+            assert compress_type == zipfile.ZIP_STORED, name
+        assert len(data) == file_size, name
+        assert zlib.crc32(data) == crc, name
+        members[name] = data
+    assert archive[pos:pos+4] == zipfile.stringCentralDir
+    return members
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+@pytest.mark.parametrize('members', [zippy.ZIP_MEMBERS, ('FIRM.bin.enc',), ('FIRM.bin',)])
+def test_sequential(monkeypatch, workers, members):
+    monkeypatch.setattr(zippy, 'ZIP_WORKERS', workers)
+    data = bytearray(os.urandom(0x8000))
+    z = Zippy(data, params='sl_drive=18', model='1s')
+    stream = z.zip_stream(b'test', members=members)
+    archive = b''.join(stream)
+    assert len(archive) == len(stream)
+
+    read = read_sequential(archive)
+    expected = [x for x in zippy.ZIP_MEMBERS if x in members] + ['info.json', 'params.txt']
+    assert list(read) == expected
+    if 'FIRM.bin' in read:
+        assert read['FIRM.bin'] == data
+    if 'FIRM.bin.enc' in read:
+        assert read['FIRM.bin.enc'] == z.encrypt()
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert {x: zf.read(x) for x in zf.namelist()} == read
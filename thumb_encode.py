@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+#
+# NGFW Patcher
+# Copyright (C) 2021-2024 Daljeet Nandha
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#####
+# Native encoder for the handful of Thumb-2 instructions the patches emit.
+# Anything not covered returns None and is left to Keystone.
+# tests/test_thumb_encode.py checks the encodings against Keystone.
+#####
+
+import re
+import struct
+
+# https://web.eecs.umich.edu/~prabal/teaching/eecs373-f10/readings/ARMv7-M_ARM.pdf
+CONDITIONS = {
+    'eq': 0, 'ne': 1, 'cs': 2, 'hs': 2, 'cc': 3, 'lo': 3, 'mi': 4, 'pl': 5, 'vs': 6,
+    'vc': 7, 'hi': 8, 'ls': 9, 'ge': 10, 'lt': 11, 'gt': 12, 'le': 13,
+}
+REGISTERS = {**{f'r{i}': i for i in range(16)}, 'sp': 13, 'lr': 14, 'pc': 15}
+
+RE_INSTR = re.compile(r'^\s*([a-z]+(?:\.w)?)\s*(.*?)\s*$')
+RE_MEM = re.compile(r'^\[\s*(\w+)\s*(?:,\s*(#[-+]?\w+)\s*)?\]$')
+
+
+def ModifiedImm(value):
+    '''
+    Inverse of ThumbExpandImm: 12 bit i:imm3:imm8 for a 32 bit constant, None if not encodable.
+    '''
+    if not 0 <= value <= 0xffffffff:
+        return None
+    b = value & 0xff
+    if value == b:
+        return value
+    if value == b * 0x00010001:
+        return 0x100 | b
+    if value == b * 0x01000100:
+        return 0x200 | b
+    if value == b * 0x01010101:
+        return 0x300 | b
+    for rot in range(8, 32):
+        unrot = ((value << rot) | (value >> (32 - rot))) & 0xffffffff
+        if 0x80 <= unrot <= 0xff:
+            return (rot << 7) | (unrot & 0x7f)
+    return None
+
+
+def _imm(x, bare=False):
+    # Keystone wants '#' for immediates, branch targets may also be plain positive numbers
+    if not x.startswith('#') and not (bare and x[:1].isdigit()):
+        return None
+    try:
+        return int(x.lstrip('#'), 0)
+    except ValueError:
+        return None
+
+
+def _hw(*halfwords):
+    return struct.pack('<' + 'H' * len(halfwords), *halfwords)
+
+
+def _t32_imm(hw1, hw2, imm12):
+    # splits i:imm3:imm8 into both halfwords
+    return _hw(hw1 | ((imm12 >> 11) & 1) << 10, hw2 | ((imm12 >> 8) & 7) << 12 | (imm12 & 0xff))
+
+
+def ThumbEncode(text, addr=0):
+    '''
+    Encode a single instruction, same output as Keystone (thumb mode), or None if unsupported.
+    Supported: NOP(.W), MOVS/CMP imm and CMP reg (narrow), MOVW, MOV.W/CMP.W with modified immediate,
+    B/B<cond> (narrow only), STRH.W/STRB.W with an immediate offset.
+    '''
+    m = RE_INSTR.match(text.lower())
+    if m is None or '\n' in text or ';' in text:
+        return None
+    mnemonic, operands = m.groups()
+    ops = [x.strip() for x in re.split(r',(?![^\[]*\])', operands)] if operands else []
+
+    if mnemonic == 'nop' and not ops:
+        return _hw(0xbf00)
+    if mnemonic == 'nop.w' and not ops:
+        return _hw(0xf3af, 0x8000)
+
+    if mnemonic in ('b', *('b' + c for c in CONDITIONS)) and len(ops) == 1:
+        target = _imm(ops[0], bare=True)
+        if target is None or target % 2:
+            return None
+        # Keystone only picks the narrow form for targets within [-2048, 2048) / [-256, 256)
+        # bytes of the instruction; wide branches are left to it
+        delta = target - addr
+        ofs = delta - 4
+        if mnemonic == 'b':
+            if -2044 <= delta < 2048:
+                return _hw(0xe000 | (ofs >> 1) & 0x7ff)
+        elif -252 <= delta < 256:
+            return _hw(0xd000 | CONDITIONS[mnemonic[1:]] << 8 | (ofs >> 1) & 0xff)
+        return None
+
+    if len(ops) != 2:
+        return None
+    reg = REGISTERS.get(ops[0])
+    if reg is None:
+        return None
+
+    if mnemonic in ('strh.w', 'strb.w'):
+        mem = RE_MEM.match(ops[1])
+        if mem is None or reg in (13, 15):
+            return None
+        base = REGISTERS.get(mem.group(1))
+        imm = _imm(mem.group(2)) if mem.group(2) else 0
+        if base is None or base == 15 or imm is None or not 0 <= imm <= 0xfff:
+            return None
+        hw1 = 0xf8a0 if mnemonic == 'strh.w' else 0xf880
+        return _hw(hw1 | base, reg << 12 | imm)
+
+    if mnemonic == 'cmp' and ops[1] in REGISTERS:
+        rm = REGISTERS[ops[1]]
+        if reg < 8 and rm < 8:
+            return _hw(0x4280 | rm << 3 | reg)
+        return None
+
+    imm = _imm(ops[1])
+    if imm is None or imm < 0:
+        return None
+
+    if mnemonic == 'movs':
+        if reg < 8 and imm <= 0xff:
+            return _hw(0x2000 | reg << 8 | imm)
+    elif mnemonic == 'cmp':
+        if reg < 8 and imm <= 0xff:
+            return _hw(0x2800 | reg << 8 | imm)
+    elif mnemonic == 'movw':
+        if reg not in (13, 15) and imm <= 0xffff:
+            return _hw(0xf240 | ((imm >> 11) & 1) << 10 | imm >> 12, ((imm >> 8) & 7) << 12 | reg << 8 | imm & 0xff)
+    elif mnemonic == 'mov.w':
+        imm12 = ModifiedImm(imm)
+        if imm12 is not None and reg not in (13, 15):
+            return _t32_imm(0xf04f, reg << 8, imm12)
+    elif mnemonic == 'cmp.w':
+        imm12 = ModifiedImm(imm)
+        if imm12 is not None and reg != 15:
+            return _t32_imm(0xf1b0 | reg, 0x0f00, imm12)
+    return None
+
@@ -36,28 +36,140 @@ def PatchImm(data, ofs, size, imm, signature):
     return (orig, packed)
 
 
-def FindPattern(data, signature, mask=None, start=None, maxit=None):
-    sig_len = len(signature)
-    if start is None:
-        start = 0
-    stop = len(data) - len(signature)
-    if maxit is not None:
-        stop = start + maxit
-
-    if mask:
-        assert sig_len == len(mask), 'mask must be as long as the signature!'
-        for i in range(sig_len):
-            signature[i] &= mask[i]
+def LongestAnchor(signature, mask=None):
+    '''
+    Offset and bytes of the longest run of fully significant signature bytes
+    (no None wildcard, no mask bits cleared).
+    '''
+    best_ofs, best_len = 0, 0
+    run_ofs, run_len = 0, 0
+    for i, b in enumerate(signature):
+        if b is None or (mask and mask[i] != 0xff):
+            run_len = 0
+            continue
+        if run_len == 0:
+            run_ofs = i
+        run_len += 1
+        if run_len > best_len:
+            best_ofs, best_len = run_ofs, run_len
+    return best_ofs, bytes(signature[best_ofs:best_ofs+best_len])
+
+
+class Signature():
+    '''
+    Immutable search pattern, compiled once: bytes with None as wildcard,
+    an optional bit mask per byte and an optional default search window
+    (start, maxit). Precomputes the literal anchor and the remaining checks.
+    '''
+    __slots__ = ('pattern', 'mask', 'window', 'wildcards', 'anchor_ofs', 'anchor', 'checks', '_hash')
+
+    def __init__(self, pattern, mask=None, window=None):
+        pattern = tuple(pattern)
+        mask = tuple(mask) if mask else None
+        if mask:
+            assert len(pattern) == len(mask), 'mask must be as long as the signature!'
+
+        anchor_ofs, anchor = LongestAnchor(pattern, mask)
+        checks = tuple((j, b & mask[j] if mask else b, mask[j] if mask else 0xFF)
+                       for j, b in enumerate(pattern)
+                       if b is not None and not anchor_ofs <= j < anchor_ofs + len(anchor))
+        if not anchor:
+            anchor_ofs = 0
+
+        set_ = super().__setattr__
+        set_('pattern', pattern)
+        set_('mask', mask)
+        set_('window', window)
+        set_('wildcards', tuple(i for i, b in enumerate(pattern) if b is None))
+        set_('anchor_ofs', anchor_ofs)
+        set_('anchor', anchor)
+        set_('checks', checks)
+        set_('_hash', hash((pattern, mask)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Signature is immutable')
+
+    def __len__(self):
+        return len(self.pattern)
+
+    def __getitem__(self, i):
+        return self.pattern[i]
+
+    def __iter__(self):
+        return iter(self.pattern)
+
+    def __eq__(self, other):
+        if not isinstance(other, Signature):
+            return NotImplemented
+        return self.pattern == other.pattern and self.mask == other.mask
+
+    def __hash__(self):
+        return self._hash
+
+    def __bytes__(self):
+        assert not self.wildcards and not self.mask, 'signature is not a literal!'
+        return bytes(self.pattern)
+
+    def __repr__(self):
+        return 'Signature(%r)' % ' '.join('??' if b is None else '%02x' % b for b in self.pattern)
+
+    def bounds(self, size, start=None, maxit=None):
+        '''
+        Range [start, stop) of candidate offsets in an image of the given size,
+        explicit arguments take precedence over the default window.
+        '''
+        if self.window is not None:
+            start = self.window[0] if start is None else start
+            maxit = self.window[1] if maxit is None else maxit
+        if start is None:
+            start = 0
+        stop = size - len(self.pattern)
+        if maxit is not None:
+            stop = min(start + maxit, size - len(self.pattern) + 1)
+        return max(start, 0), stop
+
+    def matches(self, data, pos):
+        anchor_ofs = pos + self.anchor_ofs
+        if data[anchor_ofs:anchor_ofs+len(self.anchor)] != self.anchor:
+            return False
+        for j, b, m in self.checks:
+            if data[pos + j] & m != b:
+                return False
+        return True
+
+    def finditer(self, data, start=None, maxit=None):
+        '''
+        Lazily yield all non-overlapping matches in a single forward scan.
+        '''
+        i, stop = self.bounds(len(data), start, maxit)
+        anchor, anchor_ofs, checks = self.anchor, self.anchor_ofs, self.checks
+        end = stop + anchor_ofs + len(anchor) - 1
+
+        # candidates come from a C-speed search for the literal anchor,
+        # only the remaining bytes are compared here
+        while i < stop:
+            pos = data.find(anchor, i + anchor_ofs, end)
+            if pos < 0:
+                break
+            i = pos - anchor_ofs
+            for j, b, m in checks:
+                if data[i + j] & m != b:
+                    i += 1
+                    break
+            else:
+                yield i
+                i += len(self.pattern)
 
-    for i in range(start, stop):
-        matches = 0
+    def find(self, data, start=None, maxit=None):
+        for i in self.finditer(data, start, maxit):
+            return i
+        raise SignatureException('Pattern not found!')
 
-        while signature[matches] is None or signature[matches] == (data[i + matches] & (mask[matches] if mask else 0xFF)):
-            matches += 1
-            if matches == sig_len:
-                return i
 
-    raise SignatureException('Pattern not found!')
+def FindPattern(data, signature, mask=None, start=None, maxit=None):
+    if mask or not isinstance(signature, Signature):
+        signature = Signature(signature, mask)
+    return signature.find(data, start=start, maxit=maxit)
 
 
 def FindPatternGracef(*args, **kwargs):
@@ -67,6 +179,38 @@ def FindPatternGracef(*args, **kwargs):
         return -1
 
 
+def FindAll(data, signature, mask=None, start=None, maxit=None):
+    '''
+    Generator over all non-overlapping matches, same bounds as FindPattern.
+    '''
+    if mask or not isinstance(signature, Signature):
+        signature = Signature(signature, mask)
+    return signature.finditer(data, start=start, maxit=maxit)
+
+
+def FindLast(*args, **kwargs):
+    last = None
+    for last in FindAll(*args, **kwargs):
+        pass
+    if last is None:
+        raise SignatureException('Pattern not found!')
+    return last
+
+
+def CountPattern(*args, **kwargs):
+    return sum(1 for _ in FindAll(*args, **kwargs))
+
+
+def FindExactly(data, signature, n, **kwargs):
+    '''
+    All matches as a list, raises if there are not exactly n of them.
+    '''
+    found = list(FindAll(data, signature, **kwargs))
+    if len(found) != n:
+        raise SignatureException(f'Pattern found {len(found)} times, expected {n}!')
+    return found
+
+
 def NearestConst(x):
     n_dist, n_sign = 0xffff, 1
     for s in range(32-8):
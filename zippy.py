@@ -25,16 +25,76 @@ import sys
 import json
 from urllib import request
 import os
+import struct
+import time
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from ninebottea import NinebotTEA
-
-
-default_tea = NinebotTEA()
+from journal import PatchBuffer
+from tea import EncryptedSize, Tea
 
 
 ROOTPATH = os.path.dirname(os.path.dirname(
     os.path.dirname(os.path.realpath(__file__))))
 
+# firmware files of an archive and how each member is compressed: (compression, level),
+# a level of None means DEFLATE_LEVEL; TEA ciphertext doesn't compress, it is stored.
+# Stored members are produced only when the stream gets to them: info.json holds the
+# hashes, its size is known before them
+ZIP_MEMBERS = ('FIRM.bin', 'FIRM.bin.enc')
+ZIP_POLICY = {
+    'FIRM.bin': (zipfile.ZIP_DEFLATED, None),
+    'FIRM.bin.enc': (zipfile.ZIP_STORED, None),
+    'info.json': (zipfile.ZIP_STORED, None),
+    'params.txt': (zipfile.ZIP_DEFLATED, None),
+}
+DEFLATE_LEVEL = int(os.environ.get('NGFW_ZIP_LEVEL', zlib.Z_DEFAULT_COMPRESSION))
+# threads per archive overlapping hashing and compression with the encryption in zip_stream, 0 runs it all inline
+ZIP_WORKERS = int(os.environ.get('NGFW_ZIP_WORKERS', 2))
+
+
+class _Deferred():
+    '''
+    Result of func(*args), computed once by the first thread asking for it.
+    '''
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.lock = threading.Lock()
+        self.done = False
+        self.value = None
+
+    def result(self):
+        with self.lock:
+            if not self.done:
+                self.value = self.func(*self.args)
+                self.done = True
+        return self.value
+
+
+class _Inline():
+    # the executor of ZIP_WORKERS = 0, tasks run when their result is needed
+    def submit(self, func, *args):
+        return _Deferred(func, *args)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _executor():
+    '''
+    Threads of one zip_stream call: concurrent requests each overlap their own work
+    instead of queueing behind a shared pool (hashlib and zlib release the GIL).
+    '''
+    if ZIP_WORKERS <= 0:
+        return _Inline()
+    return ThreadPoolExecutor(ZIP_WORKERS, thread_name_prefix='zippy')
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
 FILENAME = "FIRM"
 EXT_IN = ".bin"
 EXT_OUT = ".zip"
@@ -42,7 +102,8 @@ EXT_OUT = ".zip"
 
 class Zippy():
     def __init__(self, data, params=None, model=None, name="ngfw"):
-        self.data = bytearray(data)
+        # takes ownership of a bytearray, anything else is copied once into the PatchBuffer patched later
+        self.data = data if isinstance(data, bytearray) else PatchBuffer(data)
         self.name = name
 
         self.params = params
@@ -62,6 +123,9 @@ class Zippy():
     def try_extract(self, decrypt=True):
         """Extract the first file from a ZIP archive and return its content as bytes."""
 
+        # plain images never start with a zip header, skip copying them into a file object
+        if self.data[:2] != b'PK':
+            return
         file_ = BytesIO(self.data)
         if not zipfile.is_zipfile(file_):
             return
@@ -74,21 +138,34 @@ class Zippy():
             # Extract the first file (assuming non-directory)
             esc_file = next((name for name in file_list if name.startswith('EC_ESC_Driver') or name.endswith(".enc")), file_list[0])
             with zip_ref.open(esc_file) as first_file:
-                self.data = first_file.read()
+                # read in chunks straight into the buffer we keep
+                self.data = PatchBuffer(zip_ref.getinfo(esc_file).file_size)
+                view, pos = memoryview(self.data), 0
+                while pos < len(view):
+                    n = first_file.readinto(view[pos:pos+0x10000])
+                    if not n:
+                        raise ValueError("Truncated ZIP member.")
+                    pos += n
+                view.release()
                 if not self.decode_model() and decrypt:
                     try:
-                        self.data = self.decrypt()
+                        self.decrypt()
                         id_ = self.decode_model()
                     except:
                         raise Exception("Decode error")
 
     def encrypt(self, key=None):
-        tea = default_tea if key is None else NinebotTEA(key=key)
-        return tea.encrypt(bytes(self.data))
+        return Tea.encrypt(self.data, key)
 
     def decrypt(self, key=None):
-        tea = default_tea if key is None else NinebotTEA(key=key)
-        return tea.decrypt(bytes(self.data))
+        '''
+        Decrypt self.data in place: the buffer (e.g. the upload's) is kept, it is returned.
+        '''
+        plain = Tea.decrypt(self.data, key)
+        with memoryview(self.data) as view:
+            view[:len(plain)] = plain
+        del self.data[len(plain):]
+        return self.data
 
     @staticmethod
     def get_v3(name, model, md5, md5e, enforce):
@@ -127,42 +204,184 @@ class Zippy():
                 "enforceModel": enforce,
                 "type": fw_type,
                 "compatible": compatible_list,
-                "encryption": "both",
+                "encryption": "both" if md5 and md5e else "plain" if md5 else "encrypted",
                 "md5": {
-                    "bin": md5,
-                    "enc": md5e
+                    **({"bin": md5} if md5 else {}),
+                    **({"enc": md5e} if md5e else {}),
                 }
             }
         }
         return json.dumps(data)
 
-    def zip_it(self, comment, enforce=True, key=None):
-        md5 = hashlib.md5()
-        md5.update(self.data)
+    def zip_stream(self, comment, enforce=True, key=None, members=ZIP_MEMBERS, level=None):
+        '''
+        The firmware archive as a ZipStream: deflated members are prepared up front
+        (their size goes into the total), stored ones are only produced while iterating.
+        members selects the firmware files (FIRM.bin, FIRM.bin.enc) to include,
+        level overrides DEFLATE_LEVEL; per member compression follows ZIP_POLICY.
+        The image is encrypted and hashed on this call's worker threads while FIRM.bin
+        is compressed here and sent; self.data must not change until the stream is consumed.
+        '''
+        stream = ZipStream(comment)
 
-        zip_buffer = BytesIO()
-        zip_file = zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False)
+        def member(name, data):
+            compress_type, member_level = ZIP_POLICY[name]
+            if member_level is None:
+                member_level = DEFLATE_LEVEL if level is None else level
+            return ZipStream.member(name, data, compress_type, member_level)
 
-        zip_file.writestr('FIRM.bin', self.data)
+        def lazy_member(name, size, produce):
+            if ZIP_POLICY[name][0] != zipfile.ZIP_STORED:
+                return member(name, produce())
+            return ZipStream.lazy_member(name, size, produce)
 
-        enc_data = self.encrypt(key)
-        zip_file.writestr('FIRM.bin.enc', enc_data)
-        md5e = hashlib.md5()
-        md5e.update(enc_data)
+        md5 = enc = None
+        pool = _executor()
+        try:
+            if 'FIRM.bin.enc' in members:
+                enc = pool.submit(self.encrypt, key)
+            if 'FIRM.bin' in members:
+                md5 = pool.submit(_md5, self.data)
+                stream.members.append(member('FIRM.bin', self.data))
+        finally:
+            # queued tasks still run, the stream waits for them when it gets there
+            pool.shutdown(wait=False)
+
+        md5e = None
+        if enc is not None:
+            stream.members.append(lazy_member('FIRM.bin.enc', EncryptedSize(len(self.data)), enc.result))
+            md5e = _Deferred(lambda: _md5(enc.result()))
 
-        info_json = Zippy.get_v3(self.name, self.model, md5.hexdigest(), md5e.hexdigest(), enforce)
-        zip_file.writestr('info.json', info_json.encode())
+        def info_json(placeholder=False):
+            hashes = [x and ('0' * 32 if placeholder else x.result()) for x in (md5, md5e)]
+            return Zippy.get_v3(self.name, self.model, *hashes, enforce).encode()
+
+        stream.members.append(lazy_member('info.json', len(info_json(placeholder=True)), info_json))
 
         if self.params is not None:
-            zip_file.writestr('params.txt', self.params.encode())
+            stream.members.append(member('params.txt', self.params.encode()))
+
+        return stream
+
+    def zip_it(self, comment, enforce=True, key=None, members=ZIP_MEMBERS, level=None):
+        return b''.join(self.zip_stream(comment, enforce, key, members, level))
+
+
+class ZipStream():
+    '''
+    ZIP archive of in-memory members which is generated while iterating over it,
+    with its total size (len()) known before the first chunk, e.g. for Content-Length.
+    '''
+    CHUNK_SIZE = 0x10000
+
+    def __init__(self, comment=b''):
+        self.comment = comment
+        self.members = []
+
+    def add(self, name, data, compress_type=zipfile.ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.members.append(self.member(name, data, compress_type, level))
+
+    @staticmethod
+    def _zinfo(name, compress_type):
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    @staticmethod
+    def member(name, data, compress_type=zipfile.ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION):
+        '''
+        Header info and (compressed) parts of a member, independent of the archive.
+        '''
+        zinfo = ZipStream._zinfo(name, compress_type)
+        zinfo.file_size = len(data)
+        zinfo.CRC = zlib.crc32(data)
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            # kept as parts, joining them would copy the compressed data once more
+            parts = (compressor.compress(data), compressor.flush())
+        elif compress_type == zipfile.ZIP_STORED:
+            parts = (data,)
+        else:
+            raise ValueError(f'Unsupported compression: {compress_type}')
+        zinfo.compress_size = sum(len(x) for x in parts)
+        return zinfo, parts
+
+    @staticmethod
+    def lazy_member(name, size, produce):
+        '''
+        Header info and parts of a stored member of known size whose data is only
+        produced (produce()) when the archive gets to it, before its local header: streaming
+        readers only accept a data descriptor after deflated data, so the CRC goes in the header.
+        '''
+        zinfo = ZipStream._zinfo(name, zipfile.ZIP_STORED)
+        zinfo.file_size = zinfo.compress_size = size
+        zinfo.CRC = 0
+        return zinfo, _LazyParts(zinfo, produce)
+
+    def _central_dir(self, offsets):
+        records = []
+        for (zinfo, _), offset in zip(self.members, offsets):
+            filename, flag_bits = zinfo._encodeFilenameFlags()
+            dt = zinfo.date_time
+            dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+            dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+            records.append(struct.pack(
+                zipfile.structCentralDir, zipfile.stringCentralDir,
+                zinfo.create_version, zinfo.create_system, zinfo.extract_version, zinfo.reserved,
+                flag_bits, zinfo.compress_type, dostime, dosdate, zinfo.CRC,
+                zinfo.compress_size, zinfo.file_size, len(filename), 0, 0, 0,
+                zinfo.internal_attr, zinfo.external_attr, offset) + filename)
+        central_dir = b''.join(records)
+        end = struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0,
+                          len(records), len(records), len(central_dir), offsets[-1], len(self.comment))
+        return central_dir + end + self.comment
+
+    def _layout(self):
+        # the length of a local header doesn't depend on the CRC of lazy members
+        offsets = [0]
+        for zinfo, _ in self.members:
+            offsets.append(offsets[-1] + len(zinfo.FileHeader(False)) + zinfo.compress_size)
+        return offsets
+
+    def __len__(self):
+        offsets = self._layout()
+        return offsets[-1] + len(self._central_dir(offsets))
+
+    def __iter__(self):
+        offsets = self._layout()
+        for zinfo, parts in self.members:
+            if isinstance(parts, _LazyParts):
+                parts.produce()
+            yield zinfo.FileHeader(False)
+            for part in parts:
+                view = memoryview(part)
+                for i in range(0, len(view), self.CHUNK_SIZE):
+                    yield view[i:i+self.CHUNK_SIZE]
+        yield self._central_dir(offsets)
+
+
+class _LazyParts():
+    '''
+    Parts of a lazy member: its data, produced once (produce()) and checked against
+    the announced size, which also sets the CRC of its header.
+    '''
+    def __init__(self, zinfo, produce):
+        self.zinfo = zinfo
+        self.data = _Deferred(self._produce, produce)
+
+    def _produce(self, produce):
+        data = produce()
+        if len(data) != self.zinfo.file_size:
+            raise ValueError(f'{self.zinfo.filename}: {len(data)} bytes, expected {self.zinfo.file_size}')
+        self.zinfo.CRC = zlib.crc32(data)
+        return data
 
-        zip_file.comment = comment
-        zip_file.close()
-        zip_buffer.seek(0)
-        content = zip_buffer.getvalue()
-        zip_buffer.close()
+    def produce(self):
+        return self.data.result()
 
-        return content
+    def __iter__(self):
+        yield self.produce()
 
 
 if __name__ == "__main__":